@@ -0,0 +1,132 @@
+""" Microbenchmark of CollisionHelper: cost of one physics step worth of
+same-kind contacts, without pymunk (contacts are fed to the callback).
+
+    python bench_collision.py [--contacts 200] [--steps 2000]
+
+Two layouts: disjoint pairs (one merge per contact) and a chain of fruits
+(all contacts in a single group). The former resolution, a set + adjacency
+dict + DFS with one lambda per action, is timed for reference.
+"""
+import argparse
+import time
+
+import pymunk as pm
+
+from constants import *
+from collision import CollisionHelper
+import utils
+
+
+class _Fruit(object):
+    """ Stand-in for Fruit: what the collision handlers use """
+    def __init__(self, id, kind, position):
+        self.id = id
+        self.kind = kind
+        self.position = pm.Vec2d(*position)
+
+    def normal(self): pass
+    def blink(self, activate, delay=0): pass
+    def explose(self): pass
+    def merge_to(self, dest): pass
+
+
+class _Shape(object):
+    def __init__(self, fruit):
+        self.fruit = fruit
+
+
+class _Arbiter(object):
+    def __init__(self, f0, f1):
+        self.shapes = ( _Shape(f0), _Shape(f1) )
+
+
+def pairs_layout(contacts):
+    """ contacts disjoint pairs of cherries """
+    fruits = [ _Fruit(i, 1, (i * 10, i % 7)) for i in range(2 * contacts) ]
+    return [ _Arbiter(fruits[2*i], fruits[2*i+1]) for i in range(contacts) ]
+
+def chain_layout(contacts):
+    """ contacts+1 cherries, each touching the next one """
+    fruits = [ _Fruit(i, 1, (i * 10, (i * 37) % 101)) for i in range(contacts + 1) ]
+    return [ _Arbiter(fruits[i], fruits[i+1]) for i in range(contacts) ]
+
+
+def bench_helper(arbiters, steps):
+    clock = utils.SimClock()
+    helper = CollisionHelper( pm.Space(), clock=clock )
+    spawn = lambda kind, bocal_coords: None
+    to_bocal = lambda p: p
+    t0 = time.perf_counter()
+    for _ in range(steps):
+        helper.reset()
+        for a in arbiters:
+            helper.collision_fruit(a)
+        helper.process( spawn_func=spawn, world_to_bocal_func=to_bocal )
+        clock.clear()
+    return (time.perf_counter() - t0) / steps
+
+
+def _legacy_step(arbiters, clock):
+    """ The former CollisionHelper resolution, for reference """
+    collisions = []
+    actions = []
+    for a in arbiters:
+        collisions.append( (a.shapes[0].fruit, a.shapes[1].fruit) )
+    fruits = set( [p[0] for p in collisions] + [p[1] for p in collisions] )
+    g = { f:set() for f in fruits }
+    for (a, b) in collisions:
+        g[a].add(b)
+        g[b].add(a)
+    composantes = []
+    already_found = set()
+    for origine in fruits:
+        if origine in already_found:
+            continue
+        already_found.add(origine)
+        composante = {origine}
+        suivant = [origine]
+        while suivant:
+            x = suivant.pop()
+            already_found.add(x)
+            for y in g[x]:
+                if y not in composante:
+                    composante.add(y)
+                    suivant.append(y)
+        composantes.append(composante)
+    spawn = lambda kind, bocal_coords: None
+    for c in composantes:
+        f = sorted( c, key=lambda f: f.position.y )
+        f0, f1 = f[0], f[1]
+        actions.append( f0.explose )
+        actions.append( lambda : f1.merge_to( dest=f0.position ) )
+        kind = f0.kind + 1
+        bocal_coords = f0.position
+        clock.schedule_once( lambda dt : spawn(kind=kind, bocal_coords=bocal_coords), SPAWN_DELAY )
+    for action in actions:
+        action()
+
+def bench_legacy(arbiters, steps):
+    clock = utils.SimClock()
+    t0 = time.perf_counter()
+    for _ in range(steps):
+        _legacy_step(arbiters, clock)
+        clock.clear()
+    return (time.perf_counter() - t0) / steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CollisionHelper microbenchmark")
+    parser.add_argument("--contacts", type=int, default=200, help="same-kind contacts per step")
+    parser.add_argument("--steps", type=int, default=2000, help="steps timed")
+    args = parser.parse_args()
+
+    for name, layout in (("pairs", pairs_layout), ("chain", chain_layout)):
+        arbiters = layout(args.contacts)
+        new = bench_helper(arbiters, args.steps)
+        old = bench_legacy(arbiters, args.steps)
+        print( f"{name:6s} {args.contacts} contacts: {new*1e6:8.1f} us/step "
+               f"(former resolution {old*1e6:8.1f} us/step, x{old/new:.1f})" )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+""" Benchmark of the physics profiles (PHYSICS_PROFILES): speed, and drift
+of the drop outcomes from the accurate profile.
+
+    python bench_physics.py [--games 2] [--drops 60] [--steps 120] [--repeat 3] [--seed 1]
+
+Boards are taken along seeded games played with the accurate profile.
+Every profile gets the same boards (GameCore.load_board) and the same
+drops, then steps --steps times:
+- speed: physics steps per second, best of --repeat runs (the profiles
+  take turns, so that a load of the machine hits them all)
+- merge drift: share of the drops that merge with the profile and not
+  with the accurate one, or the other way round
+- points drift: share of the drops that score differently
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from constants import *
+from game import GameCore
+
+
+def _drop_x():
+    return random.uniform( BOCAL_MARGIN_SIDE, WINDOW_WIDTH - BOCAL_MARGIN_SIDE )
+
+
+def reference_boards(games, drops, steps, seed):
+    """ (board, drop abscissa) along seeded games of the accurate profile
+    """
+    random.seed(seed)
+    cases = []
+    for _ in range(games):
+        game = GameCore(profile=PHYSICS_ACCURATE)
+        for _ in range(drops):
+            if( game.is_gameover ):
+                break
+            x = _drop_x()
+            cases.append( (game.export_board(), x) )
+            game.drop(x)
+            game.step(steps)
+    return cases
+
+
+def outcomes(profile, cases, steps):
+    """ points scored by each drop of the cases with this profile, and the
+    time spent stepping
+    """
+    game = GameCore(profile=profile)
+    points = np.zeros( len(cases) )
+    elapsed = 0.0
+    for i, (board, x) in enumerate(cases):
+        game.load_board(board)
+        score = game.score
+        game.drop(x)
+        t = time.perf_counter()
+        game.step(steps)
+        elapsed += time.perf_counter() - t
+        points[i] = game.score - score
+    return points, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="physics profiles benchmark")
+    parser.add_argument("--games", type=int, default=2, help="seeded games per profile")
+    parser.add_argument("--drops", type=int, default=60, help="drops per game")
+    parser.add_argument("--steps", type=int, default=120, help="physics steps after each drop")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per profile")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    cases = reference_boards(args.games, args.drops, args.steps, args.seed)
+    points = {}
+    best = { profile: float('inf') for profile in PHYSICS_PROFILES }
+    for _ in range(args.repeat):
+        for profile in PHYSICS_PROFILES:
+            points[profile], elapsed = outcomes(profile, cases, args.steps)
+            best[profile] = min( best[profile], elapsed )
+
+    print( f"{len(cases)} drops, {args.steps} steps each" )
+    reference = points[PHYSICS_ACCURATE]
+    for profile in PHYSICS_PROFILES:
+        speed = len(cases) * args.steps / best[profile]
+        merge_drift = np.mean( (points[profile] > 0) != (reference > 0) )
+        points_drift = np.mean( points[profile] != reference )
+        print( f"{profile:14s} {speed:8.0f} steps/s   merge drift {merge_drift:6.1%}   "
+               f"points drift {points_drift:6.1%}" )
+
+
+if __name__ == '__main__':
+    main()
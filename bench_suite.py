@@ -0,0 +1,259 @@
+""" Headless benchmark suite: fixed, seeded scenarios played by the game
+classes (GameCore with its Bocal, ActiveFruits and CollisionHelper),
+compared with a baseline file.
+
+    python bench_suite.py                         # run, compare with the baseline if there is one
+    python bench_suite.py --save-baseline         # run and store the results as the baseline
+    python bench_suite.py --only pile_50 cascade --threshold 0.3
+
+For each scenario:
+- median and p99 time of a GameCore.step()
+- allocations: memory allocated and freed within a step (tracemalloc peak
+  above the memory at the start of the step, mean over the steps), and the
+  memory blocks kept per step (leaks); measured in a second run, tracemalloc
+  slows everything down
+- peak RSS of the process, each scenario runs in a fresh one (None on Windows)
+
+A timing, allocation or RSS figure more than --threshold above the
+baseline (20% by default) is a regression: the exit status is then 1.
+Baselines are only comparable on the same machine, none is committed.
+"""
+import argparse
+import gc
+import json
+import math
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+from constants import *
+from fruit import _FRUITS_DEF, nb_fruits
+from game import GameCore
+
+
+BASELINE_FILE = 'bench_baseline.json'
+DEFAULT_THRESHOLD = 0.2
+SEED = 1
+
+# figures compared with the baseline, all lower is better
+COMPARED = ( 'median_us', 'p99_us', 'alloc_kb_step', 'peak_rss_mb' )
+
+
+############ scenarios ############
+# a scenario builds its game and returns (game, action called before each step or None)
+
+def _window_for(width, height):
+    """ window size of a bocal of this inner size """
+    return ( int(width + 2 * BOCAL_MARGIN_SIDE),
+             int(height + BOCAL_MARGIN_TOP + BOCAL_MARGIN_BOTTOM + REDLINE_TOP_MARGIN) )
+
+def pile(n):
+    """ n fruits of kinds 1 to 4 in a grid, settling: no neighbours (even
+    diagonal) of the same kind at the start, merges only come when the
+    pile collapses. The bocal is sized so that the grid fills it under
+    the maxline.
+    """
+    def scenario():
+        cell = 2 * _FRUITS_DEF[4]['radius'] + 2
+        cols = int( math.ceil( math.sqrt(n) ) )
+        rows = int( math.ceil( n / cols ) )
+        game = GameCore( *_window_for(cols * cell + WALL_THICKNESS, (rows + 1) * cell + WALL_THICKNESS) )
+        h = game.bocal.height
+        for i in range(n):
+            (r, c) = divmod(i, cols)
+            x = (c - (cols - 1) / 2) * cell
+            y = -h / 2 + WALL_THICKNESS / 2 + (r + 0.5) * cell
+            game.spawn_in_bocal( 1 + (2 * r + c) % 4, (x, y) )
+        return game, None
+    return scenario
+
+def cascade():
+    """ a column of fruits, the biggest at the bottom, and two cherries on
+    top: each merge lands on the next bigger fruit, up to the watermelon
+    """
+    kinds = list( range(nb_fruits() - 1, 0, -1) ) + [1]
+    height = sum( 2 * _FRUITS_DEF[k]['radius'] for k in kinds )
+    game = GameCore( *_window_for(2 * _FRUITS_DEF[nb_fruits()]['radius'] + 200, height) )
+    y = -game.bocal.height / 2 + WALL_THICKNESS / 2
+    for k in kinds:
+        r = _FRUITS_DEF[k]['radius']
+        game.spawn_in_bocal( k, (0, y + r) )
+        y += 2 * r
+    return game, None
+
+def autoplay(rate=50):
+    """ random drops at rate fruits per simulated second, a new game after
+    each game over
+    """
+    game = GameCore()
+    every = 1 / (rate * PYMUNK_INTERVAL)
+    state = { 'next': 0.0 }
+    def action(i):
+        if( game.is_gameover ):
+            game.reset()
+        while( i >= state['next'] ):
+            game.drop()
+            state['next'] += every
+    return game, action
+
+def shake_full():
+    """ shake_auto on a jar filled by random drops up to the maxline
+    """
+    game = GameCore()
+    while( not game.maxline_count and len(game.fruits) < 200 ):
+        game.drop()
+        game.step( int(0.5 / PYMUNK_INTERVAL) )
+    game.bocal.shake_auto()
+    return game, None
+
+
+# name: (scenario, steps)
+SCENARIOS = {
+    'pile_50': ( pile(50), 600 ),
+    'pile_150': ( pile(150), 600 ),
+    'pile_400': ( pile(400), 600 ),
+    'cascade': ( cascade, 600 ),
+    'autoplay_50': ( autoplay, 1200 ),
+    'shake_full': ( shake_full, 600 ),
+}
+
+
+############ measures ############
+
+def _play(name, measure):
+    """ builds the scenario (seeded) and steps it, measure(i, step) wraps step i """
+    random.seed(SEED)
+    (scenario, steps) = SCENARIOS[name]
+    game, action = scenario()
+    for i in range(steps):
+        if( action ):
+            action(i)
+        measure( i, game.step )
+    return game
+
+def run_scenario(name, allocations=True):
+    """ figures of a scenario, in this process """
+    steps = SCENARIOS[name][1]
+    # preallocated: the measures themselves allocate nothing
+    times = np.zeros( steps )
+    def timed(i, step):
+        t = time.perf_counter()
+        step()
+        times[i] = time.perf_counter() - t
+    game = _play(name, timed)
+    times *= 1e6
+    results = {
+        'steps': steps,
+        'median_us': float( np.median(times) ),
+        'p99_us': float( np.percentile(times, 99) ),
+        'fruits_end': len(game.fruits),
+        'max_kind': int( game.fruits.store.kinds.max() ) if len(game.fruits) else 0,
+        'score': game.score,
+    }
+
+    if( allocations ):
+        transient = np.zeros( steps )
+        blocks = np.zeros( 2 )
+        def traced(i, step):
+            if( i == 0 ):
+                gc.collect()
+                blocks[0] = sys.getallocatedblocks()
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            step()
+            transient[i] = tracemalloc.get_traced_memory()[1] - start
+            if( i == steps - 1 ):
+                gc.collect()
+                blocks[1] = sys.getallocatedblocks()
+        tracemalloc.start()
+        _play(name, traced)
+        tracemalloc.stop()
+        results['alloc_kb_step'] = float( np.mean(transient) ) / 1024
+        results['blocks_step'] = float( blocks[1] - blocks[0] ) / steps
+
+    if( resource ):
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        results['peak_rss_mb'] = rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    else:
+        results['peak_rss_mb'] = None
+    return results
+
+def run(names, allocations=True):
+    """ figures of the scenarios, each in a fresh process (peak RSS) """
+    ctx = mp.get_context('spawn')
+    results = {}
+    for name in names:
+        with ctx.Pool(1) as pool:
+            results[name] = pool.apply( run_scenario, (name, allocations) )
+    return results
+
+
+############ baseline ############
+
+def regressions(results, baseline, threshold):
+    """ [(scenario, figure, baseline value, value)] above the baseline by more than threshold """
+    found = []
+    for name, figures in results.items():
+        ref = baseline.get(name, {})
+        for key in COMPARED:
+            (old, new) = ( ref.get(key), figures.get(key) )
+            if( old and new is not None and new > old * (1 + threshold) ):
+                found.append( (name, key, old, new) )
+    return found
+
+def _print(results, baseline):
+    print( f"{'scenario':12s} {'median us':>15s} {'p99 us':>15s} {'alloc kB':>12s} {'blocks':>12s} "
+           f"{'rss MB':>10s} {'fruits':>6s} {'kind':>4s}" )
+    for name, r in results.items():
+        def fmt(key, width, digits):
+            v = r.get(key)
+            s = "-" if v is None else f"{v:.{digits}f}"
+            old = baseline.get(name, {}).get(key)
+            if( v is not None and old ):
+                s += f" {100 * (v / old - 1):+.0f}%"
+            return f"{s:>{width}s}"
+        print( f"{name:12s} {fmt('median_us', 15, 1)} {fmt('p99_us', 15, 1)} {fmt('alloc_kb_step', 12, 1)} "
+               f"{fmt('blocks_step', 12, 2)} {fmt('peak_rss_mb', 10, 0)} {r['fruits_end']:6d} {r['max_kind']:4d}" )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="headless benchmark suite")
+    parser.add_argument("--only", nargs='+', choices=list(SCENARIOS), help="scenarios to run")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file")
+    parser.add_argument("--save-baseline", action='store_true', help="store the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="regression above the baseline, 0.2 = 20%%")
+    parser.add_argument("--no-alloc", action='store_true', help="skip the (slow) allocation measures")
+    args = parser.parse_args()
+
+    results = run( args.only or list(SCENARIOS), allocations=not args.no_alloc )
+    baseline = {}
+    if( os.path.exists(args.baseline) and not args.save_baseline ):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['scenarios']
+    _print(results, baseline)
+
+    if( args.save_baseline ):
+        with open(args.baseline, 'w') as f:
+            json.dump( { 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'scenarios': results }, f, indent=1 )
+        print( f"baseline saved to {args.baseline}" )
+        return 0
+
+    found = regressions(results, baseline, args.threshold)
+    for (name, key, old, new) in found:
+        print( f"REGRESSION {name} {key}: {old:.1f} -> {new:.1f}" )
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit( main() )
@@ -0,0 +1,97 @@
+""" Physics throughput statistics of a GameCore: steps/s, merges/s, fruits
+alive and time spent in each phase of GameCore.step(). The results of
+each run are appended to a JSON file, to compare runs over time.
+
+    stats = PhysicsStats(game)
+    stats.start()
+    ...                     # game.step(), stats.sample() from time to time
+    save_results( stats.stop() )
+
+export_latency() appends snapshots of utils.LatencyHistogram to a JSON
+Lines file, for frame time objectives over long runs.
+"""
+import json, os, platform, time
+
+import pymunk as pm
+
+from constants import *
+from game import PHASES
+
+
+class PhysicsStats(object):
+    """ Measures a GameCore from start() to stop()
+    """
+    def __init__(self, game, name='window'):
+        self._game = game
+        self._name = name
+        self._t0 = None
+
+    def start(self):
+        self._game.time_phases(True)
+        self._t0 = time.perf_counter()
+        self._steps0 = self._game.clock.step
+        self._merges0 = self._game.merges
+        self._fruits = []       # fruits alive at each sample()
+
+    def sample(self):
+        self._fruits.append( len(self._game.fruits) )
+
+    @property
+    def steps_per_sec(self):
+        elapsed = time.perf_counter() - self._t0
+        return (self._game.clock.step - self._steps0) / max(elapsed, 1e-9)
+
+    def stop(self):
+        """ Stops measuring, returns the results (JSON serializable dict)
+        """
+        elapsed = time.perf_counter() - self._t0
+        steps = self._game.clock.step - self._steps0
+        merges = self._game.merges - self._merges0
+        times = self._game.phase_times
+        self._game.time_phases(False)
+        fruits = self._fruits or [ len(self._game.fruits) ]
+        return {
+            'name': self._name,
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'pymunk': pm.version,
+            'profile': self._game.profile,
+            'seconds': elapsed,
+            'steps': steps,
+            'steps_per_sec': steps / max(elapsed, 1e-9),
+            'merges': merges,
+            'merges_per_sec': merges / max(elapsed, 1e-9),
+            'fruits_mean': sum(fruits) / len(fruits),
+            'fruits_max': max(fruits),
+            # microseconds per step in each phase of GameCore.step()
+            'phases_us': { p: 1e6 * times[p] / max(steps, 1) for p in PHASES },
+        }
+
+
+def save_results(results, path=BENCHMARK_FILE):
+    """ Appends the results of a run to the JSON list in path
+    """
+    runs = []
+    if( os.path.exists(path) ):
+        with open(path) as f:
+            runs = json.load(f)
+    runs.append(results)
+    with open(path, 'w') as f:
+        json.dump(runs, f, indent=1)
+
+
+def export_latency(histograms, path=LATENCY_FILE):
+    """ Appends one line to the JSON Lines file path: the date and the
+    snapshot() of each histogram of {name: LatencyHistogram}
+    """
+    line = { 'date': time.strftime('%Y-%m-%d %H:%M:%S') }
+    line.update( { name: h.snapshot() for name, h in histograms.items() } )
+    with open(path, 'a') as f:
+        f.write( json.dumps(line) + "\n" )
+
+
+def summary(results):
+    phases = "  ".join( f"{p} {us:.1f}" for p, us in results['phases_us'].items() )
+    return ( f"{results['steps']} steps in {results['seconds']:.1f} s: "
+             f"{results['steps_per_sec']:.0f} steps/s, {results['merges_per_sec']:.1f} merges/s, "
+             f"{results['fruits_mean']:.1f} fruits\n  us/step: {phases}" )
@@ -1,4 +1,5 @@
 import math, random
+import numpy as np
 import pymunk as pm
 from constants import *
 from sprites import LineSprite
@@ -26,14 +27,14 @@ class BoxElement(object):
     """ Physical pymunk shape associated with a graphical object
        Base class for container elements (Wall, Maxline)
     """
-    def __init__(self, bocal_w, bocal_h, collision_type, thickness ):
+    def __init__(self, bocal_w, bocal_h, collision_type, thickness, headless=False ):
         # fundamental dimensions of the object relative to self.body
         self._length, self._local_angle = self.dimensions( bocal_w, bocal_h )
         # coordinates of object endpoints in self.body's reference frame
         (a,b) = self.local_coords()
 
-        # pyglet graphical object
-        self.line = self.make_sprite(a,b)
+        # pyglet graphical object (none without a window)
+        self.line = None if headless else self.make_sprite(a,b)
 
         # pymunk physical object with a segment collision shape
         self.body = pm.Body(body_type=pm.Body.KINEMATIC)
@@ -75,18 +76,37 @@ class BoxElement(object):
         # do not confuse with self._local_angle
         d_pos = position - self.body.position
         d_angle = (angle - self.body.angle) % (2*math.pi)
+        moving = dt > 0.000001 and ( d_pos.length > 0.000001 or d_angle > 0.000001 )
+        self.set_static( not moving )
+        if( not moving ):
+            return
 
         self.body.velocity = pm.Vec2d(0,0)
         self.body.angular_velocity = 0
-        if( (dt > 0.000001) ):
-            if( d_pos.length > 0.000001 ):
-                self.body.velocity = d_pos / (dt * WALLS_DAMPING)
-            if( d_angle > 0.000001 ):
-                self.body.angular_velocity = d_angle / (dt * WALLS_DAMPING)
+        if( d_pos.length > 0.000001 ):
+            self.body.velocity = d_pos / (dt * WALLS_DAMPING)
+        if( d_angle > 0.000001 ):
+            self.body.angular_velocity = d_angle / (dt * WALLS_DAMPING)
+
+    def set_static(self, static):
+        """ STATIC while in place, KINEMATIC to move: pymunk wakes up whatever
+        touches a kinematic body at every step, the fruits could never sleep
+        """
+        body_type = pm.Body.STATIC if static else pm.Body.KINEMATIC
+        if( self.body.body_type == body_type ):
+            return
+        if( static ):
+            self.body.velocity = (0, 0)
+            self.body.angular_velocity = 0
+        self.body.body_type = body_type
+        if( static and self.body.space is not None ):
+            self.body.space.reindex_shapes_for_body( self.body )
 
     def update(self):
         """ Updates the graphics object from the physics simulation
         """
+        if( not self.line ):
+            return
         (a, b) = self.world_coords()
         self.line.x, self.line.y = round(a[0]), round(a[1])
         self.line.x2, self.line.y2 = round(b[0]), round(b[1])
@@ -114,11 +134,12 @@ class BoxElement(object):
     
 
 class Wall( BoxElement ):
-    def __init__(self, bocal_w, bocal_h, collision_type):
+    def __init__(self, bocal_w, bocal_h, collision_type, headless=False):
         super().__init__( bocal_w=bocal_w, 
                           bocal_h=bocal_h,
                           thickness=WALL_THICKNESS,
-                          collision_type=collision_type)
+                          collision_type=collision_type,
+                          headless=headless)
         self.segment.filter= pm.ShapeFilter( categories=CAT_WALLS, 
                                             mask=pm.ShapeFilter.ALL_MASKS() )
         self.segment.elasticity = ELASTICITY_WALLS
@@ -129,10 +150,11 @@ class Wall( BoxElement ):
 
 
 class HorizontalWall(Wall):
-    def __init__(self, bocal_w, bocal_h):
+    def __init__(self, bocal_w, bocal_h, headless=False):
         super().__init__( bocal_w=bocal_w, 
                           bocal_h=bocal_h,
-                          collision_type=COLLISION_TYPE_WALL_BOTTOM )
+                          collision_type=COLLISION_TYPE_WALL_BOTTOM,
+                          headless=headless )
 
     def dimensions(self, bocal_w, bocal_h):
         """ wall segment dimensions from bocal size
@@ -142,10 +164,11 @@ class HorizontalWall(Wall):
         return (length, local_angle)
     
 class VerticalWall(Wall):
-    def __init__(self, bocal_w, bocal_h):
+    def __init__(self, bocal_w, bocal_h, headless=False):
         super().__init__( bocal_w=bocal_w, 
                           bocal_h=bocal_h, 
-                          collision_type=COLLISION_TYPE_WALL_SIDE )
+                          collision_type=COLLISION_TYPE_WALL_SIDE,
+                          headless=headless )
 
     def dimensions(self, bocal_w, bocal_h):
         """ wall segment dimensions from bocal size
@@ -175,11 +198,12 @@ class RightWall(VerticalWall):
 class MaxLine( BoxElement ):
     """ Maximum level line in the container
     """
-    def __init__(self, bocal_w, bocal_h ):
+    def __init__(self, bocal_w, bocal_h, headless=False ):
         super().__init__( bocal_w=bocal_w,
                           bocal_h=bocal_h,
                           thickness=REDLINE_THICKNESS,
-                          collision_type=COLLISION_TYPE_MAXLINE)
+                          collision_type=COLLISION_TYPE_MAXLINE,
+                          headless=headless)
         self.segment.filter= pm.ShapeFilter( categories=CAT_MAXLINE, 
                                             mask=pm.ShapeFilter.ALL_MASKS() ^ CAT_WALLS )
         self.segment.sensor = True
@@ -200,8 +224,9 @@ class MaxLine( BoxElement ):
 class DropZone(object):
     """Calculations for fruit drop locations inside the container
     """
-    def __init__(self, bocal_body, width, height):
+    def __init__(self, bocal_body, width, height, rng=random):
         self._bocal_body = bocal_body
+        self._rng = rng
         self.on_resize(width, height)
 
     def on_resize(self, width, height):
@@ -244,16 +269,16 @@ class DropZone(object):
         either the drop point of a fruit based on the clicked point
         or None if the point is outside the container
         """
-        return self._drop_point_interpolate( margin + (1 - 2*margin) * random.random() )
+        return self._drop_point_interpolate( margin + (1 - 2*margin) * self._rng.random() )
 
 
-def _make_walls( space, width, height ):
+def _make_walls( space, width, height, headless=False ):
     walls = {
-        LEFT:   LeftWall(bocal_w=width, bocal_h=height),
-        RIGHT:  RightWall(bocal_w=width, bocal_h=height), 
-        BOTTOM: BottomWall(bocal_w=width, bocal_h=height),
-        TOP:    TopWall(bocal_w=width, bocal_h=height), 
-        MAXLINE: MaxLine(bocal_w=width, bocal_h=height),
+        LEFT:   LeftWall(bocal_w=width, bocal_h=height, headless=headless),
+        RIGHT:  RightWall(bocal_w=width, bocal_h=height, headless=headless), 
+        BOTTOM: BottomWall(bocal_w=width, bocal_h=height, headless=headless),
+        TOP:    TopWall(bocal_w=width, bocal_h=height, headless=headless), 
+        MAXLINE: MaxLine(bocal_w=width, bocal_h=height, headless=headless),
     }
     for w in walls.values():
         w.add_to_space( space )
@@ -262,8 +287,9 @@ def _make_walls( space, width, height ):
 
 class Bocal(object):
     """ Utility to create the walls of the game space (space).
+    headless=True builds the physics only, without any pyglet sprite.
     """
-    def __init__(self, space, center, bocal_w, bocal_h):
+    def __init__(self, space, center, bocal_w, bocal_h, clock=None, headless=False, rng=random):
         # Create a static body for the container
         self._body = pm.Body(body_type=pm.Body.STATIC)  # Changed to STATIC
         self._position_ref = center
@@ -272,10 +298,11 @@ class Bocal(object):
         self._body.position = center  # Set initial position immediately
         space.add(self._body)
  
-        self._walls = _make_walls(space, width=bocal_w, height=bocal_h)
+        self._walls = _make_walls(space, width=bocal_w, height=bocal_h, headless=headless)
         self._space = space
+        self._clock = clock or utils.get_clock()
         self._maxline = self._walls[MAXLINE]
-        self._dropzone = DropZone(bocal_body=self._body, width=bocal_w, height=bocal_h)
+        self._dropzone = DropZone(bocal_body=self._body, width=bocal_w, height=bocal_h, rng=rng)
         self.reset()
 
     def reset(self):
@@ -292,6 +319,29 @@ class Bocal(object):
         self._tumble = TUMBLE_OFF
         self._tumble_start_time = None 
 
+        self._place_walls()
+
+
+    def snapshot(self):
+        """ Motion of the bocal and its walls, shake and tumble states
+        """
+        bodies = [ self._body ] + [ w.body for w in self._walls.values() ]
+        return ( [ (b.position, b.angle, b.velocity, b.angular_velocity) for b in bodies ],
+                 self._shake, self._shake_start_time, self._shake_mouse_target,
+                 self._tumble, self._tumble_start_time )
+
+    def restore(self, state):
+        (motions, self._shake, self._shake_start_time, self._shake_mouse_target,
+         self._tumble, self._tumble_start_time) = state
+        # kinematic until the next step() finds them in place
+        for w in self._walls.values():
+            w.set_static( False )
+        bodies = [ self._body ] + [ w.body for w in self._walls.values() ]
+        for b, (position, angle, velocity, angular_velocity) in zip(bodies, motions):
+            b.position = position
+            b.angle = angle
+            b.velocity = velocity
+            b.angular_velocity = angular_velocity
 
     def delete(self):
         for w in self.walls.values():
@@ -305,18 +355,33 @@ class Bocal(object):
     def to_bocal(self, world_coords):
         return self._body.world_to_local(world_coords)
 
+    def to_bocal_array(self, world_coords):
+        """ to_bocal() of an (n, 2) array of world positions
+        """
+        (cx, cy) = self._body.position
+        a = self._body.angle
+        (c, s) = (math.cos(a), math.sin(a))
+        dx = world_coords[:, 0] - cx
+        dy = world_coords[:, 1] - cy
+        return np.stack( [ dx * c + dy * s, dy * c - dx * s ], axis=1 )
+
     @property
     def width(self):
         bot = self._walls[BOTTOM].segment
         return (bot.b - bot.a).length
     
+    @property
+    def height(self):
+        return self._height_ref
+
     @property
     def is_tumbling(self):
         return self._tumble != TUMBLE_OFF
 
 
     def fruits_sur_maxline(self):
-        """ ID of the fruits in contact with maxline.
+        """ Fruits in contact with maxline, queried from the space.
+        The game reads GameCore.maxline_count, maintained by the collisions.
         """
         sqi = self._space.shape_query( self._maxline.segment )
         fruit = [ s.shape.fruit for s in sqi ]
@@ -329,6 +394,20 @@ class Bocal(object):
         self._update_walls(dt)
 
 
+    def _place_walls(self):
+        """ Puts the walls at their position at once, without moving them
+        (otherwise they sweep in from the origin on the first steps)
+        """
+        for wall in self._walls.values():
+            local_pos = wall.bocal_position_func(self._width_ref, self._height_ref)
+            wall.set_static( False )
+            wall.body.position = self._body.local_to_world(local_pos)
+            wall.body.angle = self._body.angle
+            wall.body.velocity = (0, 0)
+            wall.body.angular_velocity = 0
+            wall.set_static( True )
+
+
     def _update_walls(self, dt):
         """ Move the walls.
         """
@@ -340,7 +419,7 @@ class Bocal(object):
 
     def shake_auto(self):
         self._shake = SHAKE_AUTO
-        self._shake_start_time = utils.now()
+        self._shake_start_time = self._clock.time()
 
 
     def shake_mouse(self):
@@ -376,7 +455,7 @@ class Bocal(object):
         # accelerated sinusoidal oscillation
         elif(self._shake == SHAKE_AUTO):
             (x_ref, y_ref) = self._position_ref
-            t = utils.now() - self._shake_start_time
+            t = self._clock.time() - self._shake_start_time
             p = (x_ref + SHAKE_AMPLITUDE_X * math.sin(auto_shake_x(t)), y_ref)
             velocity = (p - self._body.position)/dt
 
@@ -1,6 +1,6 @@
-import pyglet as pg
 from constants import *
 from fruit import nb_fruits
+import utils
 
 
 def _is_fruit_shape(shape):
@@ -36,29 +36,127 @@ def _get_fruit_first_drop(arbiter):
     return (first_fruit, other_fruit)
 
 
+# Events collected during a physics step, executed by CollisionHelper.process()
+EVENT_NORMAL = 0        # first contact of a dropped fruit: back to normal mode
+EVENT_BLINK_ON = 1      # fruit touching the maxline
+EVENT_BLINK_OFF = 2     # fruit leaving the maxline
+EVENT_EXPLODE = 3       # lowest fruit of a merge
+EVENT_MERGE = 4         # second lowest fruit of a merge, moves to the lowest one (other)
+
+DEFAULT_SLOTS = 64      # fruits in contact per step before the buffers grow
+
+
 class CollisionHelper(object):
     """ Contains the callback called by pymunk for each collision 
-    and the algorithms for choosing the fruits to merge and create
+    and the algorithms for choosing the fruits to merge and create.
+
+    Same-kind contacts are grouped on the fly by a union-find over slots,
+    one slot per fruit in contact during the step. Each group merges its
+    two lowest fruits. The callbacks only record (type, fruit, other)
+    events, executed in order by process().
+
+    The fruits touching the maxline are kept in a set by the maxline
+    begin/separate callbacks (pymunk also calls separate when a fruit
+    leaves the space), so that the overflow needs no shape query.
     """
-    def __init__(self, space):
+    def __init__(self, space, clock=None):
+        self._clock = clock or utils.get_clock()
+        self._pending_merges = 0      # spawns scheduled and not done yet
+        self.merges = 0               # merges resolved since the creation
+        self._maxline = set()         # fruits touching the maxline
+        self._slot_of = {}            # fruit id -> slot, for this step
+        self._alloc( DEFAULT_SLOTS )
+        self._events = []
         self.reset()
         self.setup_handlers( space )
 
+    def _alloc(self, size):
+        self._parent = list(range(size))
+        self._slot_fruit = [None] * size
 
     def reset( self ):
-         self._collisions_fruits = []
-         self._actions = []
+        # only the used slots need to be cleared
+        for i in range(len(self._slot_of)):
+            self._parent[i] = i
+            self._slot_fruit[i] = None
+        self._slot_of.clear()
+        self._events.clear()
+
+    @property
+    def pending_merges(self):
+        return self._pending_merges
+
+    @property
+    def maxline_count(self):
+        """ number of fruits touching the maxline
+        """
+        return len(self._maxline)
+
+    def on_maxline(self, fruit):
+        return fruit in self._maxline
+
+    def maxline_fruits(self):
+        return list(self._maxline)
+
+    def cancel_pending(self):
+        """ Cancels the scheduled spawns
+        """
+        self._clock.unschedule( self._spawn )
+        self._pending_merges = 0
+
+    def snapshot(self):
+        """ The spawns themselves are data on the clock, see SimClock.snapshot()
+        """
+        return ( self._pending_merges, list(self._maxline) )
+
+    def restore(self, state):
+        self.reset()
+        (self._pending_merges, maxline) = state
+        self._maxline = set(maxline)
+
+    ############ union-find ############
+
+    def _new_slot(self, slot, fruit):
+        self._slot_fruit[slot] = fruit
+        if( slot + 1 == len(self._parent) ):
+            self._parent.extend( range(slot + 1, 2 * (slot + 1)) )
+            self._slot_fruit.extend( [None] * (slot + 1) )
+
+    def _find(self, i):
+        parent = self._parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]      # path halving
+            i = parent[i]
+        return i
+
+    ############ pymunk callbacks ############
 
     def collision_fruit( self, arbiter ):
         """ Callback for pymunk collision_handler
         """
-        s0 = arbiter.shapes[0]
-        s1 = arbiter.shapes[1]
+        (s0, s1) = arbiter.shapes
+        f0 = s0.fruit
+        f1 = s1.fruit
+        assert( f0.kind == f1.kind )
+
+        # slots of the two fruits, new ones for fruits not seen during this step
+        slot_of = self._slot_of
+        n = len(slot_of)
+        a = slot_of.setdefault( f0.id, n )
+        if( a == n ):
+            self._new_slot(a, f0)
+            n += 1
+        b = slot_of.setdefault( f1.id, n )
+        if( b == n ):
+            self._new_slot(b, f1)
 
-        shapes = arbiter.shapes
-        assert( len(shapes)==2 ), " WTF ???"
-        assert( s0.fruit.kind == s1.fruit.kind )
-        self._collisions_fruits.append( (s0.fruit, s1.fruit) )
+        # union, the oldest slot stays the root: groups come out in contact order
+        ra = self._find(a)
+        rb = self._find(b)
+        if( ra < rb ):
+            self._parent[rb] = ra
+        elif( rb < ra ):
+            self._parent[ra] = rb
         return True
 
 
@@ -66,7 +164,7 @@ class CollisionHelper(object):
         """ Called when a fruit falls on another for the first time after being introduced into play
         """
         (first_fruit, other_fruit) = _get_fruit_first_drop(arbiter)
-        self._actions.append( lambda : first_fruit.normal() )
+        self._events.append( (EVENT_NORMAL, first_fruit, None) )
         # The first collision is also a normal collision
         if( other_fruit and first_fruit.kind==other_fruit.kind ):
             self.collision_fruit(arbiter)
@@ -74,83 +172,85 @@ class CollisionHelper(object):
 
     def collision_maxline_begin(self, arbiter):
         f = _get_fruit(arbiter)
+        self._maxline.add( f )
         # Deferred execution, the action may change in case of collision with another fruit
-        self._actions.append( lambda : f.blink( activate=True, delay= BLINK_DELAY ) )
+        self._events.append( (EVENT_BLINK_ON, f, None) )
         return False  # Ignores collisions with maxline for physics simulation
 
     def collision_maxline_separate(self, arbiter):
         f = _get_fruit(arbiter)
+        self._maxline.discard( f )
         # Deferred execution, the action may change in case of collision or other
-        self._actions.append( lambda : f.blink( activate=False ) )
+        self._events.append( (EVENT_BLINK_OFF, f, None) )
         return False  # Ignores collisions with maxline for physics simulation
 
-    def _collision_sets(self):
-        """ Searches for connected components in the collision graph
-        The graph is defined by an adjacency list
+    ############ resolution ############
+
+    def _merge_pairs(self):
+        """ The two lowest fruits of each group of same-kind fruits in contact
+        Returns [(f0, f1)], f0 the lowest, groups in contact order
         """
-        if( not self._collisions_fruits ):  # Optimization
+        n = len(self._slot_of)
+        if( not n ):
             return []
-
-        # Set of balls involved in collisions to be resolved
-        fruits = set( [pair[0] for pair in self._collisions_fruits] 
-                     +[pair[1] for pair in self._collisions_fruits] )
-
-        # Builds the graph of balls in contact
-        g = { f:set() for f in fruits }
-        for (a, b) in self._collisions_fruits :
-            g[a].add(b)
-            g[b].add(a)
-
-        # Searches for connected components in the graph 
-        composantes = []
-        already_found = set()
-        for origine in fruits:
-            if origine in already_found:
-                continue
-            already_found.add(origine)
-            composante = {origine}
-            suivant = [origine]
-            while suivant:
-                x = suivant.pop()
-                already_found.add(x)
-                for y in g[x]:
-                    if y not in composante:
-                        composante.add(y)
-                        suivant.append(y)
-            composantes.append(composante)
-        return composantes
-
+        lowest = {}     # root -> [y0, f0, y1, f1]
+        find = self._find
+        for i in range(n):
+            f = self._slot_fruit[i]
+            y = f.position.y
+            low = lowest.get( find(i) )
+            if( low is None ):
+                lowest[ find(i) ] = [y, f, None, None]
+            elif( y < low[0] ):
+                low[2:] = low[:2]
+                low[:2] = (y, f)
+            elif( low[3] is None or y < low[2] ):
+                low[2:] = (y, f)
+        return [ (low[1], low[3]) for low in lowest.values() ]
 
     def _process_collisions(self, spawn_func, world_to_bocal_func):
         """ Modifies the fruits according to collisions that occurred during pymunk.step()
         """
-        # Processes explosions  
-        for collision_set in self._collision_sets():
-            # List of Fruit from IDs, sorted by altitude
-            explose_fruits = sorted( collision_set,  key=lambda f: f.position.y )
-            assert len( explose_fruits ) >= 2, "collision à un seul fruit ???"
-
-            # Processes only the 2 lowest fruits in case of multiple collisions
-            f0 = explose_fruits[0]
-            f1 = explose_fruits[1]
-            assert( f0.kind == f1.kind )
-            self._actions.append( f0.explose )
-            self._actions.append( lambda : f1.merge_to( dest=f0.position ) )
+        max_kind = nb_fruits()
+        events = self._events
+        for (f0, f1) in self._merge_pairs():
+            assert f1 is not None, "collision à un seul fruit ???"
+            events.append( (EVENT_EXPLODE, f0, None) )
+            events.append( (EVENT_MERGE, f1, f0) )
 
             # Replaces the exploded fruits with a single new larger fruit
             # Copies the info because f0 may be REMOVED when spawn() is called
-            kind = min( f0.kind + 1, nb_fruits() )
+            kind = min( f0.kind + 1, max_kind )
             bocal_coords = world_to_bocal_func( f0.position )
-            spawn_fruit = lambda dt : spawn_func(kind=kind, bocal_coords=bocal_coords)
-            pg.clock.schedule_once( spawn_fruit, delay=SPAWN_DELAY )
+            self._clock.schedule_once( self._spawn, SPAWN_DELAY,
+                spawn_func=spawn_func, kind=kind, bocal_coords=bocal_coords )
+            self._pending_merges += 1
+            self.merges += 1
+
+    def _spawn(self, dt, spawn_func, kind, bocal_coords):
+        self._pending_merges -= 1
+        spawn_func(kind=kind, bocal_coords=bocal_coords)
 
+    def _execute(self, event, fruit, other):
+        if( event == EVENT_NORMAL ):
+            fruit.normal()
+        elif( event == EVENT_BLINK_ON ):
+            fruit.blink( activate=True, delay=BLINK_DELAY )
+        elif( event == EVENT_BLINK_OFF ):
+            fruit.blink( activate=False )
+        elif( event == EVENT_EXPLODE ):
+            fruit.explose()
+            self._maxline.discard( fruit )  # out of play now, separate only comes next step
+        elif( event == EVENT_MERGE ):
+            fruit.merge_to( dest=other.position )
+            self._maxline.discard( fruit )
 
     def process(self, spawn_func, world_to_bocal_func):
         self._process_collisions(spawn_func, world_to_bocal_func)
 
-        # Executes actions on existing fruits ( explose(), blink(), etc... )
-        for action in self._actions:
-            action()
+        # Executes events on existing fruits ( explose(), blink(), etc... )
+        for (event, fruit, other) in self._events:
+            self._execute(event, fruit, other)
         self.reset()
 
 
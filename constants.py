@@ -24,12 +24,37 @@ BOCAL_MIN_HEIGHT=400
 
 ############ Physical Simulation #############
 PYMUNK_INTERVAL = 1 / 120.0    
+MAX_SUBSTEPS = 8               # physics steps per frame at most, the time beyond is dropped
 FRICTION = 1.0
 GRAVITY = -981
 INITIAL_VELOCITY = 1200
 ELASTICITY_FRUIT = 0.05
 ELASTICITY_WALLS = 0.05
 
+# Physics profiles, see game.make_space()
+#   spatial_hash: (cell size, cells) of the pymunk spatial hash, None for its default bounding box tree
+#   iterations: solver iterations per step
+#   sleep_time: seconds at rest before a body sleeps (inf: never)
+#   idle_speed: pixels/s under which a body is at rest (0: estimated by pymunk)
+#   collision_slop: pixels of overlap allowed between shapes
+#   threads: solver threads (1: the plain solver, more needs a non Windows system)
+PHYSICS_DISPLAY = 'display'
+PHYSICS_TRAINING_FAST = 'training-fast'
+PHYSICS_ACCURATE = 'accurate'
+PHYSICS_PROFILES = {
+    # the window: settled fruits sleep, so that they stop jittering and cost less
+    PHYSICS_DISPLAY: {
+        'spatial_hash': None, 'iterations': 10, 'sleep_time': 1.0,
+        'idle_speed': 10, 'collision_slop': 0.1, 'threads': 1 },
+    PHYSICS_TRAINING_FAST: {
+        'spatial_hash': None, 'iterations': 5, 'sleep_time': 0.5,
+        'idle_speed': 10, 'collision_slop': 0.5, 'threads': 1 },
+    # reference of bench_physics.py
+    PHYSICS_ACCURATE: {
+        'spatial_hash': None, 'iterations': 30, 'sleep_time': float('inf'),
+        'idle_speed': 0, 'collision_slop': 0.05, 'threads': 1 },
+}
+
 
 ############ Game animations and timings #############
 AUTOPLAY_INTERVAL_BASE = 0.05       # seconds
@@ -63,6 +88,35 @@ MERGE_DELAY = 0.1          # seconds
 SPAWN_DELAY = 0.3          # seconds
 
 
+############# AI pace ################
+SETTLE_SPEED = 20          # pixels/s, a slower fruit is considered at rest
+SETTLE_MAX_DELAY = 2.0     # seconds, longest wait for the board to settle before the next AI drop
+AI_POLL_INTERVAL = 1/30    # seconds, how often the AI checks whether it can drop
+
+
+############# Benchmark mode (key B) ################
+BENCHMARK_FRAME = 1/30     # seconds of stepping between two frames, unthrottled
+BENCHMARK_FILE = 'benchmark.json'   # the results of each run are appended to it
+
+
+############# Profiling (keys O and D) ################
+PROFILE_BUFSIZE = 1024     # timings kept per span
+PROFILE_REFRESH = 0.5      # seconds between two refreshes of the overlay
+PROFILE_TRACE_FILE = 'trace.json'   # Chrome trace-event file written by key D
+
+
+############# Latency histograms ################
+FRAME_DEADLINE = 1/30      # seconds, a longer interval between two frames is a visible hitch
+LATENCY_EXPORT_PERIOD = 60      # seconds between two snapshots of the histograms, None: never
+LATENCY_FILE = 'latency.jsonl'  # one JSON line per snapshot is appended to it
+
+
+############# Replays ################
+DROP_RESOLUTION = 16       # drop abscissas are rounded to 1/16 pixel, stored exactly in replay logs
+REPLAY_CHECKSUM_EVERY = 10     # drops between two checksums of the board in a replay log
+REPLAY_KEYFRAME_EVERY = 120    # steps between two full frames in a frames file (1 s)
+
+
 # Identifiers to dispatch collisions on game logic
 # fruits have a COLLISION_TYPE equal to their kind ( fruit.kind )
 COLLISION_TYPE_WALL_BOTTOM = 1000
@@ -0,0 +1,80 @@
+import numpy as np
+
+from fruit import nb_fruits
+
+
+DEFAULT_COLUMNS = 6      # vertical slices of the bocal
+DEFAULT_LEVELS = 4       # quantization of the column heights
+DEFAULT_TOP_K = 1        # fruit kinds kept per column, highest first
+
+
+class ColumnEncoder(object):
+    """ Bounded observation of the bocal for the agent.
+
+    The bocal is cut in `columns` vertical slices, relative to its width.
+    Each slice gives the height of its pile quantized on `levels` levels,
+    and the kinds of its `top_k` highest fruits (0 = none). Positions are
+    taken in the bocal frame, so shaking does not change the state.
+
+    encode() returns this as an int8 vector, key() packs a vector into an
+    integer with one digit per value, so that equal states share a key.
+    """
+    def __init__(self, columns=DEFAULT_COLUMNS, levels=DEFAULT_LEVELS, top_k=DEFAULT_TOP_K):
+        self.columns = columns
+        self.levels = levels
+        self.top_k = top_k
+        radix = [levels] * columns + [nb_fruits() + 1] * (columns * top_k)
+        self.state_count = int(np.prod(radix, dtype=object))
+        assert self.state_count < 2**63, "encoder too fine to pack the state in 64 bits"
+        self._weights = np.cumprod( [1] + radix[:-1], dtype=np.int64 )
+
+    def __eq__(self, other):
+        return ( isinstance(other, ColumnEncoder)
+                 and (self.columns, self.levels, self.top_k) == (other.columns, other.levels, other.top_k) )
+
+    def __repr__(self):
+        return f"ColumnEncoder(columns={self.columns}, levels={self.levels}, top_k={self.top_k})"
+
+    @property
+    def size(self):
+        """ length of the encoded vector
+        """
+        return self.columns * (1 + self.top_k)
+
+    def encode(self, store, bocal):
+        """ int8 vector [height of each column..., top kinds of each column...]
+        store: FruitStore of the fruits (ActiveFruits.store)
+        """
+        w = bocal.width
+        h = bocal.height
+        mask = store.in_play()
+        (x, y) = bocal.to_bocal_array( store.positions[mask] ).T
+        r = store.radius[mask]
+        kinds = store.kinds[mask]
+        # a fruit belongs to all the columns it covers
+        c0 = np.trunc( (x - r + w/2) / w * self.columns )
+        c1 = np.trunc( (x + r + w/2) / w * self.columns )
+        top = (y + r + h/2) / h
+        columns = np.arange( self.columns )
+        covers = (columns >= c0[:, None]) & (columns <= c1[:, None])     # (fruits, columns)
+        heights = np.max( np.where(covers, top[:, None], 0), axis=0, initial=0 )
+
+        vector = np.zeros( self.size, dtype=np.int8 )
+        vector[:self.columns] = np.clip( (heights * self.levels).astype(int), 0, self.levels-1 )
+        # highest first, then biggest kind
+        order = np.lexsort( (kinds, top) )[::-1]
+        for c in range(self.columns):
+            pile = kinds[ order[ covers[order, c] ][:self.top_k] ]
+            start = self.columns + c*self.top_k
+            vector[start:start + len(pile)] = pile
+        return vector
+
+    def key(self, vector):
+        """ integer uniquely identifying an encoded state
+        """
+        return int( np.dot( np.asarray(vector, dtype=np.int64), self._weights ) )
+
+    def keys(self, vectors):
+        """ key() of each vector of a batch, int64 array
+        """
+        return np.asarray(vectors, dtype=np.int64).reshape( -1, self.size ) @ self._weights
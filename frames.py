@@ -0,0 +1,246 @@
+""" Frames files: the fruits of a recorded game at each physics step, to
+watch it and seek anywhere without simulating it again (replay_viewer.py).
+
+    bake( next(replay.read_games('games.skr')), 'game.frames' )   # simulates it once
+    frames = FrameFile('game.frames')
+    state = frames.seek(600)          # fruits after 5 s
+
+Every REPLAY_KEYFRAME_EVERY steps a keyframe lists all the fruits (id,
+kind, position, angle). The frames in between only hold the changes from
+the previous one: fruits removed, fruits added, and the moves of the
+fruits that moved, quantized (1/16 pixel, 1/65536 turn) and delta coded
+in int16. The sleeping fruits cost nothing, and a seek decodes at most
+one keyframe and REPLAY_KEYFRAME_EVERY - 1 deltas. The file is read
+through mmap: a long game is not loaded in memory.
+
+Format, little-endian:
+    header      b'SKF' version, keyframe_every, frames, width, height, seed (uint32), index offset (uint64)
+    frames      flag (1: keyframe), score (uint32), removed, added, moved (uint16)
+                removed: indices in the previous frame (uint16)
+                added: ids (uint32), kinds (uint8), x, y (int32), angle (uint16)
+                moved: indices once the removed ones are out (uint16), dx, dy, dangle (int16)
+    index       offsets of the keyframes (uint64)
+"""
+import mmap
+import struct
+
+import numpy as np
+
+from constants import *
+import replay
+
+
+MAGIC = b'SKF'
+VERSION = 1
+
+POSITION_SCALE = 16                     # 1/16 pixel
+ANGLE_SCALE = 65536 / (2 * np.pi)       # 1/65536 turn
+
+_HEADER = struct.Struct( '<3sBIIIIIQ' )
+_FRAME = struct.Struct( '<BIHHH' )
+
+
+class FrameState(object):
+    """ Fruits of a frame, in the order of the file
+    ids, kinds: arrays
+    q: int32 array (3, n) of the quantized x, y, angle
+    """
+    def __init__(self):
+        self.frame = -1
+        self.score = 0
+        self.ids = np.zeros( 0, dtype=np.uint32 )
+        self.kinds = np.zeros( 0, dtype=np.uint8 )
+        self.q = np.zeros( (3, 0), dtype=np.int32 )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def copy(self):
+        """ The decoder replaces the arrays of its state instead of changing
+        them, a copy of the references is enough
+        """
+        state = FrameState()
+        (state.frame, state.score, state.ids, state.kinds, state.q) = (self.frame, self.score,
+                                                                      self.ids, self.kinds, self.q)
+        return state
+
+    @property
+    def x(self):
+        return self.q[0] / POSITION_SCALE
+
+    @property
+    def y(self):
+        return self.q[1] / POSITION_SCALE
+
+    @property
+    def angle(self):
+        return self.q[2] / ANGLE_SCALE
+
+
+def _quantize(x, y, angle):
+    return np.stack( [ np.round( np.asarray(x) * POSITION_SCALE ),
+                       np.round( np.asarray(y) * POSITION_SCALE ),
+                       np.round( np.asarray(angle) * ANGLE_SCALE ) % 65536 ] ).astype(np.int32)
+
+
+class FrameWriter(object):
+    """ Writes a frames file, one add() per physics step
+    """
+    def __init__(self, path, width, height, seed=0, keyframe_every=REPLAY_KEYFRAME_EVERY):
+        self._file = open(path, 'wb')
+        self._header = [ MAGIC, VERSION, keyframe_every, 0, int(width), int(height), seed, 0 ]
+        self._file.write( _HEADER.pack(*self._header) )
+        self._every = keyframe_every
+        self._keyframes = []
+        self._previous = FrameState()
+
+    def add(self, ids, kinds, x, y, angle, score):
+        """ Appends a frame: the fruits (ids, kinds, positions and angles
+        arrays, in any order) and the score
+        """
+        ids = np.asarray( ids, dtype=np.uint32 )
+        kinds = np.asarray( kinds, dtype=np.uint8 )
+        q = _quantize(x, y, angle)
+        keyframe = self._header[3] % self._every == 0
+        prev = FrameState() if keyframe else self._previous
+        if( keyframe ):
+            self._keyframes.append( self._file.tell() )
+
+        # fruits of the previous frame still there
+        sorter = np.argsort( ids )
+        pos = np.minimum( np.searchsorted( ids[sorter], prev.ids ), max(len(ids) - 1, 0) )
+        kept = ( ids[sorter[pos]] == prev.ids ) if len(ids) else np.zeros( len(prev), dtype=bool )
+        rows = sorter[pos[kept]]
+        delta = q[:, rows] - prev.q[:, kept]
+        delta[2] = (delta[2] + 32768) % 65536 - 32768     # shortest turn
+        # a move too long for int16 (a fruit teleported): removed and added again
+        too_far = np.any( np.abs(delta) > 32767, axis=0 )
+        kept[ np.flatnonzero(kept)[too_far] ] = False
+        (rows, delta) = ( rows[~too_far], delta[:, ~too_far] )
+        added = np.ones( len(ids), dtype=bool )
+        added[rows] = False
+        added = np.flatnonzero( added )
+        removed = np.flatnonzero( ~kept )
+        moved = np.flatnonzero( np.any( delta != 0, axis=0 ) )
+
+        f = self._file
+        f.write( _FRAME.pack( int(keyframe), int(score), len(removed), len(added), len(moved) ) )
+        f.write( removed.astype('<u2').tobytes() )
+        f.write( ids[added].astype('<u4').tobytes() )
+        f.write( kinds[added].tobytes() )
+        f.write( q[0, added].astype('<i4').tobytes() )
+        f.write( q[1, added].astype('<i4').tobytes() )
+        f.write( q[2, added].astype('<u2').tobytes() )
+        f.write( moved.astype('<u2').tobytes() )
+        f.write( delta[:, moved].astype('<i2').tobytes() )
+
+        # the next frame is coded from this one, in the order of the reader
+        state = FrameState()
+        state.ids = np.concatenate( [ ids[rows], ids[added] ] )
+        state.kinds = np.concatenate( [ kinds[rows], kinds[added] ] )
+        state.q = np.concatenate( [ q[:, rows], q[:, added] ], axis=1 )
+        self._previous = state
+        self._header[3] += 1
+
+    def close(self):
+        self._header[7] = self._file.tell()
+        self._file.write( np.array( self._keyframes, dtype='<u8' ).tobytes() )
+        self._file.seek(0)
+        self._file.write( _HEADER.pack(*self._header) )
+        self._file.close()
+
+
+class FrameFile(object):
+    """ Reads a frames file through mmap
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+        (magic, version, self.keyframe_every, self._frames, self.width, self.height,
+         self.seed, index) = _HEADER.unpack_from( self._mm )
+        if( magic != MAGIC or version != VERSION ):
+            raise ValueError( f"{path}: not a frames file (version {VERSION})" )
+        nb_keyframes = (self._frames + self.keyframe_every - 1) // self.keyframe_every
+        self._keyframes = np.frombuffer( self._mm, dtype='<u8', count=nb_keyframes, offset=index )
+        self._state = FrameState()
+        self._offset = 0        # of the frame after self._state
+
+    def __len__(self):
+        return self._frames
+
+    def close(self):
+        # the map cannot close while arrays view it: the states only hold copies
+        self._keyframes = self._state = None
+        self._mm.close()
+
+    def _array(self, dtype, n):
+        a = np.frombuffer( self._mm, dtype=dtype, count=n, offset=self._offset )
+        self._offset += a.nbytes
+        return a
+
+    def _apply(self, state):
+        """ Decodes the frame at self._offset into state """
+        (keyframe, state.score, nb_removed, nb_added, nb_moved) = _FRAME.unpack_from( self._mm, self._offset )
+        self._offset += _FRAME.size
+        removed = self._array( '<u2', nb_removed )
+        ids = self._array( '<u4', nb_added )
+        kinds = self._array( 'u1', nb_added )
+        q = np.stack( [ self._array('<i4', nb_added), self._array('<i4', nb_added),
+                        self._array('<u2', nb_added).astype(np.int32) ] )
+        moved = self._array( '<u2', nb_moved )
+        delta = self._array( '<i2', 3 * nb_moved ).reshape( 3, nb_moved )
+        if( keyframe ):
+            # copies: the states returned must outlive the map, see close()
+            state.ids, state.kinds, state.q = ids.copy(), kinds.copy(), q
+            state.frame += 1
+            return
+        if( nb_removed ):
+            keep = np.ones( len(state), dtype=bool )
+            keep[removed] = False
+            state.ids, state.kinds, state.q = state.ids[keep], state.kinds[keep], state.q[:, keep]
+        if( nb_moved ):
+            state.q = state.q.copy()
+            state.q[:, moved] += delta
+            state.q[2, moved] %= 65536
+        if( nb_added ):
+            state.ids = np.concatenate( [state.ids, ids] )
+            state.kinds = np.concatenate( [state.kinds, kinds] )
+            state.q = np.concatenate( [state.q, q], axis=1 )
+        state.frame += 1
+
+    def seek(self, frame):
+        """ FrameState of a frame (clamped to the file), a new one at each
+        call. The following frames are read from there by next().
+        """
+        frame = min( max(frame, 0), self._frames - 1 )
+        state = self._state
+        # from the current frame when it is on the way, else from the keyframe
+        if( not (state.frame <= frame < (state.frame // self.keyframe_every + 1) * self.keyframe_every) ):
+            k = frame // self.keyframe_every
+            self._offset = int( self._keyframes[k] )
+            state = self._state = FrameState()
+            state.frame = k * self.keyframe_every - 1
+        while( state.frame < frame ):
+            self._apply(state)
+        return state.copy()
+
+    def next(self):
+        """ FrameState of the frame after the last one read, None at the end
+        """
+        if( self._state.frame + 1 >= self._frames ):
+            return None
+        return self.seek( self._state.frame + 1 )
+
+
+def bake(log, path, keyframe_every=REPLAY_KEYFRAME_EVERY):
+    """ Replays a replay.ReplayLog and writes its frames file.
+    Returns the GameCore at the end of the game.
+    """
+    writer = FrameWriter( path, log.width, log.height, log.seed, keyframe_every )
+    def capture(game):
+        store = game.fruits.store
+        writer.add( store.ids, store.kinds, store.x, store.y, store.angle, game.score )
+    try:
+        return replay.replay( log, on_step=capture )
+    finally:
+        writer.close()
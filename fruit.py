@@ -1,7 +1,8 @@
-import random
+import math, random, collections
 
-import pyglet as pg
+import numpy as np
 import pymunk as pm
+import pymunk.batch
 
 from constants import *
 import utils
@@ -123,29 +124,48 @@ g_valid_transitions = {
 }
 
 
-def random_kind():
-    return random.choice( _FRUITS_RANDOM )
+def random_kind(rng=random):
+    """ kind of a new fruit, drawn from rng (the random module or a random.Random)
+    """
+    return rng.choice( _FRUITS_RANDOM )
 
 def name_from_kind(kind):
     return _FRUITS_DEF[kind]["name"]
 
+def radius_from_kind(kind):
+    return _FRUITS_DEF[kind]["radius"]
+
+# radius of each kind, index 0 unused
+RADII = np.array( [0] + [ d['radius'] for d in _FRUITS_DEF[1:] ], dtype=np.float64 )
+
+# mode of the rows of a FruitStore, the fruits in play are 1..3
+MODE_CODES = {
+    MODE_WAIT: 0,
+    MODE_FIRST_DROP: 1,
+    MODE_NORMAL: 2,
+    MODE_DRAG: 3,
+    MODE_MERGE: 4,
+    MODE_REMOVED: 5,
+}
+
 
 class AnimatedCircle( pm.Circle ):
-    def __init__(self, **kwargs ):
+    def __init__(self, clock, **kwargs ):
         super().__init__(**kwargs)
+        self._clock = clock
         self._grow_start = None
         self._radius_ref = self.radius
     
     def grow_start( self ):
         """Starts an animation that varies the radius over time."""
         if( self._grow_start is None ):
-            self._grow_start = utils.now()
+            self._grow_start = self._clock.time()
 
     def update_animation(self):
         """Modifies the radius of the circle."""
         if( not self._grow_start ):
             return
-        t = utils.now()-self._grow_start
+        t = self._clock.time()-self._grow_start
         x = t * (1-FADE_SIZE)/ FADEIN_DELAY + FADE_SIZE
         self.unsafe_set_radius( self._radius_ref * min(1, x) )
         if( x > 1 ):
@@ -153,7 +173,8 @@ class AnimatedCircle( pm.Circle ):
 
 
 class Fruit( object ):
-    def __init__(self, space, position, on_remove=None, kind=0, mode=MODE_WAIT):
+    def __init__(self, space, position, on_remove=None, kind=0, mode=MODE_WAIT, clock=None, headless=False,
+                 keep_resources=False):
         # Random species if not specified  
         assert kind<=nb_fruits(), "Unknown fruit type"  
         assert position
@@ -164,7 +185,12 @@ class Fruit( object ):
         self._id = _get_new_id()
         self._kind = kind
         self._space = space
+        self._clock = clock or utils.get_clock()
+        self._headless = headless
         self._on_remove = on_remove
+        # removed fruit parked in a FruitPool with its pymunk objects and sprite
+        self._keep_resources = keep_resources
+        self._pooled = False
         self._body, self._shape = self._make_shape(
             radius=fruit_def['radius'],
             mass=fruit_def['mass'], 
@@ -172,23 +198,26 @@ class Fruit( object ):
         self._shape.collision_type = kind
         space.add(self._body, self._shape)
 
-        self._sprites = { 
-            SPRITE_MAIN : FruitSprite( 
+        self._sprites = {}
+        if( not headless ):
+            self._sprites[SPRITE_MAIN] = FruitSprite( 
                 nom=fruit_def['name'], 
                 r=fruit_def['radius'] )
-        }
         self._fruit_mode = None
         self._dash_start_time = None
         self._drag_offset = None
+        # sprites up to date with a sleeping body, update() has nothing to do
+        self._idle = False
         self._set_mode( mode )
         #print( f"{self} created" )
 
 
     def __del__(self):
-        assert(    self._body is None 
-               and self._shape is None 
-               and len(self._sprites)==0
-               and self._fruit_mode == MODE_REMOVED), "Resources not released"
+        released = (    self._body is None 
+                    and self._shape is None 
+                    and len(self._sprites)==0 )
+        # removed fruits of a FruitPool are parked, out of the space
+        assert( (released or self._keep_resources) and self._fruit_mode == MODE_REMOVED ), "Resources not released"
 
 
     def __repr__(self):
@@ -199,7 +228,7 @@ class Fruit( object ):
         """Creates the pymunk body/shape for the physics simulation."""
         body = pm.Body(body_type = pm.Body.KINEMATIC)
         body.position = position
-        shape = AnimatedCircle(body=body, radius=radius)
+        shape = AnimatedCircle(body=body, radius=radius, clock=self._clock)
         shape.mass = mass
         shape.friction = FRICTION
         shape.elasticity = ELASTICITY_FRUIT
@@ -213,7 +242,9 @@ class Fruit( object ):
             print( f"WARNING: {self} delete() called with mode different from MODE_REMOVED ({self._fruit_mode})" )
         # remove pymunk objects and local references
         if( self._body or self._shape):
-            self._space.remove( self._body, self._shape )
+            # parked fruits are already out of the space
+            if( self._body.space is not None ):
+                self._space.remove( self._body, self._shape )
             self._body = self._shape = None
         for k,sprite in self._sprites.items():
             sprite.delete()
@@ -249,6 +280,12 @@ class Fruit( object ):
     @property
     def removed(self):
         return self._fruit_mode == MODE_REMOVED
+
+    @property
+    def in_play(self):
+        """ fruit lying or falling in the bocal (not waiting, merging or removed)
+        """
+        return self._fruit_mode in (MODE_NORMAL, MODE_FIRST_DROP, MODE_DRAG)
     
     @property
     def position(self):
@@ -280,9 +317,13 @@ class Fruit( object ):
             return
 
         self._fruit_mode = mode
+        self._idle = False
         attrs = _FRUIT_MODES[self._fruit_mode]
 
         # DYNAMIC or KINEMATIC  
+        # (pymunk leaves a sleeping body asleep when its type changes: wake it first)
+        if( self._body.is_sleeping ):
+            self._body.activate()
         self._body.body_type = attrs[BODY_TYPE]
 
         # Sprites visibility  
@@ -295,19 +336,39 @@ class Fruit( object ):
             mask = attrs[COLLISION_MASK] | CAT_WALLS )  # collision systematique avec les murs
 
 
-    def update(self):
-        """Updates the fruit's sprite based on the physics simulation and other factors."""
+    def _is_animated(self):
+        return ( self._shape._grow_start is not None
+                 or any( s.animated for s in self._sprites.values() ) )
+
+    def update(self, x=None, y=None, angle=None):
+        """Updates the fruit's sprite based on the physics simulation and other factors.
+        x, y, angle: body state when already known (FruitStore), else read from pymunk
+        A sleeping fruit without animation is skipped once its sprites show
+        where it fell asleep: pymunk wakes the body when something touches
+        or moves it, and the next update() draws it again.
+        """
         if( self.removed or self._is_deleted() ):
             return
-        (x, y) = self._body.position
-        degres = -180/3.1416 * self._body.angle  # pymunk and pyglet have opposite rotation directions  
+        sleeping = self._body.is_sleeping
+        if( sleeping and self._idle ):
+            return
+        if( x is None ):
+            (x, y) = self._body.position
+            angle = self._body.angle
+        degres = -180/3.1416 * angle  # pymunk and pyglet have opposite rotation directions  
         for s in self._sprites.values():
             s.update( x=x, y=y, rotation=degres, on_animation_stop=None )
         self._shape.update_animation()
+        # idle once drawn at the body position, not at an interpolated one
+        self._idle = ( sleeping and (x, y) == self._body.position
+                       and angle == self._body.angle and not self._is_animated() )
 
 
 
     def blink(self, activate, delay=0):
+        if( SPRITE_MAIN not in self._sprites ):
+            return
+        self._idle = False
         if(not activate):
             self._sprites[SPRITE_MAIN].blink = False
         elif( not self._sprites[SPRITE_MAIN].blink ):
@@ -333,8 +394,9 @@ class Fruit( object ):
             return
         #print( f"{self}.fade_in()")
         self.normal()
-        self._sprites[SPRITE_MAIN].fadein = True
-        self._shape.grow_start()
+        if( SPRITE_MAIN in self._sprites ):
+            self._sprites[SPRITE_MAIN].fadein = True
+            self._shape.grow_start()    # animated by update(), which headless games never call
 
 
     def fade_out(self):
@@ -365,7 +427,7 @@ class Fruit( object ):
             return
         self._set_mode( MODE_MERGE )  # No more collisions with fruits  
         self.set_velocity_to(dest, delay=MERGE_DELAY)
-        pg.clock.schedule_once(lambda dt : self.remove(), delay=MERGE_DELAY )
+        self._clock.schedule_once( self._remove_due, MERGE_DELAY, self._id )
 
 
     def set_velocity_to(self, dest, delay):
@@ -381,9 +443,13 @@ class Fruit( object ):
         if( self._fruit_mode in [MODE_MERGE, MODE_REMOVED] ):
             return
         self._set_mode(MODE_MERGE)
+        # removal follows the simulation time, not the end of the animation
+        self._clock.schedule_once( self._remove_due, EXPLOSION_DELAY, self._id )
+        if( SPRITE_MAIN not in self._sprites ):
+            return
         explo = ExplosionSprite( 
             r=self._shape.radius, 
-            on_explosion_end=self.remove)
+            on_explosion_end=None)
         explo.position = ( *self._body.position, 1)
         self._sprites[SPRITE_EXPLOSION] = explo
         self._sprites[SPRITE_MAIN].fadeout = True
@@ -401,34 +467,410 @@ class Fruit( object ):
         if(self._on_remove ):
             self._on_remove( self )
         self._set_mode(MODE_REMOVED)
-        self.release_ressources()
+        self._release()
+
+    def _remove_due(self, dt, id):
+        # id: the fruit may have been reused by a FruitPool since
+        if( id == self._id and not self.removed ):
+            self.remove()
+
+    def discard(self):
+        """ Removes the fruit without counting its points (see ActiveFruits.restore)
+        """
+        self._set_mode(MODE_REMOVED)
+        self._release()
+
+    def _release(self):
+        if( self._keep_resources ):
+            self.park()
+        else:
+            self.release_ressources()
+
+    ############ pool ############
+
+    def park(self):
+        """ Takes a removed fruit out of the space, keeping its pymunk
+        objects and its (hidden) sprite for reinit()
+        """
+        if( self._body.space is not None ):
+            self._space.remove( self._body, self._shape )
+        explo = self._sprites.pop( SPRITE_EXPLOSION, None )
+        if( explo ):
+            explo.delete()
+
+    def reinit(self, position, mode=MODE_WAIT):
+        """ Brings a parked fruit back as a new one of the same kind
+        """
+        self._id = _get_new_id()
+        b = self._body
+        b.position = position
+        b.velocity = (0, 0)
+        b.angle = 0
+        b.angular_velocity = 0
+        b.force = (0, 0)
+        b.torque = 0
+        self._shape.unsafe_set_radius( self._shape._radius_ref )
+        self._shape._grow_start = None
+        self._shape.collision_type = self._kind
+        self._space.add( b, self._shape )
+        for s in self._sprites.values():
+            s.reset_animations()
+        self._dash_start_time = None
+        self._drag_offset = None
+        self._fruit_mode = None     # _set_mode() ignores removed fruits
+        self._set_mode( mode )
+        self.update()
+
+    ############ snapshot ############
+
+    def snapshot(self):
+        """ Body state, one row of ActiveFruits.snapshot():
+        (x, y, vx, vy, angle, angular_velocity, radius, grow_start or nan)
+        """
+        b = self._body
+        grow = self._shape._grow_start
+        return ( *b.position, *b.velocity, b.angle, b.angular_velocity,
+                 self._shape.radius, math.nan if grow is None else grow )
+
+    def detach(self):
+        """ Takes the body out of the space, restore() adds it back
+        """
+        if( self._body and self._body.space is not None ):
+            self._space.remove( self._body, self._shape )
+
+    def restore(self, mode, collision_type, state, id=None):
+        """ Puts back a state from snapshot(), the fruit must be detached.
+        A fruit removed since the snapshot gets new pymunk objects, or
+        its parked ones back. id: the one it had, if reused since.
+        """
+        (x, y, vx, vy, angle, w, radius, grow) = state
+        if( id is not None ):
+            self._id = id
+        if( self.removed and self._body is not None ):
+            for s in self._sprites.values():
+                s.reset_animations()
+        if( self._body is None ):
+            fruit_def = _FRUITS_DEF[self._kind]
+            self._body, self._shape = self._make_shape(
+                radius=fruit_def['radius'],
+                mass=fruit_def['mass'],
+                position=(x, y))
+            if( not self._headless ):
+                self._sprites[SPRITE_MAIN] = FruitSprite(
+                    nom=fruit_def['name'],
+                    r=fruit_def['radius'] )
+        self._fruit_mode = None     # _set_mode() ignores removed fruits
+        self._set_mode( mode )
+        self._shape.collision_type = collision_type
+        self._body.position = (x, y)
+        self._body.velocity = (vx, vy)
+        self._body.angle = angle
+        self._body.angular_velocity = w
+        self._shape.unsafe_set_radius( radius )
+        self._shape._grow_start = None if math.isnan(grow) else grow
+        self._space.add( self._body, self._shape )
+
+
+class FruitPool(object):
+    """ Removed fruits parked by kind, with their pymunk objects and sprites,
+    handed back to ActiveFruits instead of building new ones
+    """
+    def __init__(self):
+        self._parked = collections.defaultdict(list)
+        self.hits = 0       # fruits reused
+        self.misses = 0     # fruits built, none of their kind was parked
+
+    def __len__(self):
+        return sum( len(l) for l in self._parked.values() )
+
+    def acquire(self, kind):
+        """ A parked fruit of this kind, None if there is none
+        """
+        parked = self._parked[kind]
+        if( not parked ):
+            self.misses += 1
+            return None
+        self.hits += 1
+        f = parked.pop()
+        f._pooled = False
+        return f
+
+    def release(self, fruit):
+        """ Parks a removed fruit
+        """
+        if( fruit._pooled ):
+            return
+        fruit.park()
+        fruit._pooled = True
+        self._parked[fruit.kind].append( fruit )
+
+    def withdraw(self, fruit):
+        """ Takes back a parked fruit revived by ActiveFruits.restore()
+        """
+        if( fruit._pooled ):
+            self._parked[fruit.kind].remove( fruit )
+            fruit._pooled = False
+
+    def clear(self):
+        """ Releases the resources of the parked fruits
+        """
+        for parked in self._parked.values():
+            for f in parked:
+                f._pooled = False
+                f.release_ressources()
+        self._parked.clear()
+
+    def stats(self):
+        return { 'hits': self.hits, 'misses': self.misses, 'parked': len(self) }
+
+
+class FruitStore(object):
+    """ Struct-of-arrays mirror of the fruits of an ActiveFruits, for bulk
+    queries without going through each Fruit and its pymunk wrappers.
+    Row i describes fruits[i]; positions are in the world frame.
+
+    The bodies are read in a single pymunk.batch call by refresh(), which
+    ActiveFruits.store does at most once per physics step, when read.
+    """
+    _FIELDS = ( pm.batch.BodyFields.BODY_ID | pm.batch.BodyFields.POSITION
+                | pm.batch.BodyFields.ANGLE | pm.batch.BodyFields.VELOCITY )
+
+    def __init__(self, space):
+        self._space = space
+        self._buffer = pm.batch.Buffer()
+        self._set_fruits( [] )
+        self._stale = True
+
+    def __len__(self):
+        return len(self.fruits)
+
+    @property
+    def is_stale(self):
+        return self._stale or self._dirty
+
+    def expire(self):
+        """ The bodies moved (physics step): values are read again at the next refresh()
+        """
+        self._stale = True
+
+    def invalidate(self):
+        """ The set of fruits changed: rows are rebuilt at the next refresh()
+        """
+        self._dirty = True
+
+    def _set_fruits(self, fruits):
+        n = len(fruits)
+        self.fruits = fruits
+        self.ids = np.array( [ f._id for f in fruits ], dtype=np.int64 )
+        self.kinds = np.array( [ f._kind for f in fruits ], dtype=np.int64 )
+        self.modes = np.zeros( n, dtype=np.int8 )
+        self.radius = RADII[self.kinds]
+        # x, y, angle, vx, vy: the layout of the batch results
+        self._bodies = np.zeros( (n, 5) )
+        (self.x, self.y, self.angle, self.vx, self.vy) = self._bodies.T
+        # rows of the bodies, sorted by body id to match the batch results
+        body_ids = np.array( [ f._body.id if f._body else 0 for f in fruits ], dtype=np.uintp )
+        self._sorter = np.argsort( body_ids )
+        self._sorted_ids = body_ids[self._sorter]
+        self._batch_ids = None      # body order of the last batch, and its match
+        self._dirty = False
+
+    def _match(self, body_ids):
+        """ (rows, indices in the batch) of the fruits found in the batch
+        """
+        n = len(self.fruits)
+        pos = np.minimum( np.searchsorted(self._sorted_ids, body_ids), n - 1 )
+        found = self._sorted_ids[pos] == body_ids
+        return self._sorter[ pos[found] ], np.flatnonzero( found )
+
+    def refresh(self, fruits):
+        """ Reads the state of the fruits (the values of ActiveFruits._fruits)
+        """
+        if( self._dirty ):
+            self._set_fruits( list(fruits) )
+        self._stale = False
+        n = len(self.fruits)
+        if( not n ):
+            return
+        # what pymunk.batch does not give: modes, and radii while growing
+        fruits = self.fruits
+        self.modes[:] = [ MODE_CODES[f._fruit_mode] for f in fruits ]
+        self.radius[:] = RADII[self.kinds]
+        for i in [ i for i, f in enumerate(fruits) if f._shape is not None and f._shape._grow_start is not None ]:
+            self.radius[i] = fruits[i]._shape.radius
+
+        buffer = self._buffer
+        buffer.clear()
+        pm.batch.get_space_bodies( self._space, self._FIELDS, buffer )
+        body_ids = np.frombuffer( buffer.int_buf(), dtype=np.uintp )
+        data = np.frombuffer( buffer.float_buf(), dtype=np.float64 ).reshape( -1, 5 )
+        # the space also holds the bocal and the waiting fruit; its body
+        # order only changes when bodies are added or removed
+        key = body_ids.tobytes()
+        if( key != self._batch_ids ):
+            self._batch_ids = key
+            self._rows, self._found = self._match( body_ids )
+        self._bodies[self._rows] = data[self._found]
+
+    ############ queries ############
+
+    @property
+    def positions(self):
+        return np.stack( [self.x, self.y], axis=1 )
+
+    def in_play(self):
+        """ mask of the fruits lying or falling in the bocal (Fruit.in_play)
+        """
+        return (self.modes >= MODE_CODES[MODE_FIRST_DROP]) & (self.modes <= MODE_CODES[MODE_DRAG])
+
+    def speeds(self):
+        return np.hypot( self.vx, self.vy )
+
+    def tops(self):
+        return self.y + self.radius
+
+    def max_height(self):
+        """ height of the highest fruit top in play, None if there is none
+        """
+        mask = self.in_play()
+        if( not mask.any() ):
+            return None
+        return float( self.tops()[mask].max() )
+
+    def above(self, y):
+        """ fruits in play whose top is above height y
+        """
+        rows = np.flatnonzero( self.in_play() & (self.tops() > y) )
+        return [ self.fruits[i] for i in rows ]
+
+    def kind_counts(self):
+        """ number of fruits in play of each kind (index 0 unused)
+        """
+        return np.bincount( self.kinds[self.in_play()], minlength=nb_fruits()+1 )
+
+    def nearest_same_kind(self):
+        """ For each row, the row of the closest fruit in play of the same
+        kind (-1 if none) and the gap between their edges (negative when
+        they overlap, inf if none)
+        """
+        n = len(self.fruits)
+        mask = self.in_play()
+        gaps = ( np.hypot( self.x[:, None] - self.x[None, :], self.y[:, None] - self.y[None, :] )
+                 - self.radius[:, None] - self.radius[None, :] )
+        valid = (self.kinds[:, None] == self.kinds[None, :]) & mask[:, None] & mask[None, :]
+        np.fill_diagonal( valid, False )
+        gaps[~valid] = np.inf
+        if( not n ):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        nearest = np.argmin( gaps, axis=1 )
+        gaps = gaps[ np.arange(n), nearest ]
+        nearest[ np.isinf(gaps) ] = -1
+        return nearest, gaps
+
+    def offscreen(self, y_min=-WINDOW_HEIGHT):
+        """ fruits not removed that fell below y_min
+        """
+        rows = np.flatnonzero( (self.modes != MODE_CODES[MODE_REMOVED]) & (self.y < y_min) )
+        return [ self.fruits[i] for i in rows ]
 
 
 class ActiveFruits(object):
 
-    def __init__(self, space, width, height):
+    def __init__(self, space, width, height, clock=None, headless=False):
         self._space = space
+        self._clock = clock or utils.get_clock()
+        self._headless = headless
+        self._pool = FruitPool()
+        self._store = FruitStore( space )
         self._fruits = dict()
         self._score = 0
         self._next_fruit = None
         self._window_size = ( width, height )
         self._is_gameover = False
+        self._previous = None       # (sorted ids, x/y/angle rows) from keep_previous()
 
     def __len__(self):
         return len(self._fruits)
 
+    @property
+    def score(self):
+        return self._score
+
+    @property
+    def pool(self):
+        return self._pool
+
+    @property
+    def store(self):
+        """ FruitStore of the fruits, up to date with the last physics step
+        """
+        if( self._store.is_stale ):
+            self._store.refresh( self._fruits.values() )
+        return self._store
+
+    def expire_store(self):
+        """ Called after each physics step
+        """
+        self._store.expire()
+
     def reset(self):
         self._is_gameover = False
+        # pending removals of the fruits and final explosions
+        owners = set( self._fruits.values() )
+        owners.add( self )
+        self._clock.unschedule_owners( owners )
         self.remove_all()
         self.remove_next()
+        self._previous = None
         self._score = 0
-        pg.clock.unschedule( self.explose_seq )
 
-    def update(self):
+    def close(self):
+        """ Releases the resources of all the fruits, parked ones included:
+        to call before dropping an ActiveFruits still in play
+        """
+        self.reset()
+        self._pool.clear()
+
+    def keep_previous(self):
+        """ Keeps the state of the fruits before a physics step, that
+        update() interpolates from
+        """
+        store = self.store
+        order = np.argsort( store.ids )
+        self._previous = ( store.ids[order], store._bodies[order, :3].T.copy() )
+
+    def _interpolate(self, store, alpha):
+        """ x, y, angle rows between the kept state and the current one,
+        the current one for the fruits that were not there
+        """
+        current = store._bodies[:, :3].T
+        (ids, previous) = self._previous
+        if( not len(ids) ):
+            return current
+        pos = np.minimum( np.searchsorted(ids, store.ids), len(ids) - 1 )
+        start = np.where( ids[pos] == store.ids, previous[:, pos], current )
+        return start + alpha * (current - start)
+
+    def update(self, alpha=1.0):
+        """ Moves the sprites to the bodies, or between their state at
+        keep_previous() and the current one: alpha 0 is the former, 1 the latter
+        """
         if( self._next_fruit ):
             self._next_fruit.update()
-        for f in self._fruits.values():
-            f.update()
+        store = self.store
+        if( alpha < 1 and self._previous is not None ):
+            (xs, ys, angles) = self._interpolate( store, alpha )
+        else:
+            (xs, ys, angles) = (store.x, store.y, store.angle)
+        for f, x, y, angle in zip(store.fruits, xs, ys, angles):
+            f.update( x, y, angle )
+
+    def is_settled(self, speed=SETTLE_SPEED):
+        """ True when all fruits are in MODE_NORMAL and slower than speed
+        """
+        store = self.store
+        return bool( np.all( store.modes == MODE_CODES[MODE_NORMAL] )
+                     and np.all( store.speeds() < speed ) )
 
     def prepare_next(self, kind):
         """Creates a fruit waiting to be dropped."""
@@ -436,12 +878,26 @@ class ActiveFruits(object):
         if( self._next_fruit ):
             print(("next_fruit already present"))
             return
-        self._next_fruit = Fruit(space=self._space,
-                                 kind=kind, 
-                                 position=self._next_position(),
-                                 on_remove=self.on_remove)
+        self._next_fruit = self._new_fruit( kind, self._next_position() )
         # self.add() appelé dans play_next()
 
+    def _new_fruit(self, kind, position):
+        """ Fruit in MODE_WAIT, a parked one of this kind if there is one
+        """
+        if( kind<=0 ):
+            kind = random_kind()
+        f = self._pool.acquire( kind )
+        if( f is None ):
+            return Fruit(space=self._space,
+                         kind=kind,
+                         position=position,
+                         on_remove=self.on_remove,
+                         clock=self._clock,
+                         headless=self._headless,
+                         keep_resources=True)
+        f.reinit( position )
+        return f
+
     def drop_next(self, position):
         if( (not self._next_fruit) or self._is_gameover ):
             return
@@ -464,62 +920,155 @@ class ActiveFruits(object):
         points = 0
         for id in self._fruits:
             points += self.remove(id)
-        self.cleanup()
+        self.cleanup(all_fruits=True)
         return points
 
     def remove_next(self):
         if( self._next_fruit ):
             self._next_fruit.remove()
+            self._pool.release( self._next_fruit )
             self._next_fruit = None
 
 
     def spawn(self, kind, position):
-        f =  Fruit( space=self._space,
-                    kind=kind,
-                    position=position,
-                    on_remove=self.on_remove)
+        f = self._new_fruit( kind, position )
         self.add(f)
         f.fade_in()
         return f
 
     def on_remove(self, f):
         self._score += f.points
+        # its mode changed: the store reads the modes again
+        self._store.expire()
 
     def explose_seq(self, dt):
         """Makes the fruits explode, starting with the most recent one."""  
-        # Searches for the oldest non-exploded fruit  
-        explosables = [ i for i,f in self._fruits.items() if f._fruit_mode in [MODE_NORMAL, MODE_FIRST_DROP] ]
-        if( explosables ):
-            explosables.sort(reverse=True )
-            self._fruits[explosables[0]].explose()
+        # Searches for the most recent non-exploded fruit  
+        store = self.store
+        explosables = ( (store.modes == MODE_CODES[MODE_NORMAL])
+                        | (store.modes == MODE_CODES[MODE_FIRST_DROP]) )
+        if( explosables.any() ):
+            store.fruits[ np.argmax( np.where(explosables, store.ids, -1) ) ].explose()
         # Finds the oldest non-exploded fruit  
         # Continues as long as there are fruits remaining  
         if( self._fruits ):
-            pg.clock.schedule_once( self.explose_seq, GAMEOVER_ANIMATION_INTERVAL )
+            self._clock.schedule_once( self.explose_seq, GAMEOVER_ANIMATION_INTERVAL )
 
     def gameover(self):
         self._is_gameover = True
         self.remove_next()
         # program the explosion of remaining fruits
         print( f'Programming final explosion for {len(self._fruits)} active fruits')
-        pg.clock.schedule_once( self.explose_seq, GAMEOVER_ANIMATION_START)
+        self._clock.schedule_once( self.explose_seq, GAMEOVER_ANIMATION_START)
 
     def add(self, newfruit):
         self._fruits[ newfruit.id ] = newfruit
+        self._store.invalidate()
+
+    def snapshot(self):
+        """ Struct-of-arrays copy of the fruits, the waiting one last.
+        The Fruit objects are kept: restore() revives them, so the removals
+        they scheduled on the clock remain valid.
+        """
+        fruits = list(self._fruits.values())
+        if( self._next_fruit ):
+            fruits.append( self._next_fruit )
+        return {
+            'fruits': fruits,
+            'ids': [ f.id for f in fruits ],
+            'has_next': self._next_fruit is not None,
+            'modes': [ f._fruit_mode for f in fruits ],
+            'collision_types': np.array( [ f._shape.collision_type for f in fruits ], dtype=np.int64 ),
+            'bodies': np.array( [ f.snapshot() for f in fruits ], dtype=np.float64 ).reshape( len(fruits), 8 ),
+            'score': self._score,
+            'is_gameover': self._is_gameover,
+        }
+
+    def export_board(self):
+        """ Picklable copy of the fruits in play and of the waiting kind,
+        to rebuild the board in another process with load_board()
+        """
+        fruits = [ f for f in self._fruits.values() if f.in_play ]
+        return {
+            'kinds': np.array( [ f.kind for f in fruits ], dtype=np.int64 ),
+            'modes': [ f._fruit_mode for f in fruits ],
+            'collision_types': np.array( [ f._shape.collision_type for f in fruits ], dtype=np.int64 ),
+            'bodies': np.array( [ f.snapshot() for f in fruits ], dtype=np.float64 ).reshape( len(fruits), 8 ),
+            'next': self._next_fruit.kind if self._next_fruit else 0,
+            'score': self._score,
+        }
+
+    def load_board(self, board):
+        """ Replaces the fruits by those of export_board()
+        """
+        self._is_gameover = False
+        self.remove_all()
+        self.remove_next()
+        for kind, mode, ctype, row in zip(board['kinds'], board['modes'],
+                                          board['collision_types'], board['bodies']):
+            f = self._new_fruit( int(kind), (row[0], row[1]) )
+            f.detach()
+            f.restore( mode, int(ctype), row.tolist() )
+            self.add(f)
+        if( board['next'] ):
+            self.prepare_next( kind=board['next'] )
+        self._score = board['score']
+
+    def restore(self, state):
+        """ Puts back the fruits of snapshot(), in the same order.
+        Fruits created since are discarded, all bodies are added to the
+        space again so that the contact caches are rebuilt the same way.
+        Fruits of the snapshot parked since are taken back from the pool.
+        """
+        fruits = state['fruits']
+        kept = set(fruits)
+        current = list(self._fruits.values())
+        if( self._next_fruit ):
+            current.append( self._next_fruit )
+        for f in current:
+            if( f in kept ):
+                f.detach()
+            else:
+                f.discard()
+                self._pool.release( f )
+        for f, id, mode, ctype, row in zip(fruits, state['ids'], state['modes'],
+                                           state['collision_types'], state['bodies']):
+            self._pool.withdraw( f )
+            f.restore( mode, int(ctype), row.tolist(), id=id )
+
+        if( state['has_next'] ):
+            self._next_fruit = fruits[-1]
+            fruits = fruits[:-1]
+        else:
+            self._next_fruit = None
+        self._fruits = { f.id: f for f in fruits }
+        self._store.invalidate()
+        self._previous = None
+        self._score = state['score']
+        self._is_gameover = state['is_gameover']
 
     def cleanup(self, all_fruits=False):
         """ garbage collection 
         """
         # remove fruits that have left the game
-        for f in self._fruits.values():
-            if not f.removed and f.is_offscreen():
-                print( f"WARNING: {f} has left the game" )
-                f.remove()
-
-        # Removes references to REMOVED fruits (for garbage collection)  
-        removed = [f.id for f in self._fruits.values() if (all_fruits or f.removed) ]
-        for id in removed:
-            del self._fruits[id]        # should trigger fruit.__del__()
+        store = self.store
+        offscreen = store.offscreen()
+        for f in offscreen:
+            print( f"WARNING: {f} has left the game" )
+            f.remove()
+
+        # Parks the REMOVED fruits for reuse, found in the store rows
+        if( all_fruits ):
+            removed = list( self._fruits.values() )
+        else:
+            rows = np.flatnonzero( store.modes == MODE_CODES[MODE_REMOVED] )
+            removed = [ store.fruits[i] for i in rows ] + offscreen
+        for f in removed:
+            del self._fruits[f.id]
+            if( f.removed ):
+                self._pool.release( f )
+        if( removed ):
+            self._store.invalidate()
 
 
     def _next_position(self):
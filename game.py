@@ -0,0 +1,366 @@
+import collections, random, time
+
+import pymunk as pm
+
+from constants import *
+from bocal import Bocal
+from fruit import ActiveFruits
+from collision import CollisionHelper
+from preview import FruitQueue
+from profiler import get_profiler
+import utils
+
+
+# parts of GameCore.step(), see GameCore.time_phases()
+PHASES = ( 'bocal', 'space', 'collisions', 'clock', 'cleanup', 'overflow' )
+
+
+def _no_clock():
+    """ clock of the steps whose phases are not measured """
+    return 0.0
+
+
+# State of a GameCore, see GameCore.snapshot()
+GameSnapshot = collections.namedtuple( 'GameSnapshot',
+    ['clock', 'bocal', 'fruits', 'preview', 'collisions', 'countdown', 'is_gameover', 'random'] )
+
+
+def make_space(profile=PHYSICS_DISPLAY):
+    """ pymunk space set up with one of PHYSICS_PROFILES
+    """
+    p = PHYSICS_PROFILES[profile]
+    space = pm.Space( threaded=p['threads'] > 1 )
+    if( p['threads'] > 1 ):
+        space.threads = p['threads']
+    space.gravity = (0, GRAVITY)
+    space.iterations = p['iterations']
+    space.collision_slop = p['collision_slop']
+    space.sleep_time_threshold = p['sleep_time']
+    space.idle_speed_threshold = p['idle_speed']
+    if( p['spatial_hash'] ):
+        space.use_spatial_hash( *p['spatial_hash'] )   # before any shape is added
+    return space
+
+
+class GameCore(object):
+    """ Game rules and physics simulation of one board, without any window.
+    SuikaWindow renders a GameCore built with headless=False,
+    training and benchmarks drive headless ones directly.
+    profile: name of the physics settings, see PHYSICS_PROFILES
+    seed: of the random draws of the first game (fruit kinds, random drops),
+    see reset()
+    """
+    def __init__(self, width=WINDOW_WIDTH, height=WINDOW_HEIGHT, headless=True, profile=PHYSICS_DISPLAY,
+                 seed=None):
+        self._headless = headless
+        self._profile = profile
+        self._window_size = (width, height)
+        self._rng = random.Random()   # all the random draws of the game
+        self._seed = None
+        # all game timers and delays follow the simulation, not the wall clock
+        self._clock = utils.SimClock()
+        self._space = make_space( profile )
+        self._bocal = Bocal(space=self._space, clock=self._clock, headless=headless, rng=self._rng,
+                            **utils.bocal_coords(window_w=width, window_h=height))
+        self._preview = FruitQueue(cnt=PREVIEW_COUNT, headless=headless, rng=self._rng)
+        self._fruits = ActiveFruits(space=self._space, width=width, height=height,
+                                    clock=self._clock, headless=headless)
+        self._collision_helper = CollisionHelper(self._space, clock=self._clock)
+        self._countdown = utils.CountDown(clock=self._clock)
+        self._is_gameover = False
+        self._phase_times = None      # seconds spent in each of PHASES, see time_phases()
+        self._profiler = get_profiler()
+        self.on_gameover = None       # optional callback, e.g. to display the game over screen
+        self.recorder = None          # optional replay.ReplayRecorder of the current game
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        """ Starts a new game, its random draws seeded with seed in
+        range(0, 2**32) (a new seed drawn from the random module if None):
+        the same seed and the same drops at the same steps play the same fruits.
+        The physics is only bit-for-bit the same in a new GameCore: the
+        order of the pymunk internals depends on the past games.
+        """
+        if( seed is not None and not 0 <= seed < 2**32 ):
+            # the replay logs and frames files store it as a uint32
+            raise ValueError( f"game seed {seed} out of range(0, 2**32)" )
+        if( self.recorder ):
+            self.recorder.end(self)
+        self._seed = random.getrandbits(32) if seed is None else seed
+        self._rng.seed( self._seed )
+        self._is_gameover = False
+        self._bocal.reset()
+        self._preview.reset()
+        self._fruits.reset()
+        self._collision_helper.reset()
+        self._collision_helper.cancel_pending()
+        self._countdown.reset()
+        self.prepare_next()
+
+    def close(self):
+        """ Ends the game and releases its fruits, before dropping the GameCore
+        """
+        if( self.recorder ):
+            self.recorder.end(self)
+        self._fruits.close()
+        self._clock.clear()
+
+    @property
+    def seed(self):
+        """ seed of the current game
+        """
+        return self._seed
+
+    @property
+    def window_size(self):
+        """ size of the window the game was created for
+        """
+        return self._window_size
+
+    @property
+    def clock(self):
+        return self._clock
+
+    @property
+    def profile(self):
+        return self._profile
+
+    @property
+    def space(self):
+        return self._space
+
+    @property
+    def bocal(self):
+        return self._bocal
+
+    @property
+    def fruits(self):
+        return self._fruits
+
+    @property
+    def preview(self):
+        return self._preview
+
+    @property
+    def score(self):
+        return self._fruits.score
+
+    @property
+    def is_gameover(self):
+        return self._is_gameover
+
+    @property
+    def merges(self):
+        """ merges resolved since the creation of the game
+        """
+        return self._collision_helper.merges
+
+    @property
+    def phase_times(self):
+        return self._phase_times
+
+    def time_phases(self, enable=True):
+        """ Starts (from zero) or stops measuring the time spent in each
+        phase of step(), read in phase_times {phase: seconds}
+        """
+        self._phase_times = dict.fromkeys( PHASES, 0.0 ) if enable else None
+
+    @property
+    def maxline_count(self):
+        """ number of fruits touching the maxline, kept up to date by the collisions
+        """
+        return self._collision_helper.maxline_count
+
+    def prepare_next(self):
+        kind = self._preview.get_next_fruit()
+        self._fruits.prepare_next( kind=kind )
+
+    def drop(self, x=None, nb=1):
+        """ Drops the waiting fruit at abscissa x (random if x is None),
+        rounded to 1/DROP_RESOLUTION pixel.
+        Returns the number of fruits actually dropped
+        """
+        if( x is not None ):
+            x = round(x * DROP_RESOLUTION) / DROP_RESOLUTION
+        dropped = 0
+        for _ in range(nb):
+            next = self._fruits.peek_next()
+            if( not next or self._is_gameover ):
+                break
+            margin=next.radius + WALL_THICKNESS/2 + 1
+
+            if( x is None ):
+                pos = self._bocal.drop_point_random( margin=margin )
+            else:
+                pos = self._bocal.drop_point_cursor( x, margin=margin )
+
+            if( not pos ):            # pos==None if x is outside container
+                break
+            if( self.recorder ):
+                self.recorder.drop(self, x, next.kind)
+            self._fruits.drop_next(pos)
+            self.prepare_next()
+            dropped += 1
+        return dropped
+
+    def spawn_in_bocal(self, kind, bocal_coords):
+        position = self._bocal.to_world( bocal_coords )
+        self._fruits.spawn( kind, position )
+
+    def step(self, n=1):
+        """ Advances the simulation by n physics steps of PYMUNK_INTERVAL
+        """
+        if( self._phase_times is None and not self._profiler.enabled ):
+            for _ in range(n):
+                self._step_once( _no_clock )
+            return
+        for _ in range(n):
+            self._record_phases( self._step_once( time.perf_counter ) )
+
+    def _step_once(self, clock):
+        """ One physics step, returns the clock() times between its phases
+        (_no_clock when they are not measured)
+        """
+        t0 = clock()
+        # update bocal elements position
+        self._bocal.step(PYMUNK_INTERVAL)
+        t1 = clock()
+        # prepare collision handler
+        self._collision_helper.reset()
+        # execute 1 physics step
+        self._space.step( PYMUNK_INTERVAL )
+        self._fruits.expire_store()
+        t2 = clock()
+        # modify fruits based on detected collisions
+        self._collision_helper.process(
+            spawn_func=self.spawn_in_bocal,
+            world_to_bocal_func=self._bocal.to_bocal )
+        t3 = clock()
+        # run the merges/removals that became due
+        self._clock.advance()
+        t4 = clock()
+        # clean up
+        self._fruits.cleanup()
+        t5 = clock()
+        self.check_overflow()
+        t6 = clock()
+        return (t0, t1, t2, t3, t4, t5, t6)
+
+    def _record_phases(self, t):
+        """ Times of a _step_once() to the profiler spans and time_phases()
+        """
+        (t0, t1, t2, t3, t4, t5, t6) = t
+        p = self._profiler
+        if( p.enabled ):
+            p.record( 'Bocal.step', t0, t1 )
+            p.record( 'space.step', t1, t2 )
+            p.record( 'CollisionHelper.process', t2, t3 )
+            p.record( 'ActiveFruits.cleanup', t4, t5 )
+        times = self._phase_times
+        if( times is None ):
+            return
+        times['bocal'] += t1 - t0
+        times['space'] += t2 - t1
+        times['collisions'] += t3 - t2
+        times['clock'] += t4 - t3
+        times['cleanup'] += t5 - t4
+        times['overflow'] += t6 - t5
+
+    def is_settled(self):
+        """ True when the board is at rest: every fruit in MODE_NORMAL and
+        slower than SETTLE_SPEED, and no merge waiting for its spawn
+        """
+        return ( self._collision_helper.pending_merges == 0
+                 and self._fruits.is_settled() )
+
+    def step_until_settled(self, max_steps):
+        """ Steps until the board is at rest or the game is over, at most max_steps
+        Returns the number of steps done
+        """
+        for n in range(max_steps):
+            if( self._is_gameover or self.is_settled() ):
+                return n
+            self.step()
+        return max_steps
+
+    def snapshot(self):
+        """ Copy of the board to fork it: try a drop, step, then restore()
+        Only valid for this GameCore, and for the same window size.
+        """
+        return GameSnapshot(
+            clock=self._clock.snapshot(),
+            bocal=self._bocal.snapshot(),
+            fruits=self._fruits.snapshot(),
+            preview=self._preview.snapshot(),
+            collisions=self._collision_helper.snapshot(),
+            countdown=self._countdown.snapshot(),
+            is_gameover=self._is_gameover,
+            random=self._rng.getstate() )
+
+    def restore(self, snap):
+        """ Rewinds the board to a snapshot(), which can be restored again.
+        The game state is put back exactly, but pymunk rebuilds its contact
+        caches: replaying the same drops gives a close, not bitwise equal, game.
+        """
+        self._clock.restore( snap.clock )
+        self._fruits.restore( snap.fruits )
+        self._bocal.restore( snap.bocal )
+        self._preview.restore( snap.preview )
+        # after the fruits: taking them out of the space calls the separate handlers
+        self._collision_helper.restore( snap.collisions )
+        self._countdown.restore( snap.countdown )
+        self._is_gameover = snap.is_gameover
+        self._rng.setstate( snap.random )
+
+    def reseed(self, seed):
+        """ Seeds the random draws from now on, the board is unchanged: after
+        a restore(), gives each continuation of the same board its own draws.
+        A recorded game can no longer be replayed from its seed.
+        """
+        self._rng.seed( seed )
+
+    def export_board(self):
+        """ Picklable description of the board, for load_board() in another
+        process. Merges in progress are not included: take it when the
+        board is settled.
+        """
+        countdown = self._countdown.snapshot()
+        return {
+            'fruits': self._fruits.export_board(),
+            'preview': self._preview.kinds,
+            'bocal': self._bocal.snapshot(),
+            'countdown': None if countdown is None else countdown - self._clock.time(),
+        }
+
+    def load_board(self, board):
+        """ Resets the game to a board from export_board()
+        """
+        self.reset()
+        self._fruits.load_board( board['fruits'] )
+        self._preview.restore( ( list(reversed(board['preview'])), None ) )
+        self._bocal.restore( board['bocal'] )
+        countdown = board['countdown']
+        self._countdown.restore( None if countdown is None else self._clock.time() + countdown )
+        self._collision_helper.reset()
+
+    def check_overflow(self):
+        """ Updates the countdown of fruits above maxline, game over when it expires
+        """
+        if( not self._bocal.is_tumbling ):
+            self._countdown.update( self._collision_helper.maxline_count )
+        countdown_val, _ = self._countdown.status()
+        if( countdown_val < 0 and not self._is_gameover ):
+            self.gameover()
+
+    def countdown_text(self):
+        return self._countdown.status()[1]
+
+    def gameover(self):
+        if( self._is_gameover ):
+            return
+        self._is_gameover = True    # inhibit game actions
+        self._fruits.gameover()
+        if( self.recorder ):
+            self.recorder.end(self)
+        if( self.on_gameover ):
+            self.on_gameover()
@@ -6,6 +6,7 @@ import sprites
 TOP_LEFT = 'label1'
 TOP_CENTER = 'label2'
 TOP_RIGHT = 'label3'
+PROFILE = 'label4'
 
 
 
@@ -55,6 +56,25 @@ class TopRightLabel( Label ):
         }
     
 
+class ProfileLabel( Label ):
+    """ Profiler overlay, under the FPS label
+    """
+    def __init__(self, window_width, window_height):
+        super().__init__(window_width, window_height)
+        self.font_name = "Courier New"
+        self.font_size = GUI_FONT_SIZE // 2
+        self.width = GUI_FONT_SIZE * 20
+        self.multiline = True
+
+    def coords(self, width, height, margin):
+        return {
+            'x' : width - margin,
+            'y': height - 2*margin - 2*GUI_FONT_SIZE,
+            'anchor_x' : 'right',
+            'anchor_y' : 'top',
+        }
+
+
 class GameOverSprite(pg.sprite.Sprite):
     def __init__(self, width, height):
 
@@ -95,13 +115,15 @@ class GUI(object):
         self._label_topleft = TopLeftLabel(window_width, window_height)
         self._label_center = CenterLabel(window_width, window_height)
         self._label_topright = TopRightLabel(window_width, window_height)
+        self._label_profile = ProfileLabel(window_width, window_height)
         self._gameover = GameOverSprite( window_width, window_height )
         self._gameover_mask = GameOverMask( window_width, window_height)
         self._resizables = [self._gameover,
                             self._gameover_mask,
                             self._label_topleft,
                             self._label_center,
-                            self._label_topright ]
+                            self._label_topright,
+                            self._label_profile ]
 
     def on_resize(self, width, height):
         for item in self._resizables:
@@ -111,6 +133,7 @@ class GUI(object):
         if(label==TOP_LEFT): self._label_topleft.text = text
         if(label==TOP_CENTER): self._label_center.text = text
         if(label==TOP_RIGHT): self._label_topright.text = text
+        if(label==PROFILE): self._label_profile.text = text
 
     def update_dict( self, texts ):
         for lbl, txt in texts.items():
@@ -0,0 +1,183 @@
+""" Monte Carlo rollout planner, an alternative to SuikaAgent for playing.
+
+For each candidate drop abscissa the board is forked, the fruit is dropped,
+then `rollouts` random continuations of `depth` drops are played with the
+upcoming FruitQueue kinds. The candidate with the best mean value (score
+gained, minus a penalty for a game over) is chosen.
+
+The rollouts run in a process pool, each worker owning a headless GameCore,
+and stop at the decision time budget: the choice is then made on the
+rollouts done so far. With surrogate=True they use the geometric
+DropResolver instead of pymunk, much faster and less accurate.
+
+    with RolloutPlanner(workers=8) as planner:
+        x = planner.get_action(game)
+"""
+import multiprocessing as mp
+import random
+import time
+
+import numpy as np
+
+from constants import *
+from fruit import random_kind
+from game import GameCore
+from resolver import DropResolver
+
+
+DEFAULT_WORKERS = max(1, mp.cpu_count() - 1)    # one core left to the game
+DEFAULT_CANDIDATES = 32      # drop abscissas evaluated
+DEFAULT_ROLLOUTS = 16        # random continuations per candidate
+DEFAULT_DEPTH = 1            # random drops after the candidate one
+DEFAULT_BUDGET = 0.2         # seconds per decision
+DROP_STEPS = int(0.5 / PYMUNK_INTERVAL)     # physics steps after each drop
+GAMEOVER_PENALTY = 200.0     # value lost by a rollout ending the game
+
+
+# headless board of a pool worker, built by _init_worker()
+_g_game = None
+
+def _init_worker(width, height, profile):
+    global _g_game
+    _g_game = GameCore(width=width, height=height, headless=True, profile=profile)
+
+
+def _play(game, x, depth, drop_steps):
+    """ Drops at x then `depth` random fruits, returns the value of the rollout
+    """
+    score = game.score
+    game.drop(x)
+    game.step(drop_steps)
+    for _ in range(depth):
+        if( game.is_gameover ):
+            break
+        game.drop()
+        game.step(drop_steps)
+    return game.score - score - GAMEOVER_PENALTY * game.is_gameover
+
+
+def _play_surrogate(pile, kinds, x, depth, rng):
+    """ Same as _play() on a DropResolver pile (bocal coordinates).
+    kinds: the upcoming kinds, the dropped one first
+    rng: random.Random of the rollout
+    """
+    pile = pile.copy()
+    points = pile.drop(kinds[0], x)
+    half = pile.width / 2
+    for k in range(1, depth + 1):
+        if( pile.is_overflowing ):
+            break
+        kind = kinds[k] if k < len(kinds) else random_kind(rng)
+        points += pile.drop(kind, rng.uniform(-half, half))
+    return points - GAMEOVER_PENALTY * pile.is_overflowing
+
+
+def _rollouts(board, xs, rollouts, depth, drop_steps, seed, deadline, surrogate=False, game=None):
+    """ Sum and count of the rollout values of each candidate x.
+    Rollout i uses the same random continuation for all the candidates
+    (common random numbers), and all the candidates get their i-th rollout
+    before the next one, so that a cut by the deadline stays fair.
+    """
+    game = game or _g_game
+    if( surrogate ):
+        pile = DropResolver.from_board(board, game.bocal.width, game.bocal.height)
+        kinds = [ board['fruits']['next'] ] + list(board['preview'])
+        (center, _, _, _) = board['bocal'][0][0]
+        play = lambda x, i: _play_surrogate(pile, kinds, x - center[0], depth, random.Random(seed + i))
+    else:
+        game.load_board(board)
+        start = game.snapshot()
+        def play(x, i):
+            # after the restore, that puts back the random state of the snapshot
+            game.restore(start)
+            game.reseed(seed + i)
+            return _play(game, x, depth, drop_steps)
+    sums = np.zeros( len(xs), dtype=np.float64 )
+    counts = np.zeros( len(xs), dtype=np.int64 )
+    # shuffled, so that a short budget still samples the whole bocal width
+    order = np.random.RandomState(seed).permutation( len(xs) )
+    for i in range(rollouts):
+        for j in order:
+            if( time.monotonic() > deadline ):
+                return sums, counts
+            sums[j] += play( xs[j], i )
+            counts[j] += 1
+    return sums, counts
+
+
+class RolloutPlanner(object):
+    """ Chooses drops by simulating their outcome on forked boards.
+    workers=0 runs the rollouts in the calling process.
+    profile: physics settings of the rollout boards, see PHYSICS_PROFILES
+    """
+    def __init__(self, workers=DEFAULT_WORKERS, candidates=DEFAULT_CANDIDATES,
+                 rollouts=DEFAULT_ROLLOUTS, depth=DEFAULT_DEPTH, budget=DEFAULT_BUDGET,
+                 drop_steps=DROP_STEPS, surrogate=False, width=WINDOW_WIDTH, height=WINDOW_HEIGHT, seed=1,
+                 profile=PHYSICS_DISPLAY):
+        self.candidates = candidates
+        self.rollouts = rollouts
+        self.depth = depth
+        self.budget = budget
+        self.drop_steps = drop_steps
+        self.surrogate = surrogate
+        self._width = width
+        self._seed = seed
+        self._workers = workers
+        self._pool = None
+        self._game = None
+        if( workers > 0 ):
+            self._pool = mp.Pool( workers, initializer=_init_worker, initargs=(width, height, profile) )
+        else:
+            self._game = GameCore(width=width, height=height, headless=True, profile=profile)
+        self.last_counts = None     # rollouts done per candidate at the last decision
+
+    def close(self):
+        if( self._pool ):
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def candidate_xs(self):
+        """ Drop abscissas evaluated, in window coordinates as SuikaAgent.get_action
+        """
+        return np.linspace( BOCAL_MARGIN_SIDE, self._width - BOCAL_MARGIN_SIDE, self.candidates )
+
+    def plan(self, game):
+        """ Mean rollout value of each candidate (nan if none was done)
+        Returns (xs, means)
+        """
+        deadline = time.monotonic() + self.budget
+        board = game.export_board()
+        xs = self.candidate_xs()
+        self._seed += self.rollouts      # new continuations at each decision
+        args = (self.rollouts, self.depth, self.drop_steps, self._seed, deadline, self.surrogate)
+
+        if( self._pool is None ):
+            sums, counts = _rollouts(board, xs, *args, game=self._game)
+        else:
+            # each worker evaluates a slice of the candidates
+            slices = np.array_split( np.arange(len(xs)), self._workers )
+            results = [ self._pool.apply_async( _rollouts, (board, xs[s]) + args )
+                        for s in slices if len(s) ]
+            sums = np.concatenate( [ r.get()[0] for r in results ] )
+            counts = np.concatenate( [ r.get()[1] for r in results ] )
+
+        self.last_counts = counts
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+        means[counts == 0] = np.nan
+        return xs, means
+
+    def get_action(self, game):
+        """ Best drop abscissa for the game (a GameCore)
+        """
+        xs, means = self.plan(game)
+        if( np.all(np.isnan(means)) ):
+            return float( random.choice(xs) )   # budget too short for a single rollout
+        return float( xs[np.nanargmax(means)] )
@@ -1,23 +1,31 @@
+import random
+
 from constants import *
 from sprites import PreviewSprite
 import fruit 
 import utils
 
 class QueueItem(object):
-    def __init__(self, kind, sprite_size ):
+    def __init__(self, kind, sprite_size, headless=False ):
         self.kind = kind
-        self._sprite = PreviewSprite( nom=fruit.name_from_kind(kind), width=sprite_size )
+        self._sprite = None
+        if( not headless ):
+            self._sprite = PreviewSprite( nom=fruit.name_from_kind(kind), width=sprite_size )
         self.y_pos = 0
 
     def update(self, slot, y):
+        if( not self._sprite ):
+            return
         x = PREVIEW_SLOT_SIZE * (slot + 0.5)
         self._sprite.position = (x,y,0)
         self._sprite.update(x, y)
 
 
 class FruitQueue( object ):
-    def __init__( self, cnt):
+    def __init__( self, cnt, headless=False, rng=random):
         self._cnt = cnt
+        self._headless = headless
+        self._rng = rng           # draws the kinds, the random module or the game's random.Random
         self.y_pos = 0
         self.reset()
 
@@ -32,9 +40,25 @@ class FruitQueue( object ):
         self.y_pos = height - PREVIEW_Y_POS
 
     def _add_item(self):
-        s = QueueItem( kind = fruit.random_kind(), sprite_size=PREVIEW_SPRITE_SIZE )
+        s = QueueItem( kind = fruit.random_kind(self._rng), sprite_size=PREVIEW_SPRITE_SIZE, headless=self._headless )
         self._queue.insert(0, s)
 
+    @property
+    def kinds(self):
+        """ kinds of the waiting fruits, the next one to play first
+        """
+        return [ item.kind for item in reversed(self._queue) ]
+
+    def snapshot(self):
+        return ( [ item.kind for item in self._queue ], self._shift_end_time )
+
+    def restore(self, state):
+        (kinds, self._shift_end_time) = state
+        if( kinds != [ item.kind for item in self._queue ] ):
+            self._queue = [ QueueItem( kind=k, sprite_size=PREVIEW_SPRITE_SIZE, headless=self._headless )
+                            for k in kinds ]
+            self.update()
+
     def get_next_fruit(self):
         kind = self._queue.pop().kind
         self._add_item()
@@ -0,0 +1,153 @@
+""" Timing spans around the hot phases of the game, for the in-game overlay
+(key O) and a Chrome trace export (key D, open it in chrome://tracing or
+https://ui.perfetto.dev).
+
+    with get_profiler().span('ai_tick'):
+        ...
+
+Each span name has a ring buffer of its last PROFILE_BUFSIZE (start,
+duration), preallocated numpy arrays. Only the game thread writes them:
+no lock, recording a span costs two array writes.
+"""
+import json
+import time
+
+import numpy as np
+
+from constants import *
+
+
+class SpanBuffer(object):
+    """ Ring buffer of the last timings of one span, also its context manager
+    (spans of the same name are not nested)
+    """
+    def __init__(self, name, size=PROFILE_BUFSIZE):
+        self.name = name
+        self._starts = np.zeros( size )
+        self._durations = np.zeros( size )
+        self._n = 0
+        self._t = 0.0
+
+    def __len__(self):
+        return min( self._n, len(self._starts) )
+
+    @property
+    def count(self):
+        """ spans recorded since the creation, more than the buffer keeps
+        """
+        return self._n
+
+    def record(self, start, end):
+        i = self._n % len(self._starts)
+        self._starts[i] = start
+        self._durations[i] = end - start
+        self._n += 1
+
+    def __enter__(self):
+        self._t = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.record( self._t, time.perf_counter() )
+
+    def timings(self):
+        """ (starts, durations) in seconds, oldest first
+        """
+        n = len(self)
+        if( self._n <= len(self._starts) ):
+            return self._starts[:n], self._durations[:n]
+        i = self._n % len(self._starts)
+        order = np.r_[ i:n, 0:i ]
+        return self._starts[order], self._durations[order]
+
+    def percentiles(self, q=(50, 95, 99)):
+        """ durations at the percentiles q, in seconds
+        """
+        if( not len(self) ):
+            return np.zeros( len(q) )
+        return np.percentile( self._durations[:len(self)], q )
+
+    def max(self):
+        return float( self._durations[:len(self)].max() ) if len(self) else 0.0
+
+
+class _NoSpan(object):
+    """ span() of a disabled profiler """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+
+class Profiler(object):
+    """ Named SpanBuffers, recording only while enabled
+    """
+    def __init__(self, size=PROFILE_BUFSIZE):
+        self._size = size
+        self._spans = {}
+        self.enabled = False
+
+    def buffer(self, name):
+        b = self._spans.get(name)
+        if( b is None ):
+            b = self._spans[name] = SpanBuffer(name, self._size)
+        return b
+
+    def span(self, name):
+        """ context manager timing its block as the span name
+        """
+        if( not self.enabled ):
+            return _NO_SPAN
+        return self.buffer(name)
+
+    def record(self, name, start, end):
+        """ records a span measured by the caller (time.perf_counter() values)
+        """
+        if( self.enabled ):
+            self.buffer(name).record(start, end)
+
+    def clear(self):
+        self._spans = {}
+
+    def stats(self):
+        """ {name: (p50, p95, p99, max)} in seconds
+        """
+        return { name: (*b.percentiles(), b.max()) for name, b in self._spans.items() }
+
+    def report(self):
+        """ Text of the overlay: percentiles of each span, in ms
+        """
+        lines = [ f"{'ms':24s} {'p50':>6s} {'p95':>6s} {'p99':>6s} {'max':>6s}" ]
+        for name, values in self.stats().items():
+            lines.append( f"{name:24s} " + " ".join( f"{1000 * v:6.2f}" for v in values ) )
+        return "\n".join(lines)
+
+    def trace_events(self):
+        """ the spans kept, as Chrome trace events (complete events, microseconds)
+        """
+        events = []
+        for name, b in self._spans.items():
+            starts, durations = b.timings()
+            for t, d in zip( starts.tolist(), durations.tolist() ):
+                events.append( { 'name': name, 'ph': 'X', 'ts': t * 1e6, 'dur': d * 1e6,
+                                 'pid': 0, 'tid': 0 } )
+        events.sort( key=lambda e: e['ts'] )
+        return events
+
+    def dump_trace(self, path=PROFILE_TRACE_FILE):
+        """ Writes the spans kept as a Chrome trace-event JSON file,
+        returns the number of events
+        """
+        events = self.trace_events()
+        with open(path, 'w') as f:
+            json.dump( { 'traceEvents': events, 'displayTimeUnit': 'ms' }, f )
+        return len(events)
+
+
+_g_profiler = Profiler()
+
+def get_profiler():
+    return _g_profiler
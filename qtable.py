@@ -0,0 +1,209 @@
+import numpy as np
+
+
+DEFAULT_CAPACITY = 1024     # hash slots, always a power of 2
+MAX_LOAD = 0.5              # rows / slots ratio before the table grows
+
+_EMPTY = -1                 # free hash slot
+_FIB = 0x9E3779B97F4A7C15   # 2^64 / golden ratio, for Fibonacci hashing
+_MASK64 = (1 << 64) - 1
+
+
+class QTable(object):
+    """ Q-values indexed by integer state keys.
+
+    Open addressing hash index (linear probing) over int64 keys, pointing
+    to the rows of one contiguous float32[rows, action_size] value matrix.
+    Unknown states read as zeros, like the former defaultdict, but are only
+    stored when written.
+    """
+    def __init__(self, action_size, capacity=DEFAULT_CAPACITY):
+        assert capacity > 0 and (capacity & (capacity-1)) == 0, "capacity must be a power of 2"
+        self._action_size = action_size
+        self._n = 0
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        self._bits = capacity.bit_length() - 1
+        self._slots = np.full( capacity, _EMPTY, dtype=np.int32 )
+        rows = int(capacity * MAX_LOAD)
+        keys = np.zeros( rows, dtype=np.int64 )
+        values = np.zeros( (rows, self._action_size), dtype=np.float32 )
+        if( self._n ):
+            keys[:self._n] = self._keys[:self._n]
+            values[:self._n] = self._values[:self._n]
+        self._keys = keys
+        self._values = values
+        self._reindex()
+
+    def _reindex(self):
+        self._slots.fill(_EMPTY)
+        if( self._n ):
+            self._insert_rows( np.arange(self._n, dtype=np.int32) )
+
+    def __len__(self):
+        return self._n
+
+    def __contains__(self, key):
+        return self._find(key) != _EMPTY
+
+    @property
+    def action_size(self):
+        return self._action_size
+
+    @property
+    def capacity(self):
+        return len(self._slots)
+
+    @property
+    def nbytes(self):
+        return self._slots.nbytes + self._keys.nbytes + self._values.nbytes
+
+    ############ hashing ############
+
+    def _slot_of(self, key):
+        return (((key & _MASK64) * _FIB) & _MASK64) >> (64 - self._bits)
+
+    def _slots_of(self, keys):
+        h = keys.astype(np.uint64) * np.uint64(_FIB)       # wraps modulo 2^64
+        return (h >> np.uint64(64 - self._bits)).astype(np.int64)
+
+    def _find(self, key):
+        """ row of key, or _EMPTY
+        """
+        mask = len(self._slots) - 1
+        slot = self._slot_of(key)
+        while True:
+            row = self._slots[slot]
+            if( row == _EMPTY or self._keys[row] == key ):
+                return row
+            slot = (slot + 1) & mask
+
+    def _find_all(self, keys):
+        """ rows of the keys, _EMPTY for the unknown ones (vectorized probing)
+        """
+        mask = len(self._slots) - 1
+        rows = np.full( len(keys), _EMPTY, dtype=np.int32 )
+        pending = np.arange( len(keys) )
+        slots = self._slots_of(keys)
+        while len(pending):
+            r = self._slots[slots]
+            hit = (r != _EMPTY)
+            hit[hit] = self._keys[r[hit]] == keys[pending[hit]]
+            rows[pending[hit]] = r[hit]
+            # continue probing while the slot is used by another key
+            again = (r != _EMPTY) & ~hit
+            pending = pending[again]
+            slots = (slots[again] + 1) & mask
+        return rows
+
+    def _insert_rows(self, new_rows):
+        """ Adds the rows to the hash index (their keys must not be indexed yet)
+        """
+        mask = len(self._slots) - 1
+        pending = new_rows
+        slots = self._slots_of(self._keys[new_rows])
+        while len(pending):
+            free = self._slots[slots] == _EMPTY
+            # several rows may target the same free slot: the first one wins
+            _, first = np.unique( np.where(free, slots, -1), return_index=True )
+            won = np.zeros( len(pending), dtype=bool )
+            won[first] = True
+            won &= free
+            self._slots[slots[won]] = pending[won]
+            pending = pending[~won]
+            slots = (slots[~won] + 1) & mask
+
+    def _add_keys(self, keys):
+        """ Creates zero rows for unknown (unique) keys, returns their rows
+        """
+        while self._n + len(keys) > len(self._keys):
+            self._alloc( 2 * len(self._slots) )
+        rows = np.arange( self._n, self._n + len(keys), dtype=np.int32 )
+        self._keys[rows] = keys
+        self._values[rows] = 0
+        self._n += len(keys)
+        self._insert_rows(rows)
+        return rows
+
+    def rows(self, keys, insert=False):
+        """ Row index of each key in the value matrix.
+        Unknown keys get _EMPTY (-1), or a new zero row if insert is True.
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        rows = self._find_all(keys)
+        if( insert ):
+            missing = rows == _EMPTY
+            if( missing.any() ):
+                new_keys, inverse = np.unique( keys[missing], return_inverse=True )
+                rows[missing] = self._add_keys(new_keys)[inverse]
+        return rows
+
+    ############ single state ############
+
+    def get(self, key):
+        """ Q-values of one state (zeros if unknown), a copy
+        """
+        row = self._find(key)
+        if( row == _EMPTY ):
+            return np.zeros( self._action_size, dtype=np.float32 )
+        return self._values[row].copy()
+
+    def set_value(self, key, action, value):
+        row = self._find(key)
+        if( row == _EMPTY ):
+            row = self._add_keys( np.array([key], dtype=np.int64) )[0]
+        self._values[row, action] = value
+
+    ############ bulk ############
+
+    def lookup(self, keys):
+        """ Q-values of several states, float32[len(keys), action_size]
+        """
+        rows = self.rows(keys)
+        out = np.zeros( (len(rows), self._action_size), dtype=np.float32 )
+        known = rows != _EMPTY
+        out[known] = self._values[rows[known]]
+        return out
+
+    def update(self, keys, actions, values):
+        """ Q[keys[i], actions[i]] = values[i], creating unknown states.
+        With duplicated (key, action) pairs the last value wins.
+        """
+        rows = self.rows(keys, insert=True)
+        self._values[rows, np.asarray(actions)] = values
+
+    def add_to(self, keys, actions, deltas):
+        """ Q[keys[i], actions[i]] += deltas[i], creating unknown states.
+        A (key, action) pair found several times gets the mean of its deltas.
+        """
+        rows = self.rows(keys, insert=True)
+        flat = rows.astype(np.int64) * self._action_size + np.asarray(actions)
+        (cells, inverse, counts) = np.unique( flat, return_inverse=True, return_counts=True )
+        mean = np.bincount( inverse, weights=deltas, minlength=len(cells) ) / counts
+        self._values.reshape(-1)[cells] += mean.astype(np.float32)
+
+    ############ conversions ############
+
+    def items(self):
+        """ (key, Q-values) of the stored states
+        """
+        for i in range(self._n):
+            yield int(self._keys[i]), self._values[i]
+
+    def __getstate__(self):
+        # only the used rows: the index is rebuilt on load
+        return { 'action_size': self._action_size,
+                 'capacity': len(self._slots),
+                 'keys': self._keys[:self._n].copy(),
+                 'values': self._values[:self._n].copy() }
+
+    def __setstate__(self, state):
+        self._action_size = state['action_size']
+        self._n = 0
+        self._alloc( state['capacity'] )
+        n = len(state['keys'])
+        self._keys[:n] = state['keys']
+        self._values[:n] = state['values']
+        self._n = n
+        self._reindex()
@@ -0,0 +1,276 @@
+""" Compact binary logs of games, to replay them bit-for-bit.
+
+A game played by a new GameCore is entirely defined by its seed, its
+physics profile, its window size and its drops (simulation step, abscissa):
+
+    recorder = ReplayRecorder('games.skr')
+    game = GameCore(profile=PHYSICS_TRAINING_FAST)
+    recorder.attach(game)       # before the first step
+    ...                         # game.drop(x), game.step()
+    recorder.close()
+
+    for log in read_games('games.skr'):
+        game = replay(log)      # raises ReplayMismatch if the game differs
+
+The recorder follows a game until its game over or reset() (or close()),
+then writes it at the end of the file, so several games, even played
+by several GameCore at once, can share a file. The game must only be
+driven by drop() and step(): the fruits dragged, shot or shaken by hand
+in the window are not recorded.
+
+Format of a game, integers as unsigned LEB128 varints:
+    b'SKR' version      header
+    seed, profile (length, ascii), window width, height
+    records, first varint: tag | (steps since the previous record) << 4
+        tag 1..14: drop of a fruit of kind tag, then the abscissa in
+                   1/DROP_RESOLUTION pixel, zigzag coded, + 1 (0: random drop)
+        tag 0:     checksum of the board before the drop that follows,
+                   uint32, every REPLAY_CHECKSUM_EVERY drops
+        tag 15:    end of the game, then its steps, score, game over flag
+                   and the checksum of the final board (uint32)
+About 5 bytes per drop.
+"""
+import collections
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+from constants import *
+from game import GameCore
+
+
+MAGIC = b'SKR'
+VERSION = 1
+
+_TAG_CHECKSUM = 0
+_TAG_END = 15
+_TAG_BITS = 4
+
+ReplayLog = collections.namedtuple( 'ReplayLog',
+    ['seed', 'profile', 'width', 'height', 'drops', 'checksums', 'steps', 'score', 'is_gameover', 'checksum'] )
+ReplayLog.__doc__ = """ A game read from a log
+drops: [(step, x or None, kind)], steps counted from the start of the game
+checksums: {index of the drop: checksum of the board before it}
+steps, score, is_gameover, checksum: at the end of the game
+"""
+
+
+class ReplayMismatch(RuntimeError):
+    """ The replayed game is not the recorded one """
+
+
+def board_checksum(game):
+    """ CRC32 of the kinds, positions and velocities of the fruits, and the score
+    """
+    store = game.fruits.store
+    crc = zlib.crc32( store.kinds.tobytes() )
+    for values in (store.x, store.y, store.vx, store.vy):
+        crc = zlib.crc32( np.ascontiguousarray(values).tobytes(), crc )
+    return zlib.crc32( struct.pack('<q', game.score), crc )
+
+
+############ encoding ############
+
+def _put(buf, n):
+    """ appends the unsigned varint n """
+    while( n >= 0x80 ):
+        buf.append( (n & 0x7f) | 0x80 )
+        n >>= 7
+    buf.append(n)
+
+def _zigzag(n):
+    return 2 * n if n >= 0 else -2 * n - 1
+
+def _unzigzag(n):
+    return n // 2 if n % 2 == 0 else -(n + 1) // 2
+
+
+class _Reader(object):
+    def __init__(self, data):
+        self._data = data
+        self.pos = 0
+
+    def varint(self):
+        n = shift = 0
+        while( True ):
+            b = self._data[self.pos]
+            self.pos += 1
+            n |= (b & 0x7f) << shift
+            if( b < 0x80 ):
+                return n
+            shift += 7
+
+    def bytes(self, n):
+        b = self._data[self.pos:self.pos + n]
+        self.pos += n
+        return bytes(b)
+
+
+class _GameLog(object):
+    """ records of one game being played """
+    def __init__(self, game):
+        self.buf = bytearray( MAGIC )
+        self.buf.append( VERSION )
+        _put( self.buf, game.seed )
+        profile = game.profile.encode('ascii')
+        _put( self.buf, len(profile) )
+        self.buf += profile
+        (width, height) = game.window_size
+        _put( self.buf, int(width) )
+        _put( self.buf, int(height) )
+        self.start = self.last = game.clock.step
+        self.drops = 0
+
+    def record(self, step, tag):
+        _put( self.buf, tag | (step - self.last) << _TAG_BITS )
+        self.last = step
+
+
+class ReplayRecorder(object):
+    """ Appends the games of the GameCore attached to it to the file path
+    """
+    def __init__(self, path):
+        self._file = open(path, 'ab')
+        self._logs = {}       # GameCore: _GameLog
+
+    def attach(self, game):
+        """ Records the game of a new GameCore, until its game over or reset()
+        """
+        assert game.clock.step == 0 and not len(game.fruits), "attach a recorder to a new GameCore"
+        self._logs[game] = _GameLog(game)
+        game.recorder = self
+
+    def drop(self, game, x, kind):
+        """ called by GameCore.drop(), before dropping a fruit of kind at x """
+        assert 0 < kind < _TAG_END
+        log = self._logs[game]
+        step = game.clock.step
+        if( log.drops % REPLAY_CHECKSUM_EVERY == 0 ):
+            log.record( step, _TAG_CHECKSUM )
+            log.buf += struct.pack( '<I', board_checksum(game) )
+        log.record( step, kind )
+        _put( log.buf, 0 if x is None else _zigzag( round(x * DROP_RESOLUTION) ) + 1 )
+        log.drops += 1
+
+    def end(self, game):
+        """ called by GameCore at the game over or reset(): writes the game,
+        unless no fruit was dropped
+        """
+        log = self._logs.pop(game, None)
+        game.recorder = None
+        if( log is None or not log.drops ):
+            return
+        _put( log.buf, _TAG_END )
+        _put( log.buf, game.clock.step - log.start )
+        _put( log.buf, game.score )
+        log.buf.append( int(game.is_gameover) )
+        log.buf += struct.pack( '<I', board_checksum(game) )
+        self._file.write( log.buf )
+
+    def close(self):
+        """ Writes the games in progress, as they are now
+        """
+        for game in list(self._logs):
+            self.end(game)
+        self._file.close()
+
+
+############ decoding ############
+
+def read_games(path):
+    """ Iterates over the games (ReplayLog) of a log file
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    r = _Reader(data)
+    while( r.pos < len(data) ):
+        if( r.bytes(len(MAGIC)) != MAGIC ):
+            raise ValueError( f"{path}: not a replay log at byte {r.pos - len(MAGIC)}" )
+        version = r.bytes(1)[0]
+        if( version != VERSION ):
+            raise ValueError( f"{path}: unknown replay log version {version}" )
+        seed = r.varint()
+        profile = r.bytes( r.varint() ).decode('ascii')
+        (width, height) = ( r.varint(), r.varint() )
+        drops = []
+        checksums = {}
+        step = 0
+        while( True ):
+            code = r.varint()
+            step += code >> _TAG_BITS
+            tag = code & ((1 << _TAG_BITS) - 1)
+            if( tag == _TAG_END ):
+                break
+            elif( tag == _TAG_CHECKSUM ):
+                checksums[len(drops)] = struct.unpack( '<I', r.bytes(4) )[0]
+            else:
+                x = r.varint()
+                drops.append( (step, None if x == 0 else _unzigzag(x - 1) / DROP_RESOLUTION, tag) )
+        steps = r.varint()
+        score = r.varint()
+        is_gameover = bool( r.bytes(1)[0] )
+        checksum = struct.unpack( '<I', r.bytes(4) )[0]
+        yield ReplayLog( seed, profile, width, height, drops, checksums, steps, score, is_gameover, checksum )
+
+
+def _step(game, n, on_step):
+    if( on_step is None ):
+        game.step(n)
+        return
+    for _ in range(n):
+        game.step()
+        on_step(game)
+
+def replay(log, on_step=None):
+    """ Plays a ReplayLog in a new GameCore, checking the kinds dropped and
+    the board checksums along the way. Returns the GameCore at the end
+    of the game (to close()), raises ReplayMismatch at the first difference.
+    on_step: optional, called with the game at the start and after each step
+    """
+    game = GameCore( width=log.width, height=log.height, profile=log.profile, seed=log.seed )
+    try:
+        _play(game, log, on_step)
+    except ReplayMismatch:
+        game.close()
+        raise
+    return game
+
+def _play(game, log, on_step):
+    if( on_step ):
+        on_step(game)
+    for i, (step, x, kind) in enumerate(log.drops):
+        _step( game, step - game.clock.step, on_step )
+        if( i in log.checksums and board_checksum(game) != log.checksums[i] ):
+            raise ReplayMismatch( f"board differs before drop {i}, step {step}" )
+        nxt = game.fruits.peek_next()
+        if( nxt is None or nxt.kind != kind ):
+            raise ReplayMismatch( f"drop {i}, step {step}: kind {nxt and nxt.kind} instead of {kind}" )
+        if( not game.drop(x) ):
+            raise ReplayMismatch( f"drop {i}, step {step}: the fruit could not be dropped" )
+    if( not game.is_gameover ):
+        _step( game, log.steps - game.clock.step, on_step )
+    if( game.clock.step != log.steps or game.score != log.score
+            or game.is_gameover != log.is_gameover or board_checksum(game) != log.checksum ):
+        raise ReplayMismatch( f"end of the game differs: score {game.score} instead of {log.score}" )
+
+
+def main():
+    """ python replay.py LOG...  replays every game of the logs """
+    failed = 0
+    for path in sys.argv[1:]:
+        for i, log in enumerate( read_games(path) ):
+            try:
+                replay(log).close()
+                status = "ok"
+            except ReplayMismatch as e:
+                status = f"MISMATCH {e}"
+                failed += 1
+            print( f"{path} #{i} seed {log.seed} {log.profile}: {len(log.drops)} drops, "
+                   f"score {log.score} {status}" )
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit( main() )
@@ -0,0 +1,95 @@
+import numpy as np
+
+
+DEFAULT_CAPACITY = 100_000  # transitions kept, the oldest are overwritten
+PRIORITY_ALPHA = 0.6        # how much the priorities count, 0 = uniform sampling
+PRIORITY_BETA = 0.4         # importance sampling correction, 1 = full correction
+PRIORITY_EPS = 1e-3         # priority of a transition with no TD error
+
+
+class ReplayBuffer(object):
+    """ Ring buffer of Q-learning transitions in preallocated arrays:
+    state key, action index, reward, next state key, done.
+
+    sample() draws batches for SuikaAgent.train_batch(), so that each
+    transition is learned from several times. With prioritized=True the
+    transitions are drawn in proportion to their last |TD error|^alpha
+    (new ones get the highest priority), and sample() returns the
+    importance weights that correct the bias.
+    """
+    def __init__(self, capacity=DEFAULT_CAPACITY, prioritized=False, alpha=PRIORITY_ALPHA,
+                 beta=PRIORITY_BETA, seed=None):
+        self._capacity = capacity
+        self._prioritized = prioritized
+        self._alpha = alpha
+        self.beta = beta
+        self._rng = np.random.default_rng(seed)
+        self._keys = np.zeros( capacity, dtype=np.int64 )
+        self._actions = np.zeros( capacity, dtype=np.int32 )
+        self._rewards = np.zeros( capacity, dtype=np.float32 )
+        self._next_keys = np.zeros( capacity, dtype=np.int64 )
+        self._dones = np.zeros( capacity, dtype=bool )
+        self._priorities = np.zeros( capacity, dtype=np.float64 ) if prioritized else None
+        self._max_priority = 1.0
+        self._n = 0         # transitions added since the creation
+
+    def __len__(self):
+        return min( self._n, self._capacity )
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def prioritized(self):
+        return self._prioritized
+
+    def add(self, keys, actions, rewards, next_keys, dones):
+        """ Appends a batch of transitions (arrays of the same length)
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        n = len(keys)
+        if( n > self._capacity ):     # only the last ones would stay
+            keys = keys[-self._capacity:]
+            (actions, rewards, next_keys, dones) = ( np.asarray(a)[-self._capacity:]
+                                                     for a in (actions, rewards, next_keys, dones) )
+            self._n += n - self._capacity
+            n = self._capacity
+        i = np.arange( self._n, self._n + n ) % self._capacity
+        self._keys[i] = keys
+        self._actions[i] = actions
+        self._rewards[i] = rewards
+        self._next_keys[i] = next_keys
+        self._dones[i] = dones
+        if( self._prioritized ):
+            self._priorities[i] = self._max_priority
+        self._n += n
+
+    def sample(self, n):
+        """ n transitions drawn with replacement:
+        (indices, keys, actions, rewards, next_keys, dones, weights),
+        weights is None without priorities
+        """
+        size = len(self)
+        assert size > 0, "empty replay buffer"
+        weights = None
+        if( self._prioritized ):
+            cumulated = np.cumsum( self._priorities[:size] )
+            i = np.searchsorted( cumulated, self._rng.random(n) * cumulated[-1], side='right' )
+            i = np.minimum( i, size - 1 )
+            p = self._priorities[i] / cumulated[-1]
+            weights = (size * p) ** -self.beta
+            weights /= weights.max()
+        else:
+            i = self._rng.integers( 0, size, n )
+        return ( i, self._keys[i], self._actions[i], self._rewards[i], self._next_keys[i],
+                 self._dones[i], weights )
+
+    def update_priorities(self, indices, td_errors):
+        """ New priorities of sampled transitions, from their TD errors
+        """
+        if( not self._prioritized ):
+            return
+        p = (np.abs(td_errors) + PRIORITY_EPS) ** self._alpha
+        self._priorities[indices] = p
+        self._max_priority = max( self._max_priority, float(p.max()) )
@@ -0,0 +1,191 @@
+""" Watches a recorded game (replay.py) and seeks anywhere in it.
+
+    python replay_viewer.py games.skr [--game 0] [--speed 1]
+
+The game is simulated once into a frames file next to the log
+(games.skr.0.frames, see frames.py), then shown from that file: seeking
+decodes at most one second of frames, whatever the length of the game.
+
+Keys: SPACE pause, LEFT/RIGHT -/+ 1 s (with SHIFT 10 s), HOME/END,
+UP/DOWN speed x2 / x0.5, ESC quits. A click or a drag on the bar at the
+bottom of the window seeks too.
+"""
+import argparse
+import collections
+import math
+import os
+import time
+
+import pyglet as pg
+import pymunk as pm
+
+from constants import *
+from bocal import Bocal
+import fruit
+import frames
+import gui
+import replay
+import sprites
+import utils
+
+
+BAR_HEIGHT = 6
+BAR_COLOR = (255, 200, 60, 255)
+
+
+class ReplayViewer(pg.window.Window):
+    def __init__(self, frame_file, speed=1.0):
+        self._frames = frame_file
+        self._speed = speed
+        self._is_paused = False
+        self._position = 0.0        # frame shown, with the fraction played since
+        self._sprites = {}          # fruit id: (kind, FruitSprite)
+        self._parked = collections.defaultdict(list)    # kind: hidden FruitSprites
+        super().__init__(width=frame_file.width, height=frame_file.height)
+        self.set_caption("Suika replay")
+
+        # the bocal of the game, only for its walls
+        self._bocal = Bocal(space=pm.Space(), clock=utils.SimClock(), headless=False,
+                            **utils.bocal_coords(window_w=self.width, window_h=self.height))
+        self._bocal.update()
+        self._gui = gui.GUI(window_width=self.width, window_height=self.height)
+        self._bar = pg.shapes.Rectangle(0, 0, 0, BAR_HEIGHT, color=BAR_COLOR,
+                                        batch=sprites.batch(), group=sprites.groupe_gui())
+        self.seek(0)
+        pg.clock.schedule(self.tick)
+
+    @property
+    def frame(self):
+        return int(self._position)
+
+    def seek(self, frame):
+        """ Shows a frame (clamped to the game)
+        """
+        self._position = min( max(frame, 0), len(self._frames) - 1 )
+        self._show( self._frames.seek( self.frame ) )
+
+    def tick(self, dt):
+        if( self._is_paused ):
+            return
+        position = self._position + dt * self._speed / PYMUNK_INTERVAL
+        if( position >= len(self._frames) - 1 ):
+            self._is_paused = True
+        frame = self.frame
+        self._position = min( position, len(self._frames) - 1 )
+        if( self.frame != frame ):
+            self._show( self._frames.seek( self.frame ) )
+
+    def _show(self, state):
+        """ Moves the fruit sprites to the frame state
+        """
+        ids = state.ids.tolist()
+        for id in set(self._sprites) - set(ids):
+            (kind, s) = self._sprites.pop(id)
+            s.visible = False
+            self._parked[kind].append(s)
+        for id, kind, x, y, angle in zip( ids, state.kinds.tolist(), state.x.tolist(),
+                                          state.y.tolist(), state.angle.tolist() ):
+            if( id not in self._sprites ):
+                self._sprites[id] = ( kind, self._sprite(kind) )
+            s = self._sprites[id][1]
+            # pymunk and pyglet have opposite rotation directions
+            s.update( x=x, y=y, rotation=-math.degrees(angle), on_animation_stop=None )
+
+        t = state.frame * PYMUNK_INTERVAL
+        total = (len(self._frames) - 1) * PYMUNK_INTERVAL
+        self._bar.width = self.width * state.frame / max( len(self._frames) - 1, 1 )
+        self._gui.update_dict({
+            gui.TOP_LEFT: f"score {state.score}",
+            gui.TOP_CENTER: "PAUSE" if self._is_paused else (f"x{self._speed:g}" if self._speed != 1 else ""),
+            gui.TOP_RIGHT: f"{t:.1f} / {total:.1f} s",
+        })
+
+    def _sprite(self, kind):
+        parked = self._parked[kind]
+        if( parked ):
+            s = parked.pop()
+            s.visible = True
+            return s
+        return sprites.FruitSprite( fruit.name_from_kind(kind), fruit.radius_from_kind(kind) )
+
+    def on_draw(self):
+        self.clear()
+        sprites.batch().draw()
+
+    def on_key_press(self, symbol, modifiers):
+        step = int( (10 if modifiers & pg.window.key.MOD_SHIFT else 1) / PYMUNK_INTERVAL )
+        if symbol == pg.window.key.ESCAPE:
+            self.close()
+        elif symbol == pg.window.key.SPACE:
+            self._is_paused = not self._is_paused
+            if( not self._is_paused and self.frame >= len(self._frames) - 1 ):
+                self._position = 0.0            # from the start again
+            self.seek( self.frame )
+        elif symbol == pg.window.key.LEFT:
+            self.seek( self.frame - step )
+        elif symbol == pg.window.key.RIGHT:
+            self.seek( self.frame + step )
+        elif symbol == pg.window.key.HOME:
+            self.seek( 0 )
+        elif symbol == pg.window.key.END:
+            self.seek( len(self._frames) - 1 )
+        elif symbol == pg.window.key.UP:
+            self._speed *= 2
+            self.seek( self.frame )
+        elif symbol == pg.window.key.DOWN:
+            self._speed /= 2
+            self.seek( self.frame )
+
+    def on_mouse_press(self, x, y, button, modifiers):
+        if( y < 4 * BAR_HEIGHT ):
+            self.seek( round( x / self.width * (len(self._frames) - 1) ) )
+
+    def on_mouse_drag(self, x, y, dx, dy, buttons, modifiers):
+        self.on_mouse_press(x, y, buttons, modifiers)
+
+    def on_close(self):
+        pg.clock.unschedule(self.tick)
+        super().on_close()
+
+
+def frames_for(log_path, game=0):
+    """ Frames file of a game of a replay log, baked the first time
+    """
+    path = f"{log_path}.{game}.frames"
+    if( not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(log_path) ):
+        for i, log in enumerate( replay.read_games(log_path) ):
+            if( i == game ):
+                break
+        else:
+            raise IndexError( f"{log_path} has no game {game}" )
+        print( f"simulating game {game}: {log.steps} steps, {len(log.drops)} drops" )
+        t = time.perf_counter()
+        # baked aside: a failed bake must not leave a file taken for the cache
+        tmp = path + '.tmp'
+        try:
+            frames.bake(log, tmp).close()
+            os.replace(tmp, path)
+        finally:
+            if( os.path.exists(tmp) ):
+                os.remove(tmp)
+        print( f"{path} written in {time.perf_counter() - t:.1f} s" )
+    return frames.FrameFile(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay viewer")
+    parser.add_argument("log", help="replay log (replay.py)")
+    parser.add_argument("--game", type=int, default=0, help="index of the game in the log")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed")
+    args = parser.parse_args()
+
+    frame_file = frames_for(args.log, args.game)
+    pg.resource.path = ['assets/']
+    pg.resource.reindex()
+    ReplayViewer(frame_file, speed=args.speed)
+    pg.app.run()
+    frame_file.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+""" Geometric drop resolver: where does a dropped fruit rest, without pymunk.
+
+The pile is a set of circles, in the bocal frame, that never move. A dropped
+fruit falls on the highest circle under it, then rolls along it, away from
+its center, until it touches a second circle, a wall or the floor. If it
+reaches the side of its support first, it falls on the next one. Touching fruits of the same kind merge at the
+position of the lowest one, and the merged fruit settles and merges again
+(merge chaining). Holes left by merges are not filled.
+
+    python resolver.py     # accuracy and speed against pymunk
+"""
+import math
+import random
+import time
+
+import numpy as np
+
+from constants import *
+from fruit import nb_fruits, RADII
+
+
+MAX_ROLLS = 16          # supports rolled over before giving up (fruit left where it is)
+CONTACT_EPS = 1.0       # pixels, tolerance of the contact tests
+
+
+class DropResolver(object):
+    """ Approximate pile of fruits, cheap to copy and to drop into.
+    Coordinates are in the bocal frame (origin at its center).
+    """
+    def __init__(self, bocal_w, bocal_h):
+        self._w = bocal_w
+        self._h = bocal_h
+        self._floor = -bocal_h/2 + WALL_THICKNESS/2
+        self._wall = bocal_w/2 - WALL_THICKNESS/2
+        self._maxline = bocal_h/2 - REDLINE_TOP_MARGIN
+        self._xs = np.zeros(0)
+        self._ys = np.zeros(0)
+        self._kinds = np.zeros(0, dtype=np.int64)
+        self.score = 0
+
+    def copy(self):
+        other = DropResolver.__new__(DropResolver)
+        other.__dict__.update(self.__dict__)
+        return other        # the arrays are never modified in place
+
+    def __len__(self):
+        return len(self._kinds)
+
+    @property
+    def width(self):
+        return self._w
+
+    @property
+    def kinds(self):
+        return self._kinds
+
+    @property
+    def positions(self):
+        return np.stack( [self._xs, self._ys], axis=1 )
+
+    @property
+    def is_overflowing(self):
+        """ True if a fruit rests across the maxline (game over in the real game)
+        """
+        if( not len(self._kinds) ):
+            return False
+        return bool( np.any( self._ys + RADII[self._kinds] > self._maxline ) )
+
+    def load(self, kinds, positions, score=0):
+        """ Replaces the pile by circles of the kinds at the bocal positions
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        self._kinds = np.asarray(kinds, dtype=np.int64).copy()
+        self._xs = positions[:, 0].copy()
+        self._ys = positions[:, 1].copy()
+        self.score = score
+
+    @classmethod
+    def from_board(cls, board, bocal_w, bocal_h):
+        """ Pile of a GameCore.export_board()
+        """
+        fruits = board['fruits']
+        (center, angle, _, _) = board['bocal'][0][0]
+        xy = fruits['bodies'][:, :2] - np.asarray(center)
+        c, s = math.cos(-angle), math.sin(-angle)
+        xy = xy @ np.array( [[c, s], [-s, c]] )
+        resolver = cls(bocal_w, bocal_h)
+        resolver.load( fruits['kinds'], xy, score=fruits['score'] )
+        return resolver
+
+    @classmethod
+    def from_game(cls, game):
+        return cls.from_board( game.export_board(), game.bocal.width, game.bocal.height )
+
+    def drop_x(self, kind, x):
+        """ Abscissa where the game actually drops a fruit clicked at x
+        (GameCore.drop keeps it away from the walls)
+        """
+        margin = RADII[kind] + WALL_THICKNESS/2 + 1
+        return min( max(x, -self._w/2 + margin), self._w/2 - margin )
+
+    ############ resolution ############
+
+    def _support(self, x, r, below=None):
+        """ Highest resting height of a circle of radius r at abscissa x
+        Returns (y, index of the support or -1 for the floor)
+        below: only circles lower than this height can support it
+        """
+        y = self._floor + r
+        support = -1
+        if( len(self._kinds) ):
+            d = r + RADII[self._kinds]
+            dx = self._xs - x
+            under = np.abs(dx) < d
+            if( below is not None ):
+                under &= self._ys <= below
+            if( under.any() ):
+                heights = np.full( len(dx), -np.inf )
+                heights[under] = self._ys[under] + np.sqrt( d[under]**2 - dx[under]**2 )
+                i = int( np.argmax(heights) )
+                if( heights[i] > y ):
+                    y = heights[i]
+                    support = i
+        return y, support
+
+    def _roll(self, x, y, i, r, direction):
+        """ Rolls a circle resting on circle i along the arc around it, down
+        to the side of i. Stops at the first contact with another circle,
+        a wall or the floor on the way.
+        Returns (x, y, stopped)
+        """
+        (ax, ay) = (self._xs[i], self._ys[i])
+        R = r + RADII[self._kinds[i]]
+        theta0 = math.atan2(y - ay, x - ax)
+        # angles go from theta0 down to 0 (to the right) or up to pi (to the left)
+        first = 0.0 if direction > 0 else math.pi
+        stopped = False
+        def reached(theta):
+            return (direction > 0 and first < theta < theta0) or (direction < 0 and theta0 < theta < first)
+
+        # contacts with the other circles: intersections of the arc with
+        # the circles of radius r + rk around them
+        bx = self._xs - ax
+        by = self._ys - ay
+        d = np.hypot(bx, by)
+        rk = r + RADII[self._kinds]
+        ok = (d > 0) & (d < R + rk) & (d > np.abs(R - rk))
+        ok[i] = False
+        if( ok.any() ):
+            bx, by, d, rk = bx[ok], by[ok], d[ok], rk[ok]
+            a = (R*R - rk*rk + d*d) / (2*d)
+            h = np.sqrt( np.maximum(R*R - a*a, 0) )
+            base = np.arctan2(by, bx)
+            offset = np.arctan2(h, a)
+            thetas = np.concatenate( [base - offset, base + offset] )
+            thetas = (thetas + math.pi) % (2*math.pi) - math.pi
+            if( direction > 0 ):
+                thetas = thetas[ (thetas > first) & (thetas < theta0) ]
+            else:
+                thetas = thetas[ (thetas > theta0) & (thetas < first) ]
+            if( len(thetas) ):
+                first = thetas.max() if direction > 0 else thetas.min()
+                stopped = True
+
+        # walls and floor
+        wall = self._wall - r
+        c = (direction * wall - ax) / R
+        if( -1 <= c <= 1 ):
+            theta = math.acos(c)
+            if( reached(theta) ):
+                first, stopped = theta, True
+        sn = (self._floor + r - ay) / R
+        if( 0 <= sn <= 1 ):
+            theta = math.asin(sn) if direction > 0 else math.pi - math.asin(sn)
+            if( reached(theta) ):
+                first, stopped = theta, True
+
+        return ax + R * math.cos(first), ay + R * math.sin(first), stopped
+
+    def _rest(self, x, r, below=None):
+        """ Lets a circle fall from abscissa x and roll down the pile,
+        returns its (x, y)
+        """
+        x_min = -self._wall + r
+        x_max = self._wall - r
+        x = min( max(x, x_min), x_max )
+        for _ in range(MAX_ROLLS):
+            y, i = self._support(x, r, below)
+            if( i < 0 ):
+                return x, y     # on the floor
+            direction = 1.0 if x >= self._xs[i] else -1.0
+            if( (direction > 0 and x >= x_max) or (direction < 0 and x <= x_min) ):
+                return x, y     # leaning against a wall
+            x, y, stopped = self._roll(x, y, i, r, direction)
+            if( stopped ):
+                return x, y
+            # off the side of its support: falls on what is under it
+            x = min( max(x + direction * CONTACT_EPS, x_min), x_max )
+            below = y
+        return x, y
+
+    def _add(self, kind, x, y):
+        self._kinds = np.append( self._kinds, kind )
+        self._xs = np.append( self._xs, x )
+        self._ys = np.append( self._ys, y )
+
+    def _remove(self, i):
+        self._kinds = np.delete( self._kinds, i )
+        self._xs = np.delete( self._xs, i )
+        self._ys = np.delete( self._ys, i )
+
+    def drop(self, kind, x):
+        """ Drops a fruit of this kind at bocal abscissa x and resolves the
+        merges. Returns the points scored.
+        """
+        points = 0
+        r = RADII[kind]
+        x, y = self._rest( self.drop_x(kind, x), r )
+        while True:
+            # same kind fruit touching it?
+            same = np.flatnonzero( self._kinds == kind )
+            if( len(same) ):
+                d = np.hypot( self._xs[same] - x, self._ys[same] - y )
+                same = same[ d <= 2 * r + CONTACT_EPS ]
+            if( not len(same) ):
+                break
+            # merges with the lowest one, at the position of the lowest of the two
+            j = same[ np.argmin(self._ys[same]) ]
+            if( self._ys[j] < y ):
+                x, y = self._xs[j], self._ys[j]
+            self._remove(j)
+            points += 2 * kind
+            kind = min( kind + 1, nb_fruits() )
+            r = RADII[kind]
+            # the bigger fruit settles from there, on what is under it
+            x, y = self._rest( x, r, below=y )
+        self._add(kind, x, y)
+        self.score += points
+        return points
+
+
+############ accuracy against pymunk ############
+
+def measure(games=3, drops=40, seed=1):
+    """ Plays random games with pymunk and predicts each drop with the resolver.
+    Returns a dict of accuracy and speed figures.
+    """
+    from game import GameCore
+    from suika_env import SETTLE_STEPS
+
+    random.seed(seed)
+    errors = []             # rest position error of the dropped fruit, no merge on both sides
+    merge_ok = 0            # drops where both agree on merge / no merge
+    points_err = []
+    t_resolver = 0.0
+    t_physics = 0.0
+    n = 0
+    for _ in range(games):
+        game = GameCore(headless=True)
+        for _ in range(drops):
+            if( game.is_gameover ):
+                break
+            kind = game.fruits.peek_next().kind
+            x = random.uniform( BOCAL_MARGIN_SIDE, game.bocal.width + BOCAL_MARGIN_SIDE )
+            xb = game.bocal.to_bocal( (x, 0) ).x
+
+            pile = DropResolver.from_game(game)
+            t = time.perf_counter()
+            resolver = pile.copy()
+            predicted = resolver.drop(kind, xb)
+            t_resolver += time.perf_counter() - t
+
+            score = game.score
+            fid = game.fruits.peek_next().id
+            t = time.perf_counter()
+            game.drop(x)
+            game.step_until_settled(SETTLE_STEPS)
+            t_physics += time.perf_counter() - t
+            actual = game.score - score
+
+            n += 1
+            merge_ok += (predicted > 0) == (actual > 0)
+            points_err.append( abs(predicted - actual) )
+            f = game.fruits._fruits.get(fid)
+            if( predicted == 0 and f is not None and f.in_play ):
+                (px, py) = game.bocal.to_bocal( f.position )
+                (rx, ry) = resolver.positions[-1]
+                errors.append( math.hypot(px - rx, py - ry) )
+    return {
+        'drops': n,
+        'position_error_median': float(np.median(errors)) if errors else math.nan,
+        'position_error_p90': float(np.percentile(errors, 90)) if errors else math.nan,
+        'merge_agreement': merge_ok / max(n, 1),
+        'points_error_mean': float(np.mean(points_err)) if points_err else math.nan,
+        'resolver_ms': 1000 * t_resolver / max(n, 1),
+        'physics_ms': 1000 * t_physics / max(n, 1),
+        'speedup': t_physics / max(t_resolver, 1e-9),
+    }
+
+
+if __name__ == '__main__':
+    for k, v in measure().items():
+        print( f"{k:24s} {v:.3f}" if isinstance(v, float) else f"{k:24s} {v}" )
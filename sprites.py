@@ -1,4 +1,11 @@
 import pyglet as pg
+
+# Headless games never open a window: don't let pyglet create its hidden
+# OpenGL context when pyglet.graphics is imported below (training boxes
+# have no display). Windows create their own context and the images are
+# only loaded once one exists.
+pg.options['shadow_window'] = False
+
 from constants import *
 import utils
 
@@ -100,6 +107,19 @@ class SuikaSprite ( pg.sprite.Sprite ):
             self._blink_start = None
 
 
+    @property
+    def animated(self):
+        """ True while a fade in/out or a blinking changes the sprite
+        """
+        return bool( self._fadein_start or self._fadeout_start or self._blink_start )
+
+    def reset_animations(self):
+        """ Stops fade in/out and blinking (sprite reused for another fruit)
+        """
+        self._blink_start = None
+        self._fadein_start = None
+        self._fadeout_start = None
+
     @property
     def visibility(self):
         return self._visibility
@@ -224,14 +244,22 @@ def _make_sequence():
 
 
 # global variable to avoid recreating the sequence with each explosion.
-_sequence_explosion = _make_sequence()
+# Built on first use: loading the image needs an OpenGL context, which
+# headless games never create.
+_sequence_explosion = None
+
+def sequence_explosion():
+    global _sequence_explosion
+    if( _sequence_explosion is None ):
+        _sequence_explosion = _make_sequence()
+    return _sequence_explosion
 
 class ExplosionSprite( SuikaSprite ):
     def __init__(self, r, on_explosion_end):
         # setup callback
         self._on_explosion_end = on_explosion_end
         # build actual sprite
-        super().__init__(img=_sequence_explosion,
+        super().__init__(img=sequence_explosion(),
                          batch = batch(),
                          group=sprite_group(SPRITE_GROUP_EXPLOSIONS))
 
@@ -242,4 +270,5 @@ class ExplosionSprite( SuikaSprite ):
     # Event sent by pyglet automatically
     def on_animation_end(self):
         # returns the event to the parent Fruit object
-        self._on_explosion_end()
\ No newline at end of file
+        if( self._on_explosion_end ):
+            self._on_explosion_end()
\ No newline at end of file
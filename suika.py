@@ -1,14 +1,14 @@
+import time
+
 import pyglet as pg
 import pymunk as pm
-import numpy as np
 
 from constants import *
-from bocal import Bocal
-from fruit import ActiveFruits
+from game import GameCore
+from profiler import get_profiler
+import benchmark
 import gui
-from collision import CollisionHelper
 import utils
-from preview import FruitQueue
 import sprites
 from suika_agent import SuikaAgent
 from welcome_screen import WelcomeScreen
@@ -134,11 +134,14 @@ class MouseState(object):
 class SuikaWindow(pg.window.Window):
     def __init__(self, width=WINDOW_WIDTH, height=WINDOW_HEIGHT):
         # Initialize all attributes before creating window
-        self._is_gameover = False
         self._is_paused = False
         self._autoplay_txt = ""
         self._is_mouse_shake = False
         self._is_benchmark_mode = False
+        self._benchmark = None
+        self._profiler = get_profiler()
+        self._is_profile_overlay = False
+        self._profile_refresh = 0.0     # wall time of the last overlay refresh
         self._dragged_fruit = None
         self.game_started = False
         
@@ -148,15 +151,15 @@ class SuikaWindow(pg.window.Window):
         # Create welcome screen
         self.welcome_screen = WelcomeScreen(width, height, self.start_game)
         
-        # Initialize game objects
-        self._space = pm.Space()
-        self._space.gravity = (0, GRAVITY)
-        self._bocal = Bocal(space=self._space, **utils.bocal_coords(window_w=width, window_h=height))
-        self._preview = FruitQueue(cnt=PREVIEW_COUNT)
-        self._fruits = ActiveFruits(space=self._space, width=width, height=height)
-        self._countdown = utils.CountDown()
+        # Initialize game objects, the window only renders the game core
+        self._game = GameCore(width=width, height=height, headless=False)
+        self._game.on_gameover = self._show_gameover
+        utils.set_clock(self._game.clock)    # animations follow the simulation time
+        self._space = self._game.space
+        self._bocal = self._game.bocal
+        self._preview = self._game.preview
+        self._fruits = self._game.fruits
         self._gui = gui.GUI(window_width=width, window_height=height)
-        self._collision_helper = CollisionHelper(self._space)
         self._autoplayer = Autoplayer()
         
         # AI agent setup
@@ -169,8 +172,14 @@ class SuikaWindow(pg.window.Window):
         self.episode = 0
         
         # Initialize display metrics
-        self.display_fps = utils.Speedmeter()
+        # frame intervals and physics step durations, exported every LATENCY_EXPORT_PERIOD
+        self.frame_times = utils.LatencyHistogram(deadline=FRAME_DEADLINE)
+        self.step_times = utils.LatencyHistogram(deadline=PYMUNK_INTERVAL)
+        self._latency_export = time.perf_counter()
+        self.display_fps = utils.Speedmeter(histogram=self.frame_times)
         self.pymunk_fps = utils.Speedmeter(bufsize=int(3/PYMUNK_INTERVAL))
+        self._stepper = utils.FixedStep()
+        self._unstepped = 0.0       # real time since the last physics step, for pymunk_fps
         
         # Initialize mouse handling
         self._mouse_state = MouseState(self)
@@ -179,7 +188,7 @@ class SuikaWindow(pg.window.Window):
         # Schedule updates
         pg.clock.schedule_interval(self.simulation_tick, interval=PYMUNK_INTERVAL)
         pg.clock.schedule_interval(self.autoplay_tick, interval=AUTOPLAY_INTERVAL_BASE)
-        pg.clock.schedule_interval(self.ai_tick, interval=0.5)
+        pg.clock.schedule_interval(self.ai_tick, interval=AI_POLL_INTERVAL)
         
         # Set window properties
         self.set_caption("Suika Game")
@@ -192,21 +201,17 @@ class SuikaWindow(pg.window.Window):
         self.reset_game()
 
     def reset_game(self):
-        self._is_gameover = False
+        if( self._is_benchmark_mode ):
+            self.toggle_benchmark_mode()
         self._is_paused = False
         self._autoplay_txt = ""
         self._is_mouse_shake = False
-        self._is_benchmark_mode = False
         self._dragged_fruit = None
-        self._bocal.reset()
-        self._preview.reset()
-        self._fruits.reset()
-        self._collision_helper.reset()
-        self._countdown.reset()
+        self._ai_drop_time = None
+        self._game.reset()
         self._gui.reset()
         self._autoplayer.reset()
         self._mouse_state.reset()
-        self.prepare_next()
 
     def start_game(self):
         """Called when user clicks start on welcome screen"""
@@ -220,56 +225,38 @@ class SuikaWindow(pg.window.Window):
         print("- T: Toggle training mode")
         print("- ESC: Quit game\n")
         
-        # Ensure the game is properly initialized
-        self._space.gravity = (0, GRAVITY)
-        self._bocal.reset()
-        self._preview.reset()
-        self._fruits.reset()
-        self._collision_helper.reset()
-        self._countdown.reset()
-        self._gui.reset()
-        self._autoplayer.reset()
-        self._mouse_state.reset()
-        self.prepare_next()
-        
         # Clear any existing welcome screen
         if hasattr(self, 'welcome_screen'):
             self.welcome_screen = None
 
     def toggle_benchmark_mode( self ):
-        pg.clock.unschedule( self.simulation_step )
+        """ Benchmark mode steps the physics as fast as possible, vsync off.
+        Leaving it prints the statistics and appends them to BENCHMARK_FILE.
+        """
         self._is_benchmark_mode = not self._is_benchmark_mode
         if( self._is_benchmark_mode ):
-            pg.clock.schedule( self.simulation_step )
+            pg.clock.unschedule( self.simulation_tick )
+            pg.clock.schedule( self.benchmark_tick )
+            self.set_vsync( False )
+            self._benchmark = benchmark.PhysicsStats( self._game )
+            self._benchmark.start()
         else:
-            pg.clock.schedule_interval( self.simulation_step, interval=PYMUNK_INTERVAL )
-
-    def prepare_next(self):
-        kind = self._preview.get_next_fruit()
-        self._fruits.prepare_next( kind=kind )
-
+            pg.clock.unschedule( self.benchmark_tick )
+            pg.clock.schedule_interval( self.simulation_tick, interval=PYMUNK_INTERVAL )
+            self.set_vsync( True )
+            self._stepper.reset()
+            results = self._benchmark.stop()
+            self._benchmark = None
+            benchmark.save_results( results )
+            print( benchmark.summary(results) )
 
     def drop(self, cursor_x, nb=1):
-        for _ in range(nb):
-            next = self._fruits.peek_next()
-            if( not next ):
-                return
-            margin=next.radius + WALL_THICKNESS/2 + 1
-
-            # position of the mouse or random if x = None 
-            if( cursor_x is None ):
-                pos = self._bocal.drop_point_random( margin=margin )
-            else:
-                pos = self._bocal.drop_point_cursor( cursor_x, margin=margin )
-
-            if( not pos ):            # pos==None if click is outside container
-                return
-            self._fruits.drop_next(pos)
-            self.prepare_next()
+        # position of the mouse or random if x = None 
+        self._game.drop(cursor_x, nb=nb)
 
 
     def autoplay_tick(self, dt):
-        if( self._is_paused or self._is_gameover ):
+        if( self._is_paused or self._game.is_gameover ):
             self._autoplay_txt = ""
             return
         msg = []
@@ -293,17 +280,21 @@ class SuikaWindow(pg.window.Window):
 
 
     def gameover(self):
-        """ Actions in case of game over
+        """ Forces the game over
+        """
+        self._game.gameover()
+
+
+    def _show_gameover(self):
+        """ Actions in case of game over, called back by the game core
         """
         print("GAMEOVER")
-        self._is_gameover = True    # inhibit game actions
         self._autofire_on = False
-        self._fruits.gameover()
         self._gui.show_gameover()
 
 
     def toggle_pause(self):
-        assert( not self._is_gameover )
+        assert( not self._game.is_gameover )
         self._is_paused = not self._is_paused
 
 
@@ -339,78 +330,132 @@ class SuikaWindow(pg.window.Window):
     def shoot_fruit(self, x, y):
         print(f"right click x={x} y={y}")
         f = self.find_fruit_at(x, y)
-        if( not self._is_gameover and f ):
+        if( not self._game.is_gameover and f ):
             f.explose()
 
 
-    def spawn_in_bocal(self, kind, bocal_coords):
-        position = self._bocal.to_world( bocal_coords )
-        self._fruits.spawn( kind, position )
-
-
     def simulation_tick(self, dt):
-        """Advance one physics step
-        called by window.on_draw()
+        """Advances the physics by the real time elapsed, in steps of PYMUNK_INTERVAL
+        (at most MAX_SUBSTEPS), called by the pyglet clock
         """
-        self.pymunk_fps.tick_rel(dt)
+        with self._profiler.span('simulation_tick'):
+            self._simulation_tick(dt)
+
+    def _simulation_tick(self, dt):
         if( self._is_paused ):
+            self._stepper.reset()
             return
 
-        # update bocal elements position
-        self._bocal.step(dt)
-        # update dragged fruit in DRAG_MODE
-        if( self._dragged_fruit ):
-            self._dragged_fruit.drag_to( self._mouse_state.position, dt)
-        # prepare collision handler
-        self._collision_helper.reset()
-        # execute 1 physics step
-        self._space.step( PYMUNK_INTERVAL )  
-
-        # modify fruits based on detected collisions
-        self._collision_helper.process( 
-            spawn_func=self.spawn_in_bocal, 
-            world_to_bocal_func=self._bocal.to_bocal )
-        # clean up
-        self._fruits.cleanup()
+        self._unstepped += dt
+        n = self._stepper.add(dt)
+        for i in range(n):
+            # update dragged fruit in DRAG_MODE
+            if( self._dragged_fruit ):
+                self._dragged_fruit.drag_to( self._mouse_state.position, PYMUNK_INTERVAL)
+            # on_draw() interpolates between the last two steps
+            if( i == n - 1 ):
+                self._fruits.keep_previous()
+            # execute 1 physics step, collisions and countdown
+            t = time.perf_counter()
+            self._game.step()
+            self.step_times.record( time.perf_counter() - t )
+            self.pymunk_fps.tick_rel( self._unstepped )
+            self._unstepped = 0.0
+
+
+    def benchmark_tick(self, dt):
+        """ Steps for BENCHMARK_FRAME seconds, then lets the window draw
+        """
+        if( self._is_paused ):
+            return
+        t = time.perf_counter()
+        deadline = t + BENCHMARK_FRAME
+        n = 0
+        while( t < deadline and not self._game.is_gameover ):
+            if( self._dragged_fruit ):
+                self._dragged_fruit.drag_to( self._mouse_state.position, PYMUNK_INTERVAL)
+            self._game.step()
+            end = time.perf_counter()
+            self.step_times.record( end - t )
+            t = end
+            n += 1
+        for _ in range(n):
+            self.pymunk_fps.tick_rel( dt / n )
+        self._benchmark.sample()
 
 
     def update(self):
-        # handle countdown in case of overflow
-        if( not self._bocal.is_tumbling):
-            ids = self._bocal.fruits_sur_maxline()
-            self._countdown.update( ids )
-
-        # update display and detect game end
-        countdown_val, countdown_txt = self._countdown.status()
-        if( countdown_val < 0 and not self._is_gameover ):
-            self.gameover()
+        # countdown in case of overflow is handled by the game core
+        countdown_txt = self._game.countdown_text()
 
         # order of conditions defines message priority
         game_status = ""
         if( True ):               game_status = self._autoplay_txt
         if( countdown_txt ):      game_status = countdown_txt
+        if( self._is_benchmark_mode ):  game_status = "BENCHMARK"
         if( self._is_paused ):    game_status = "PAUSE"
-        if( self._is_gameover ):  game_status = "GAME OVER"
+        if( self._game.is_gameover ):  game_status = "GAME OVER"
+
+        if( self._is_profile_overlay and time.perf_counter() - self._profile_refresh > PROFILE_REFRESH ):
+            self._profile_refresh = time.perf_counter()
+            self._gui.update_label( gui.PROFILE, self._profiler.report() + "\n" + self.latency_report() )
+
+        if( LATENCY_EXPORT_PERIOD and time.perf_counter() - self._latency_export > LATENCY_EXPORT_PERIOD ):
+            self.export_latency()
 
         # Update display with training stats if in training mode
         if self.training_mode:
             self._gui.update_dict({
-                gui.TOP_LEFT: f"Score: {self._fruits._score}",
+                gui.TOP_LEFT: f"Score: {self._game.score}",
                 gui.TOP_RIGHT: f"FPS {self.pymunk_fps.value:.0f} / {self.display_fps.value:.0f}",
                 gui.TOP_CENTER: f"Epsilon: {self.ai_agent.epsilon:.3f} | Best: {self.ai_agent.best_score} | Ep: {self.episode}"
             })
         else:
             self._gui.update_dict({
-                gui.TOP_LEFT: f"score {self._fruits._score}",
+                gui.TOP_LEFT: f"score {self._game.score}",
                 gui.TOP_RIGHT: f"FPS {self.pymunk_fps.value:.0f} / {self.display_fps.value:.0f}",
                 gui.TOP_CENTER: game_status
             })
 
 
+    def latency_report(self):
+        """ Lines of the overlay: percentiles of the frame intervals and
+        physics steps since the last export, and the deadlines missed
+        """
+        lines = []
+        for name, h in (("frame", self.frame_times), ("step", self.step_times)):
+            lines.append( f"{name:24s} " + " ".join( f"{1000 * v:6.2f}" for v in
+                          (*h.percentiles( (50, 95, 99) ), h.max) )
+                          + f"  {h.missed}/{h.count} late, jitter {1000 * h.jitter:.2f}" )
+        return "\n".join(lines)
+
+    def export_latency(self):
+        """ Appends a snapshot of the latency histograms to LATENCY_FILE
+        and starts new ones: each line covers one period
+        """
+        self._latency_export = time.perf_counter()
+        histograms = { 'frame': self.frame_times, 'step': self.step_times }
+        if( not any( h.count for h in histograms.values() ) ):
+            return
+        benchmark.export_latency( histograms )
+        for h in histograms.values():
+            h.reset()
+
     def end_application(self):
         # TODO : release resources more cleanly
+        if( self._is_benchmark_mode ):
+            self.toggle_benchmark_mode()    # saves the results
+        if( LATENCY_EXPORT_PERIOD ):
+            self.export_latency()
         self.close()
 
+    def on_close(self):
+        if( self._is_benchmark_mode ):
+            self.toggle_benchmark_mode()
+        if( LATENCY_EXPORT_PERIOD ):
+            self.export_latency()
+        super().on_close()
+
 
     def on_draw(self):
         self.clear()
@@ -418,13 +463,17 @@ class SuikaWindow(pg.window.Window):
             self.welcome_screen.draw()
         else:
             # Update game objects
-            self._fruits.update()
+            # benchmark mode: no interpolation, the last step is the latest state
+            with self._profiler.span('ActiveFruits.update'):
+                self._fruits.update( alpha=1.0 if self._is_benchmark_mode else self._stepper.alpha )
             self._preview.update()
             self._bocal.update()
-            self.update()
+            with self._profiler.span('SuikaWindow.update'):
+                self.update()
 
             # Draw game
-            sprites.batch().draw()
+            with self._profiler.span('batch.draw'):
+                sprites.batch().draw()
             self.display_fps.tick()
 
 
@@ -435,6 +484,10 @@ class SuikaWindow(pg.window.Window):
             self.toggle_ai()
         elif symbol == pg.window.key.T:            # 'T' for training mode
             self.toggle_training()
+        elif symbol == pg.window.key.O:            # O shows the profiler overlay
+            self.toggle_profile_overlay()
+        elif symbol == pg.window.key.D:            # D dumps the profiler spans as a Chrome trace
+            self.dump_trace()
         elif not self.ai_enabled:  # Only allow these controls when AI is disabled
             if symbol == pg.window.key.R:          # Reset game
                 self.reset_game()
@@ -469,7 +522,7 @@ class SuikaWindow(pg.window.Window):
             self.welcome_screen.on_button_click(x, y)
             return
 
-        if self._is_gameover:
+        if self._game.is_gameover:
             self.reset_game()
         elif (button & pg.window.mouse.LEFT):
             self.drop(x)
@@ -499,29 +552,29 @@ class SuikaWindow(pg.window.Window):
 
     def get_game_state(self):
         """Get current game state for AI"""
-        return self._fruits._fruits
+        return self.ai_agent.get_state(self._fruits.store, self._bocal)
 
     def get_reward(self):
         """Calculate reward based on game state"""
         reward = 0
         
         # Reward for score (increased weight)
-        reward += self._fruits._score * 0.5
+        reward += self._game.score * 0.5
         
         # Penalty for fruits above red line (increased penalty)
-        fruits_above = len(self._bocal.fruits_sur_maxline())
+        fruits_above = self._game.maxline_count
         reward -= fruits_above * 10
         
         # Big penalty for game over (increased penalty)
-        if self._is_gameover:
+        if self._game.is_gameover:
             reward -= 200
             
         # Reward for successful merges (new)
         if hasattr(self, '_last_score'):
-            score_diff = self._fruits._score - self._last_score
+            score_diff = self._game.score - self._last_score
             if score_diff > 0:
                 reward += score_diff * 2  # Extra reward for successful merges
-        self._last_score = self._fruits._score
+        self._last_score = self._game.score
             
         return reward
 
@@ -555,26 +608,38 @@ class SuikaWindow(pg.window.Window):
             print(f"Total Episodes: {self.episode}")
             print(f"Best Score: {self.ai_agent.best_score}")
             print(f"Current Exploration Rate: {self.ai_agent.epsilon:.3f}")
-            # Speed up the AI decision interval in training mode
-            pg.clock.unschedule(self.ai_tick)
-            pg.clock.schedule_interval(self.ai_tick, interval=0.1)
         else:
             print("\n=== Training Mode Disabled ===")
             print("AI is now playing normally")
-            # Restore normal AI decision interval
-            pg.clock.unschedule(self.ai_tick)
-            pg.clock.schedule_interval(self.ai_tick, interval=0.5)
+
+    def toggle_profile_overlay(self):
+        """ The overlay shows the percentiles of the profiler spans, which
+        are only recorded while it is shown
+        """
+        self._is_profile_overlay = not self._is_profile_overlay
+        self._profiler.enabled = self._is_profile_overlay
+        self._profile_refresh = 0.0
+        if( not self._is_profile_overlay ):
+            self._gui.update_label( gui.PROFILE, "" )
+
+    def dump_trace(self, path=PROFILE_TRACE_FILE):
+        n = self._profiler.dump_trace(path)
+        print( f"{n} profiler spans written to {path}" + ("" if n else " (O starts the profiler)") )
 
     def ai_tick(self, dt):
         """AI decision making loop"""
+        with self._profiler.span('ai_tick'):
+            self._ai_tick(dt)
+
+    def _ai_tick(self, dt):
         if not self.ai_enabled or self._is_paused:
             return
 
         # If game is over, handle based on mode
-        if self._is_gameover:
+        if self._game.is_gameover:
             if self.training_mode:
                 # Update training statistics
-                self.ai_agent.update_training_stats(self.episode, self._fruits._score, self.cumulative_reward)
+                self.ai_agent.update_training_stats(self.episode, self._game.score, self.cumulative_reward)
                 self.episode += 1
                 self.cumulative_reward = 0
                 # Reset game for next episode
@@ -583,6 +648,12 @@ class SuikaWindow(pg.window.Window):
                 # In normal AI mode, just reset the game
                 self.reset_game()
 
+        # wait for the previous drop to settle, the state is then meaningful
+        if( self._ai_drop_time is not None
+            and not self._game.is_settled()
+            and self._game.clock.time() - self._ai_drop_time < SETTLE_MAX_DELAY ):
+            return
+
         current_state = self.get_game_state()
         
         # Get reward for previous action
@@ -597,7 +668,7 @@ class SuikaWindow(pg.window.Window):
                     self.last_action,
                     reward,
                     current_state,
-                    self._is_gameover
+                    self._game.is_gameover
                 )
 
         # Get new action from agent
@@ -605,6 +676,7 @@ class SuikaWindow(pg.window.Window):
         
         # Execute action
         self.drop(action)
+        self._ai_drop_time = self._game.clock.time()
         
         # Save state and action
         self.last_state = current_state
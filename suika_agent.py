@@ -1,20 +1,24 @@
 import numpy as np
 import random
-from collections import defaultdict
 import pickle
+import copy
 import os
 from constants import WINDOW_WIDTH
+from qtable import QTable
+from encoder import ColumnEncoder
 
 class SuikaAgent:
-    def __init__(self, state_size=10, action_size=10, learning_rate=0.2, discount_factor=0.99, epsilon=1.0):
-        self.state_size = state_size  # Number of grid cells for discretization
+    def __init__(self, action_size=10, learning_rate=0.2, discount_factor=0.99, epsilon=1.0,
+                 encoder=None, seed=None):
         self.action_size = action_size  # Number of possible drop positions
+        self.encoder = encoder or ColumnEncoder()  # Bounded observation of the bocal
         self.lr = learning_rate
         self.gamma = discount_factor
         self.epsilon = epsilon  # Exploration rate
         self.epsilon_min = 0.01
         self.epsilon_decay = 0.997  # Slower decay for more exploration
-        self.q_table = defaultdict(lambda: np.zeros(action_size))
+        self._rng = random.Random(seed)  # exploration draws
+        self.q_table = QTable(action_size)
         self.model_file = "suika_agent.pkl"
         
         # Training statistics
@@ -29,54 +33,81 @@ class SuikaAgent:
         
         self.load_model()
 
-    def get_state(self, fruits):
-        """Convert game state to a discrete representation"""
-        # Create a grid representation of the game state
-        state = []
-        for fruit in fruits:
-            # Discretize x and y positions with finer granularity
-            x = int(fruit.position.x * self.state_size)
-            y = int(fruit.position.y * self.state_size)
-            kind = fruit.kind
-            # Add velocity information
-            velocity = int(fruit.scalar_velocity * 5)  # Scale velocity for discretization
-            state.append((x, y, kind, velocity))
-        return tuple(sorted(state))  # Sort to ensure same state gives same hash
+    def get_state(self, store, bocal):
+        """Convert game state to a discrete representation (encoder vector)
+        store: FruitStore of the fruits (ActiveFruits.store)"""
+        return self.encoder.encode(store, bocal)
 
     def get_action(self, state, available_width):
         """Choose action using epsilon-greedy policy"""
-        if random.random() < self.epsilon:
+        if self._rng.random() < self.epsilon:
             # Exploration: choose random action
-            return random.random() * available_width
+            return self._rng.random() * available_width
         else:
             # Exploitation: choose best action
-            discretized_state = self.discretize_state(state)
-            actions = self.q_table[discretized_state]
+            actions = self.q_table.get(self.state_key(state))
             return (np.argmax(actions) / self.action_size) * available_width
 
-    def discretize_state(self, state):
-        """Convert continuous state to discrete state for Q-table"""
-        if not state:
-            return (0,)
-        # Use more fruits to capture more context
-        top_n = 8  # Increased from 5 to 8
-        state_list = list(state)[:top_n]
-        return tuple(state_list)
+    def get_actions(self, states, available_width):
+        """Epsilon-greedy actions of a batch of states, with one bulk Q-table lookup"""
+        n = len(states)
+        q_values = self.q_table.lookup([self.state_key(s) for s in states])
+        actions = (np.argmax(q_values, axis=1) / self.action_size) * available_width
+        explore = np.array([self._rng.random() < self.epsilon for _ in range(n)], dtype=bool)
+        actions[explore] = [self._rng.random() * available_width for _ in range(explore.sum())]
+        return actions
+
+    def state_key(self, state):
+        """Fixed-width integer key of the encoded state, for the Q-table"""
+        return self.encoder.key(state)
+
+    def state_keys(self, states):
+        """state_key() of a batch of states, int64 array"""
+        return self.encoder.keys(states)
+
+    def action_indices(self, actions):
+        """Discretized drop positions of a batch of actions, int32 array"""
+        disc_actions = (np.asarray(actions) * self.action_size / WINDOW_WIDTH).astype(np.int32)
+        return np.minimum(disc_actions, self.action_size - 1)  # Ensure actions are within bounds
 
     def train(self, state, action, reward, next_state, done):
         """Update Q-values using Q-learning algorithm"""
-        disc_state = self.discretize_state(state)
-        disc_next_state = self.discretize_state(next_state)
+        key = self.state_key(state)
+        next_key = self.state_key(next_state)
         
         # Discretize action
         disc_action = int((action * self.action_size) / WINDOW_WIDTH)
         disc_action = min(disc_action, self.action_size - 1)  # Ensure action is within bounds
         
-        # Q-learning update
-        old_value = self.q_table[disc_state][disc_action]
-        next_max = np.max(self.q_table[disc_next_state])
+        # Q-learning update, nothing follows the last move of a game
+        old_value = self.q_table.get(key)[disc_action]
+        next_max = 0.0 if done else np.max(self.q_table.get(next_key))
         new_value = (1 - self.lr) * old_value + self.lr * (reward + self.gamma * next_max)
-        self.q_table[disc_state][disc_action] = new_value
+        self.q_table.set_value(key, disc_action, new_value)
+
+    def train_batch(self, keys, actions, rewards, next_keys, dones, weights=None):
+        """Q-learning update of a batch of transitions at once (ReplayBuffer.sample())
+        keys, next_keys: state keys, actions: action indices
+        weights: optional importance weights of the updates
+        Returns the TD errors, before the update"""
+        rows = np.arange(len(keys))
+        old_values = self.q_table.lookup(keys)[rows, actions]
+        next_max = self.q_table.lookup(next_keys).max(axis=1)
+        targets = rewards + self.gamma * next_max * ~np.asarray(dones, dtype=bool)
+        td_errors = targets - old_values
+        steps = self.lr * td_errors if weights is None else self.lr * weights * td_errors
+        self.q_table.add_to(keys, actions, steps)
+        return td_errors
+
+    def get_policy(self):
+        """Picklable copy of what get_action needs (sent to trainer workers).
+        A copy: mp.Queue pickles it later, in a thread, while training goes on"""
+        return {'q_table': copy.deepcopy(self.q_table), 'epsilon': self.epsilon}
+
+    def set_policy(self, policy):
+        """Replace the Q-table and exploration rate by a snapshot from get_policy()"""
+        self.q_table = policy['q_table']
+        self.epsilon = policy['epsilon']
 
     def update_training_stats(self, episode, score, cumulative_reward):
         """Update training statistics"""
@@ -110,7 +141,8 @@ class SuikaAgent:
     def save_model(self):
         """Save Q-table and training stats to file"""
         save_data = {
-            'q_table': dict(self.q_table),
+            'q_table': self.q_table,
+            'encoder': self.encoder,
             'episode_scores': self.episode_scores,
             'episode_rewards': self.episode_rewards,
             'best_score': self.best_score,
@@ -127,7 +159,11 @@ class SuikaAgent:
         if os.path.exists(self.model_file):
             with open(self.model_file, 'rb') as f:
                 save_data = pickle.load(f)
-                self.q_table = defaultdict(lambda: np.zeros(self.action_size), save_data['q_table'])
+                # Q-values are only meaningful for the encoder that produced their keys
+                if save_data.get('encoder') == self.encoder:
+                    self.q_table = save_data['q_table']
+                else:
+                    print(f"{self.model_file}: Q-table not made with {self.encoder}, starting from an empty one")
                 self.episode_scores = save_data.get('episode_scores', [])
                 self.episode_rewards = save_data.get('episode_rewards', [])
                 self.best_score = 0  # Reset best score to 0 each time
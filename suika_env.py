@@ -0,0 +1,164 @@
+import numpy as np
+
+from constants import *
+from game import GameCore
+
+
+# physics steps between two drops: at most SETTLE_MAX_DELAY when waiting for
+# the board to settle, as SuikaWindow.ai_tick, else a fixed 0.5 s
+SETTLE_STEPS = int(SETTLE_MAX_DELAY / PYMUNK_INTERVAL)
+ACTION_STEPS = int(0.5 / PYMUNK_INTERVAL)
+# fruits kept in an observation, highest first
+OBS_MAX_FRUITS = 64
+# per fruit: x and y relative to the bocal (0..1), kind (0 = empty slot)
+OBS_FEATURES = 3
+
+# reward shaping, same weights as SuikaWindow.get_reward()
+REWARD_SCORE = 0.5
+REWARD_MERGE = 2.0
+PENALTY_MAXLINE = 10.0
+PENALTY_GAMEOVER = 200.0
+
+
+def rewards(scores, last_scores, above, dones):
+    """ Vectorized reward of a batch of boards
+    scores, last_scores: score after/before the action
+    above: number of fruits on the maxline
+    dones: game over flags
+    """
+    gain = np.maximum(scores - last_scores, 0)
+    return ( REWARD_SCORE * scores
+            + REWARD_MERGE * gain
+            - PENALTY_MAXLINE * above
+            - PENALTY_GAMEOVER * dones )
+
+
+class VecSuikaEnv(object):
+    """ N independent headless boards stepped in lockstep.
+    step() takes one drop abscissa per board (window coordinates, as
+    SuikaAgent.get_action) and returns stacked numpy observations, rewards
+    and done flags. With settle=True each board is stepped until it is at
+    rest (at most SETTLE_MAX_DELAY), else for steps_per_action steps.
+    Finished boards are reset automatically: their returned observation
+    is the first one of the new game, and the final score is reported in
+    infos['final_score'].
+    Each game is played by a new GameCore, so that it can be replayed
+    bit-for-bit from its seed and drops.
+    profile: physics settings of the boards, see PHYSICS_PROFILES
+    recorder: optional replay.ReplayRecorder, records all the games
+    """
+    def __init__(self, n, steps_per_action=ACTION_STEPS, max_fruits=OBS_MAX_FRUITS,
+                 width=WINDOW_WIDTH, height=WINDOW_HEIGHT, settle=True, profile=PHYSICS_TRAINING_FAST,
+                 recorder=None):
+        assert n > 0, "at least one board"
+        self._profile = profile
+        self._recorder = recorder
+        self._games = [ GameCore(width=width, height=height, headless=True, profile=profile)
+                        for _ in range(n) ]
+        self._steps_per_action = steps_per_action
+        self._settle = settle
+        self._width = width
+        self._bocal_w = self._games[0].bocal.width
+        self._x_min = BOCAL_MARGIN_SIDE
+        self._x_max = width - BOCAL_MARGIN_SIDE
+        self._y_min = BOCAL_MARGIN_BOTTOM
+        self._bocal_h = height - BOCAL_MARGIN_TOP - BOCAL_MARGIN_BOTTOM
+
+        # buffers reused at each step
+        self._obs = np.zeros( (n, max_fruits, OBS_FEATURES), dtype=np.float32 )
+        self._scores = np.zeros( n, dtype=np.float64 )
+        self._last_scores = np.zeros( n, dtype=np.float64 )
+        self._above = np.zeros( n, dtype=np.float64 )
+        self._dones = np.zeros( n, dtype=bool )
+        self._next_kinds = np.zeros( n, dtype=np.int32 )
+
+    def __len__(self):
+        return len(self._games)
+
+    @property
+    def games(self):
+        return self._games
+
+    @property
+    def width(self):
+        """ range of the drop abscissas, as SuikaAgent available_width
+        """
+        return self._width
+
+    def _new_game(self, old):
+        """ GameCore replacing old for the next game """
+        old.close()
+        g = GameCore(*old.window_size, headless=True, profile=self._profile)
+        if( self._recorder ):
+            self._recorder.attach(g)
+        return g
+
+    def close(self):
+        """ Releases the boards (their games in progress are recorded)
+        """
+        for g in self._games:
+            g.close()
+        self._games = []
+
+    def reset(self):
+        self._games = [ self._new_game(g) for g in self._games ]
+        self._last_scores[:] = 0
+        return self._observe()
+
+    def step(self, xs):
+        """ Drops one fruit per board at abscissa xs[i] then advances the
+        physics until the boards settle (or of steps_per_action steps).
+        Returns (observations, rewards, dones, infos)
+        """
+        xs = np.clip( np.asarray(xs, dtype=np.float64), self._x_min, self._x_max )
+        assert len(xs) == len(self._games), "one drop position per board"
+
+        for g, x in zip(self._games, xs):
+            g.drop(x)
+            if( self._settle ):
+                g.step_until_settled(SETTLE_STEPS)
+            else:
+                g.step(self._steps_per_action)
+
+        for i, g in enumerate(self._games):
+            self._scores[i] = g.score
+            self._above[i] = g.maxline_count
+            self._dones[i] = g.is_gameover
+        r = rewards(self._scores, self._last_scores, self._above, self._dones)
+
+        dones = self._dones.copy()
+        final_scores = np.where(dones, self._scores, 0)
+        for i in np.flatnonzero(dones):
+            self._games[i] = self._new_game( self._games[i] )
+            self._scores[i] = 0
+        self._last_scores[:] = self._scores
+
+        infos = {
+            'score': self._scores.copy(),
+            'final_score': final_scores,
+        }
+        return self._observe(), r, dones, infos
+
+    def _observe(self):
+        """ Fills the observation buffer from the boards, returns a copy
+        """
+        self._obs.fill(0)
+        max_fruits = self._obs.shape[1]
+        for i, g in enumerate(self._games):
+            store = g.fruits.store
+            mask = store.in_play()
+            (x, y, kinds) = (store.x[mask], store.y[mask], store.kinds[mask])
+            # highest first
+            order = np.lexsort( (kinds, x, y) )[::-1][:max_fruits]
+            n = len(order)
+            self._obs[i, :n, 0] = (x[order] - self._x_min) / self._bocal_w
+            self._obs[i, :n, 1] = (y[order] - self._y_min) / self._bocal_h
+            self._obs[i, :n, 2] = kinds[order]
+            nxt = g.fruits.peek_next()
+            self._next_kinds[i] = nxt.kind if nxt else 0
+        return self._obs.copy()
+
+    def next_kinds(self):
+        """ kind of the fruit each board will drop next
+        """
+        return self._next_kinds.copy()
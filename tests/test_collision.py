@@ -0,0 +1,73 @@
+import itertools
+
+import pymunk as pm
+
+from constants import *
+from collision import CollisionHelper, DEFAULT_SLOTS, EVENT_EXPLODE, EVENT_MERGE
+import utils
+
+
+class FakeFruit(object):
+    _ids = itertools.count(1)
+
+    def __init__(self, kind, y):
+        self.id = next(FakeFruit._ids)
+        self.kind = kind
+        self.position = pm.Vec2d(100, y)
+
+
+class FakeArbiter(object):
+    def __init__(self, f0, f1):
+        self.shapes = ( pm.Circle(None, 1), pm.Circle(None, 1) )
+        (self.shapes[0].fruit, self.shapes[1].fruit) = (f0, f1)
+
+
+def _helper():
+    return CollisionHelper( pm.Space(), clock=utils.SimClock() )
+
+
+def _touch(helper, *pairs):
+    for (f0, f1) in pairs:
+        helper.collision_fruit( FakeArbiter(f0, f1) )
+
+
+def test_groups_merge_their_two_lowest_fruits():
+    h = _helper()
+    (a, b, c, d) = ( FakeFruit(1, y) for y in (50, 10, 30, 20) )
+    (e, f) = ( FakeFruit(2, y) for y in (5, 7) )
+    # a-b and c-d first seen apart, joined by b-c: a single group
+    _touch( h, (a, b), (e, f), (c, d), (b, c) )
+    assert h._merge_pairs() == [ (b, d), (e, f) ]
+
+
+def test_separate_groups_stay_apart_in_contact_order():
+    h = _helper()
+    fruits = [ FakeFruit(1, y) for y in (4, 3, 2, 1) ]
+    _touch( h, (fruits[2], fruits[3]), (fruits[0], fruits[1]) )
+    assert h._merge_pairs() == [ (fruits[3], fruits[2]), (fruits[1], fruits[0]) ]
+
+
+def test_repeated_contacts_and_growth():
+    h = _helper()
+    chain = [ FakeFruit(3, 1000 - i) for i in range(3 * DEFAULT_SLOTS) ]
+    _touch( h, *zip(chain, chain[1:]) )
+    _touch( h, (chain[0], chain[1]), (chain[-1], chain[0]) )
+    assert h._merge_pairs() == [ (chain[-1], chain[-2]) ]
+
+
+def test_process_schedules_one_spawn_per_group_and_resets():
+    h = _helper()
+    (a, b, c, d) = ( FakeFruit(1, y) for y in (1, 2, 3, 4) )
+    _touch( h, (a, b), (c, d) )
+    spawned = []
+    h._process_collisions( spawn_func=lambda **kw: spawned.append(kw),
+                           world_to_bocal_func=lambda p: (p.x, p.y) )
+    assert h.pending_merges == 2 and h.merges == 2
+    assert [ (e, f) for (e, f, _) in h._events ] == [ (EVENT_EXPLODE, a), (EVENT_MERGE, b),
+                                                      (EVENT_EXPLODE, c), (EVENT_MERGE, d) ]
+    h.reset()
+    assert h._merge_pairs() == [] and h._events == []
+    for _ in range( round(SPAWN_DELAY / PYMUNK_INTERVAL) ):
+        h._clock.advance()
+    assert spawned == [ {'kind': 2, 'bocal_coords': (100, 1)}, {'kind': 2, 'bocal_coords': (100, 3)} ]
+    assert h.pending_merges == 0
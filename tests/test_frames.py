@@ -0,0 +1,93 @@
+import random
+
+import numpy as np
+import pytest
+
+import frames
+import replay
+from test_replay import record_game
+
+
+def _sorted(kinds, x, y):
+    """ order of the fruits by kind and quantized position, ids differ between replays """
+    return np.lexsort( ( np.round(y * frames.POSITION_SCALE), np.round(x * frames.POSITION_SCALE), kinds ) )
+
+
+@pytest.fixture(scope='module')
+def baked(tmp_path_factory):
+    """ (frames path, fruits of each step simulated again from the log) """
+    tmp = tmp_path_factory.mktemp('frames')
+    (recorder, game) = record_game(tmp / 'game.skr', drops=30)
+    recorder.close()
+    game.close()
+    log = next( replay.read_games(tmp / 'game.skr') )
+    truth = []
+    def capture(g):
+        s = g.fruits.store
+        truth.append( (s.kinds.copy(), s.x.copy(), s.y.copy(), s.angle.copy(), g.score) )
+    replay.replay(log, on_step=capture).close()
+    path = tmp / 'game.frames'
+    frames.bake(log, path, keyframe_every=50).close()
+    return path, truth
+
+
+def _check(state, expected):
+    (kinds, x, y, angle, score) = expected
+    assert state.score == score and len(state) == len(kinds)
+    (o, p) = ( _sorted(kinds, x, y), _sorted(state.kinds, state.x, state.y) )
+    assert np.array_equal( kinds[o], state.kinds[p] )
+    half = 0.5 / frames.POSITION_SCALE + 1e-9
+    assert np.all( np.abs( x[o] - state.x[p] ) <= half )
+    assert np.all( np.abs( y[o] - state.y[p] ) <= half )
+    turn = ( angle[o] - state.angle[p] + np.pi ) % (2 * np.pi) - np.pi
+    assert np.all( np.abs(turn) < 1e-4 )
+
+
+def test_sequential_frames_match_the_simulation(baked):
+    (path, truth) = baked
+    f = frames.FrameFile(path)
+    assert len(f) == len(truth)
+    _check( f.seek(0), truth[0] )
+    for expected in truth[1:]:
+        _check( f.next(), expected )
+    assert f.next() is None
+    f.close()
+
+
+def test_random_seeks_match_the_simulation(baked):
+    (path, truth) = baked
+    f = frames.FrameFile(path)
+    r = random.Random(3)
+    for i in [ len(truth) - 1, 0, 49, 50, 51 ] + [ r.randrange(len(truth)) for _ in range(100) ]:
+        state = f.seek(i)
+        assert state.frame == i
+        _check( state, truth[i] )
+    assert f.seek( len(truth) + 10 ).frame == len(truth) - 1
+    f.close()
+
+
+def test_states_outlive_the_file(baked):
+    (path, truth) = baked
+    f = frames.FrameFile(path)
+    states = [ f.seek(10), f.seek(20), f.next(), f.seek( len(truth) - 1 ) ]
+    kept = [ (s.ids, s.kinds, s.q) for s in states ]
+    f.close()       # no BufferError while the states are referenced
+    assert len(kept[-1][0]) == len(truth[-1][0])
+    # each read returned its own state
+    for s, i in zip( states, [10, 20, 21, len(truth) - 1] ):
+        assert s.frame == i
+        _check( s, truth[i] )
+
+
+def test_failed_bake_leaves_no_frames_file(tmp_path):
+    import replay_viewer
+    path = tmp_path / 'game.skr'
+    (recorder, game) = record_game(path, drops=2 * replay.REPLAY_CHECKSUM_EVERY)
+    recorder.close()
+    game.close()
+    data = bytearray( path.read_bytes() )
+    data[-5] ^= 0xff        # final checksum: the replay fails at its end
+    path.write_bytes(data)
+    with pytest.raises(replay.ReplayMismatch):
+        replay_viewer.frames_for( str(path) )
+    assert sorted( p.name for p in tmp_path.iterdir() ) == ['game.skr']
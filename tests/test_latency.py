@@ -0,0 +1,49 @@
+import pytest
+
+from utils import LatencyHistogram, Speedmeter
+
+
+def test_percentiles_within_the_bucket_precision():
+    h = LatencyHistogram()
+    values = [ (i + 1) * 1e-4 for i in range(1000) ]     # 0.1 ms .. 100 ms
+    for v in reversed(values):
+        h.record(v)
+    assert h.count == 1000 and h.max == values[-1]
+    assert h.mean == pytest.approx( sum(values) / 1000 )
+    for q in (1, 50, 90, 99, 99.9):
+        assert h.percentile(q) == pytest.approx( values[ round(q * 10) - 1 ], rel=0.01 )
+    assert h.percentiles( (50, 100) ) == [ h.percentile(50), h.max ]
+
+
+def test_values_out_of_range_are_clamped():
+    h = LatencyHistogram(lowest=1e-3, highest=1.0)
+    h.record(1e-6)
+    h.record(50.0)
+    assert h.percentile(1) <= 1e-3 * 1.01
+    assert h.percentile(100) == 50.0
+
+
+def test_missed_deadlines_and_jitter():
+    h = LatencyHistogram(deadline=0.020)
+    for _ in range(100):
+        h.record(0.010)
+    assert h.missed == 0 and h.jitter == 0.0
+    for i in range(200):
+        h.record( 0.010 if i % 2 else 0.030 )
+    assert h.missed == 100
+    # RFC 3550: the smoothed mean deviation between consecutive values
+    assert h.jitter == pytest.approx( 0.020, rel=0.01 )
+    snap = h.snapshot()
+    assert snap['missed'] == 100 and snap['deadline_ms'] == pytest.approx(20)
+    assert snap['max_ms'] == pytest.approx(30)
+    h.reset()
+    assert h.count == 0 and h.missed == 0 and h.percentile(50) == 0.0
+
+
+def test_speedmeter_feeds_its_histogram():
+    h = LatencyHistogram()
+    meter = Speedmeter( bufsize=4, histogram=h )
+    for dt in (0.1, 0.2, 0.3, 0.4, 0.5):
+        meter.tick_rel(dt)
+    assert h.count == 5 and h.max == 0.5
+    assert meter.value == pytest.approx( 4 / 1.4 )
@@ -0,0 +1,55 @@
+import pickle
+
+import numpy as np
+
+from qtable import QTable
+
+
+def test_unknown_states_read_as_zeros():
+    q = QTable(4)
+    assert np.array_equal( q.get(123), np.zeros(4) )
+    assert np.array_equal( q.lookup([1, 2]), np.zeros((2, 4)) )
+    assert len(q) == 0 and 123 not in q
+
+
+def test_colliding_keys_are_probed():
+    q = QTable(3, capacity=8)
+    # keys landing in the same slot: linear probing must keep them apart
+    slots = q._slots_of( np.arange(1000, dtype=np.int64) )
+    keys = np.flatnonzero( slots == slots[0] )[:3]
+    assert len(keys) == 3
+    for i, key in enumerate(keys):
+        q.set_value( int(key), 1, i + 1.0 )
+    assert [ q.get(int(key))[1] for key in keys ] == [1.0, 2.0, 3.0]
+    assert np.array_equal( q.lookup(keys)[:, 1], [1.0, 2.0, 3.0] )
+
+
+def test_grows_and_keeps_values():
+    q = QTable(2, capacity=4)
+    keys = np.arange(-500, 500, dtype=np.int64) * 7919
+    q.update( keys, np.zeros(len(keys), dtype=np.int64), keys.astype(np.float32) )
+    assert len(q) == len(keys)
+    assert q.capacity >= 2 * len(keys)
+    assert np.array_equal( q.lookup(keys)[:, 0], keys.astype(np.float32) )
+    assert np.array_equal( q.rows(keys), np.arange(len(keys)) )
+
+
+def test_update_last_value_wins_add_to_averages():
+    q = QTable(2)
+    q.update( [5, 5], [0, 0], [1.0, 2.0] )
+    assert q.get(5)[0] == 2.0
+    q.add_to( [7, 7, 7, 8], [1, 1, 0, 1], [1.0, 3.0, 4.0, 0.5] )
+    assert np.array_equal( q.get(7), [4.0, 2.0] )
+    assert np.array_equal( q.get(8), [0.0, 0.5] )
+
+
+def test_pickle_round_trip():
+    q = QTable(3, capacity=16)
+    keys = np.array( [3, -1, 2**62, 42, 17], dtype=np.int64 )
+    q.update( keys, [0, 1, 2, 0, 1], [0.5, 1.5, 2.5, 3.5, 4.5] )
+    copy = pickle.loads( pickle.dumps(q) )
+    assert len(copy) == len(q) and copy.capacity == q.capacity
+    assert np.array_equal( copy.lookup(keys), q.lookup(keys) )
+    assert dict( (k, v.tolist()) for k, v in copy.items() ) == dict( (k, v.tolist()) for k, v in q.items() )
+    copy.set_value( 99, 2, 1.0 )
+    assert 99 in copy and 99 not in q
@@ -0,0 +1,99 @@
+import random
+
+import pytest
+
+from constants import *
+from game import GameCore
+import replay
+
+
+def record_game(path, seed=7, drops=25, drop_seed=1):
+    """ Plays and records a game in a new GameCore, some drops at a random x.
+    Returns the recorder and the game, not closed.
+    """
+    recorder = replay.ReplayRecorder(path)
+    game = GameCore(profile=PHYSICS_TRAINING_FAST, seed=seed)
+    recorder.attach(game)
+    r = random.Random(drop_seed)
+    for i in range(drops):
+        if( game.is_gameover ):
+            break
+        game.drop( None if i % 5 == 4 else r.uniform(100, 1400) )
+        game.step( r.randint(20, 90) )
+    return recorder, game
+
+
+@pytest.mark.parametrize( 'n', [0, 1, 127, 128, 300, 2**32 - 1, 2**63] )
+def test_varint_round_trip(n):
+    buf = bytearray()
+    replay._put(buf, n)
+    replay._put(buf, 5)
+    r = replay._Reader(buf)
+    assert r.varint() == n and r.varint() == 5 and r.pos == len(buf)
+
+
+@pytest.mark.parametrize( 'n', [0, 1, -1, 63, -64, 10**6, -10**6] )
+def test_zigzag_round_trip(n):
+    assert replay._zigzag(n) >= 0
+    assert replay._unzigzag( replay._zigzag(n) ) == n
+
+
+def test_games_replay_bit_for_bit(tmp_path):
+    path = tmp_path / 'games.skr'
+    recorders, games = zip( record_game(path, seed=3), record_game(path, seed=4, drop_seed=2) )
+    ends = [ (g.clock.step, g.score, replay.board_checksum(g)) for g in games ]
+    for rec in recorders:
+        rec.close()
+
+    logs = list( replay.read_games(path) )
+    assert [ log.seed for log in logs ] == [3, 4]
+    for log, g, (steps, score, checksum) in zip(logs, games, ends):
+        assert (log.steps, log.score, log.checksum) == (steps, score, checksum)
+        assert any( x is None for (_, x, _) in log.drops )
+        again = replay.replay(log)
+        assert (again.clock.step, again.score, replay.board_checksum(again)) == (steps, score, checksum)
+        again.close()
+        g.close()
+
+
+def test_changed_drop_is_detected(tmp_path):
+    path = tmp_path / 'game.skr'
+    (recorder, game) = record_game(path, drops=2 * REPLAY_CHECKSUM_EVERY)
+    recorder.close()
+    game.close()
+    log = next( replay.read_games(path) )
+    drops = list(log.drops)
+    (step, x, kind) = drops[3]
+    drops[3] = (step, x + 50 if x is not None else 700.0, kind)
+    with pytest.raises(replay.ReplayMismatch):
+        replay.replay( log._replace(drops=drops) )
+
+
+def test_game_without_drops_is_not_written(tmp_path):
+    path = tmp_path / 'empty.skr'
+    recorder = replay.ReplayRecorder(path)
+    game = GameCore(profile=PHYSICS_TRAINING_FAST, seed=1)
+    recorder.attach(game)
+    game.step(10)
+    recorder.close()
+    game.close()
+    assert list( replay.read_games(path) ) == []
+
+
+@pytest.mark.parametrize( 'seed', [-1, 2**32] )
+def test_seeds_the_logs_cannot_store_are_rejected(seed):
+    with pytest.raises(ValueError):
+        GameCore(profile=PHYSICS_TRAINING_FAST, seed=seed)
+
+
+def test_largest_seed_is_recorded_and_baked(tmp_path):
+    import frames
+    (recorder, game) = record_game(tmp_path / 'game.skr', seed=2**32 - 1, drops=3)
+    recorder.close()
+    game.close()
+    log = next( replay.read_games(tmp_path / 'game.skr') )
+    assert log.seed == 2**32 - 1
+    frames.bake(log, tmp_path / 'game.frames').close()
+    f = frames.FrameFile(tmp_path / 'game.frames')
+    assert f.seed == 2**32 - 1
+    f.close()
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from constants import WINDOW_WIDTH
+from replay_buffer import ReplayBuffer
+from suika_agent import SuikaAgent
+
+
+def _transitions(n, start=0):
+    keys = np.arange(start, start + n, dtype=np.int64)
+    return keys, keys % 10, keys.astype(np.float32), keys + 1000, keys % 7 == 0
+
+
+def test_ring_keeps_the_last_transitions():
+    buf = ReplayBuffer(10)
+    buf.add( *_transitions(25) )
+    assert len(buf) == 10
+    assert sorted( buf._keys ) == list( range(15, 25) )
+    buf.add( *_transitions(3, start=100) )
+    assert sorted( buf._keys ) == list( range(18, 25) ) + [100, 101, 102]
+
+
+def test_uniform_sample_returns_whole_transitions():
+    buf = ReplayBuffer(100, seed=1)
+    buf.add( *_transitions(50) )
+    (i, keys, actions, rewards, next_keys, dones, weights) = buf.sample(200)
+    assert weights is None and len(i) == 200
+    assert np.array_equal( keys, i ) and np.array_equal( next_keys, keys + 1000 )
+    assert np.array_equal( actions, keys % 10 ) and np.array_equal( dones, keys % 7 == 0 )
+
+
+def test_prioritized_sample_follows_the_td_errors():
+    buf = ReplayBuffer(100, prioritized=True, alpha=1.0, beta=1.0, seed=1)
+    buf.add( *_transitions(4) )
+    buf.update_priorities( np.arange(4), np.array([0.0, 0.0, 0.0, 30.0]) )
+    (i, *_, weights) = buf.sample(5000)
+    assert np.mean( i == 3 ) > 0.95
+    # the frequent transition gets the smallest importance weight
+    assert weights.max() == 1.0
+    assert np.all( weights[i == 3] < weights[i != 3].min() )
+
+
+def test_train_batch_matches_train(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)     # no saved model
+    (a, b) = ( SuikaAgent(seed=0), SuikaAgent(seed=0) )
+    rng = np.random.default_rng(0)
+    size = a.encoder.size
+    states = rng.integers(0, 3, (300, size))
+    next_states = rng.integers(0, 3, (300, size))
+    keys = a.state_keys(states)
+    assert [ a.state_key(s) for s in states[:10] ] == keys[:10].tolist()
+    # distinct states, none of them a next state: the order of the updates does not matter
+    rows = np.unique(keys, return_index=True)[1]
+    rows = rows[ ~np.isin( keys[rows], a.state_keys(next_states) ) ]
+    actions = rng.random(300) * WINDOW_WIDTH
+    rewards = rng.random(300).astype(np.float32)
+    dones = rng.random(300) < 0.2
+    for s in next_states:
+        a.q_table.set_value( a.state_key(s), 3, 1.0 )
+        b.q_table.set_value( b.state_key(s), 3, 1.0 )
+
+    for i in rows:
+        a.train( states[i], actions[i], rewards[i], next_states[i], dones[i] )
+    td = b.train_batch( keys[rows], b.action_indices(actions[rows]), rewards[rows],
+                        b.state_keys(next_states[rows]), dones[rows] )
+    expected = rewards[rows] + b.gamma * ~dones[rows]
+    assert td == pytest.approx( expected, rel=1e-6 )
+    for k in keys[rows]:
+        assert np.allclose( a.q_table.get(int(k)), b.q_table.get(int(k)) )
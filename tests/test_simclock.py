@@ -0,0 +1,61 @@
+from utils import SimClock
+
+
+class Owner(object):
+    def __init__(self, calls):
+        self.calls = calls
+
+    def tick(self, dt, name):
+        self.calls.append(name)
+
+
+def test_calls_run_when_due_in_scheduling_order():
+    clock = SimClock(interval=0.5)
+    calls = []
+    clock.schedule_once( lambda dt: calls.append(('b', dt)), 1.0 )
+    clock.schedule_once( lambda dt: calls.append(('a', dt)), 0.1 )    # rounded up to one step
+    clock.schedule_once( lambda dt: calls.append(('c', dt)), 1.0 )
+    clock.advance()
+    assert calls == [('a', 0.5)]
+    clock.advance()
+    assert calls == [('a', 0.5), ('b', 1.0), ('c', 1.0)]
+    assert clock.step == 2 and clock.time() == 1.0 and clock.pending == 0
+
+
+def test_cancel_and_unschedule():
+    clock = SimClock()
+    calls = []
+    (o1, o2) = ( Owner(calls), Owner(calls) )
+    event = clock.schedule_once( o1.tick, 0, 'cancelled' )
+    clock.schedule_once( o1.tick, 0, 'o1' )
+    clock.schedule_once( o2.tick, 0, 'o2' )
+    clock.schedule_once( o2.tick, 0, 'o2 again' )
+    f = lambda dt: calls.append('f')
+    clock.schedule_once( f, 0 )
+    clock.cancel(event)
+    clock.unschedule(f)
+    clock.advance()
+    assert calls == ['o1', 'o2', 'o2 again']
+
+    calls.clear()
+    for o, name in ( (o1, 'o1'), (o2, 'o2') ):
+        clock.schedule_once( o.tick, 0, name )
+    clock.unschedule_owners( {o1} )
+    clock.advance()
+    assert calls == ['o2']
+
+
+def test_snapshot_restore_keeps_the_schedule():
+    clock = SimClock()
+    calls = []
+    clock.schedule_once( lambda dt: calls.append(1), 0 )
+    clock.schedule_once( lambda dt: calls.append(2), 3 * clock._interval )
+    state = clock.snapshot()
+    for _ in range(3):
+        clock.advance()
+    assert calls == [1, 2]
+    clock.restore(state)
+    assert clock.step == 0 and clock.pending == 2
+    for _ in range(3):
+        clock.advance()
+    assert calls == [1, 2, 1, 2]
@@ -0,0 +1,72 @@
+import random
+
+import numpy as np
+
+from constants import *
+from game import GameCore
+
+
+def _board(game):
+    """ what a restore() must put back, the fruits in store order """
+    s = game.fruits.store
+    return ( game.clock.step, game.score, game.is_gameover, list(game.preview.kinds),
+             game.fruits.peek_next().kind, s.kinds.tolist(), s.modes.tolist(),
+             np.c_[s.x, s.y, s.angle, s.vx, s.vy].tolist() )
+
+
+def _play(game, xs):
+    """ kinds dropped and score after each drop """
+    played = []
+    for x in xs:
+        played.append( game.fruits.peek_next().kind )
+        game.drop(x)
+        game.step(40)
+    return played, game.score
+
+
+def test_restore_puts_the_board_back():
+    game = GameCore(profile=PHYSICS_TRAINING_FAST, seed=5)
+    r = random.Random(2)
+    _play( game, [ r.uniform(200, 1300) for _ in range(15) ] )
+    game.step(10)       # merges and spawns may be pending
+    before = _board(game)
+    snap = game.snapshot()
+
+    for _ in range(3):
+        _play( game, [ r.uniform(200, 1300) for _ in range(10) ] )
+        assert _board(game) != before
+        game.restore(snap)
+        assert _board(game) == before
+    game.close()
+
+
+def test_restored_board_draws_the_same_fruits():
+    game = GameCore(profile=PHYSICS_TRAINING_FAST, seed=9)
+    _play( game, [400, 800, 1100, 600] )
+    snap = game.snapshot()
+    xs = [300, 700, 1000, None, 500, None]      # None: random drops, from the game draws too
+    (first, _) = _play(game, xs)
+    game.restore(snap)
+    (again, _) = _play(game, xs)
+    assert again == first
+    game.restore(snap)
+    game.reseed(1234)
+    (other, _) = _play(game, xs)
+    assert other[:2] == first[:2]       # already in the preview
+    game.close()
+
+
+def test_snapshot_can_be_restored_after_a_game_over():
+    game = GameCore(profile=PHYSICS_TRAINING_FAST, seed=3)
+    snap = game.snapshot()
+    before = _board(game)
+    while not game.is_gameover:
+        game.drop(750)
+        game.step(30)
+    game.step(600)      # final explosions
+    game.restore(snap)
+    assert _board(game) == before and not game.is_gameover
+    game.drop(750)
+    game.step(100)
+    assert len(game.fruits) == 1
+    game.close()
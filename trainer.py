@@ -0,0 +1,181 @@
+""" Parallel self-play training of SuikaAgent, without any window.
+
+K worker processes play headless episodes, each with its own seed, and send
+batches of (state, action, reward, next_state, done) transitions to the
+learner (the main process). The learner keeps them in a replay buffer,
+updates the Q-table from batches sampled in it (replay_ratio updates per
+transition received, in one train_batch() call) and sends periodic policy
+snapshots back to the workers.
+
+    python trainer.py --workers 8 --episodes 500
+"""
+import argparse
+import multiprocessing as mp
+import queue
+import random
+import time
+
+import numpy as np
+
+from constants import *
+from suika_env import VecSuikaEnv
+from suika_agent import SuikaAgent
+from replay import ReplayRecorder
+from replay_buffer import ReplayBuffer
+
+
+DEFAULT_WORKERS = max(1, mp.cpu_count() - 1)    # one core left to the learner
+DEFAULT_BOARDS = 1           # boards stepped in lockstep by each worker
+DEFAULT_BATCH = 64           # transitions sent to the learner at once
+DEFAULT_SNAPSHOT = 2000      # transitions learned between two policy snapshots
+DEFAULT_SEED = 1
+DEFAULT_REPLAY_SIZE = 100_000   # transitions kept by the learner
+DEFAULT_REPLAY_RATIO = 8        # Q-learning updates per transition received
+
+
+def _worker(worker_id, seed, boards, batch_size, transitions, policies, stop, profile, record):
+    """ Plays episodes with the latest policy received from the learner
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    agent = SuikaAgent(seed=seed)
+    agent.set_policy(policies.get())         # wait for the initial policy
+
+    recorder = ReplayRecorder( f"{record}.{worker_id}" ) if record else None
+    env = VecSuikaEnv(boards, profile=profile, recorder=recorder)
+    env.reset()
+    states = [ agent.get_state(g.fruits.store, g.bocal) for g in env.games ]
+    cumulative = np.zeros(len(env))
+    batch = []
+    episodes = []
+
+    while not stop.is_set():
+        actions = agent.get_actions(states, env.width)
+        _, rewards, dones, infos = env.step(actions)
+        cumulative += rewards
+        next_states = [ agent.get_state(g.fruits.store, g.bocal) for g in env.games ]
+        for i in range(len(env)):
+            # next_state of a finished board is the first state of the new game,
+            # not used by the update since done=True ends the episode
+            batch.append( (states[i], float(actions[i]), float(rewards[i]), next_states[i], bool(dones[i])) )
+            if( dones[i] ):
+                episodes.append( (float(infos['final_score'][i]), float(cumulative[i])) )
+                cumulative[i] = 0
+        states = next_states
+
+        if( len(batch) >= batch_size ):
+            transitions.put( (worker_id, batch, episodes) )
+            batch = []
+            episodes = []
+            # switch to the most recent policy, if any
+            try:
+                while True:
+                    agent.set_policy(policies.get_nowait())
+            except queue.Empty:
+                pass
+    env.close()
+    if( recorder ):
+        recorder.close()
+
+
+def _send_policy(agent, policies):
+    """ Replaces the pending snapshot of each worker by the current policy
+    """
+    snapshot = agent.get_policy()
+    for q in policies:
+        try:
+            while True:
+                q.get_nowait()
+        except queue.Empty:
+            pass
+        q.put(snapshot)
+
+
+def train(workers=DEFAULT_WORKERS, episodes=100, boards=DEFAULT_BOARDS,
+          batch_size=DEFAULT_BATCH, snapshot_every=DEFAULT_SNAPSHOT, seed=DEFAULT_SEED,
+          profile=PHYSICS_TRAINING_FAST, record=None, replay_size=DEFAULT_REPLAY_SIZE,
+          replay_ratio=DEFAULT_REPLAY_RATIO, prioritized=False):
+    """ Runs the learner until `episodes` more games are finished (the saved
+    model may already count some), returns the agent
+    record: path prefix of the replay logs, the games of worker i are
+    appended to record.i (see replay.py)
+    replay_size, replay_ratio, prioritized: see ReplayBuffer
+    """
+    agent = SuikaAgent()
+    memory = ReplayBuffer(replay_size, prioritized=prioritized, seed=seed)
+    transitions = mp.Queue(maxsize=4 * workers)
+    policies = [ mp.Queue() for _ in range(workers) ]
+    stop = mp.Event()
+    procs = [ mp.Process(target=_worker,
+                         args=(i, seed + i, boards, batch_size, transitions, policies[i], stop, profile, record),
+                         daemon=True)
+              for i in range(workers) ]
+    _send_policy(agent, policies)
+    for p in procs:
+        p.start()
+
+    t0 = time.perf_counter()
+    target = agent.total_episodes + episodes
+    learned = 0
+    since_snapshot = 0
+    try:
+        while agent.total_episodes < target:
+            worker_id, batch, finished = transitions.get()
+            (states, actions, rewards, next_states, dones) = zip(*batch)
+            memory.add( agent.state_keys(states), agent.action_indices(actions), rewards,
+                        agent.state_keys(next_states), dones )
+            (indices, *sample) = memory.sample( replay_ratio * len(batch) )
+            memory.update_priorities( indices, agent.train_batch(*sample) )
+            learned += len(batch)
+            since_snapshot += len(batch)
+            for (score, cumulative_reward) in finished:
+                agent.update_training_stats(agent.total_episodes + 1, score, cumulative_reward)
+
+            if( since_snapshot >= snapshot_every ):
+                _send_policy(agent, policies)
+                since_snapshot = 0
+                elapsed = time.perf_counter() - t0
+                print(f"{learned} transitions, {learned/elapsed:.0f} transitions/sec, "
+                      f"{agent.total_episodes} episodes")
+    finally:
+        stop.set()
+        # unblock the workers waiting on a full queue
+        try:
+            while True:
+                transitions.get_nowait()
+        except queue.Empty:
+            pass
+        for p in procs:
+            p.join(timeout=5)
+            if( p.is_alive() ):
+                p.terminate()
+    agent.save_model()
+    return agent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel headless training of SuikaAgent")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="worker processes")
+    parser.add_argument("--episodes", type=int, default=100, help="games to play")
+    parser.add_argument("--boards", type=int, default=DEFAULT_BOARDS, help="boards per worker")
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH, help="transitions per message")
+    parser.add_argument("--snapshot", type=int, default=DEFAULT_SNAPSHOT,
+                        help="transitions between two policy snapshots")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="seed of the first worker")
+    parser.add_argument("--physics", choices=list(PHYSICS_PROFILES), default=PHYSICS_TRAINING_FAST,
+                        help="physics profile of the boards")
+    parser.add_argument("--record", metavar="PREFIX", help="appends the games of worker i to PREFIX.i")
+    parser.add_argument("--replay-size", type=int, default=DEFAULT_REPLAY_SIZE,
+                        help="transitions kept in the replay buffer")
+    parser.add_argument("--replay-ratio", type=int, default=DEFAULT_REPLAY_RATIO,
+                        help="updates per transition received")
+    parser.add_argument("--prioritized", action="store_true", help="prioritized replay (by TD error)")
+    args = parser.parse_args()
+    train(workers=args.workers, episodes=args.episodes, boards=args.boards,
+          batch_size=args.batch, snapshot_every=args.snapshot, seed=args.seed,
+          profile=args.physics, record=args.record, replay_size=args.replay_size,
+          replay_ratio=args.replay_ratio, prioritized=args.prioritized)
+
+
+if __name__ == '__main__':
+    main()
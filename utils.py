@@ -1,50 +1,285 @@
-import time, collections
+import time, collections, heapq, math
 import pyglet as pg
 from constants import *
 
+class SimClock(object):
+    """ Clock of a game: its time only advances with the physics simulation
+    (one PYMUNK_INTERVAL per step), so that a game can run faster than real
+    time and does not depend on the machine load.
+
+    Delayed calls wait in a min-heap keyed by the step they are due at, and
+    are run by advance(). Same interface as the pyglet clock for what the
+    game uses: time(), schedule_once(), unschedule().
+    """
+    def __init__(self, interval=PYMUNK_INTERVAL):
+        self._interval = interval
+        self._step = 0
+        self._seq = 0       # calls due at the same step run in scheduling order
+        self._heap = []     # [due step, seq, scheduling step, func, args, kwargs]
+
+    @property
+    def pending(self):
+        """ scheduled calls, cancelled ones included until they are due
+        """
+        return len(self._heap)
+
+    @property
+    def step(self):
+        return self._step
+
+    def time(self):
+        return self._step * self._interval
+
+    def schedule_once(self, func, delay, *args, **kwargs):
+        """ Calls func(dt, *args, **kwargs) after delay seconds, rounded to
+        whole steps (at least one). Returns the event, for cancel().
+        """
+        due = self._step + max( 1, round(delay / self._interval) )
+        event = [due, self._seq, self._step, func, args, kwargs]
+        self._seq += 1
+        heapq.heappush( self._heap, event )
+        return event
+
+    def cancel(self, event):
+        event[3] = None     # left in the heap, skipped when due
+
+    def unschedule(self, func):
+        """ Cancels the pending calls of func
+        """
+        for event in self._heap:
+            if( event[3] == func ):
+                event[3] = None
+
+    def unschedule_owners(self, owners):
+        """ Cancels the pending calls of the methods of these objects
+        """
+        for event in self._heap:
+            if( getattr(event[3], '__self__', None) in owners ):
+                event[3] = None
+
+    def advance(self):
+        """ Moves time forward of one step and runs the calls that became due
+        """
+        self._step += 1
+        heap = self._heap
+        while heap and heap[0][0] <= self._step:
+            (_, _, scheduled, func, args, kwargs) = heapq.heappop(heap)
+            if( func is not None ):
+                func( (self._step - scheduled) * self._interval, *args, **kwargs )
+
+    def clear(self):
+        """ Cancels all scheduled functions
+        """
+        self._heap = []
+
+    def snapshot(self):
+        """ Time and scheduled calls, as data (the heap order is kept)
+        """
+        return ( self._step, self._seq, [ tuple(event) for event in self._heap ] )
+
+    def restore(self, state):
+        """ Puts back the time and the schedule of snapshot(), nothing is called
+        """
+        (self._step, self._seq, events) = state
+        self._heap = [ list(event) for event in events ]
+
+
+# clock read by now(), pyglet wall clock unless a game installs its own
+_g_clock = None
+
+def get_clock():
+    if( _g_clock is None ):
+        return pg.clock.get_default()
+    return _g_clock
+
+def set_clock(clock):
+    global _g_clock
+    _g_clock = clock
+
 def now():
-    return pg.clock.get_default().time()
+    return get_clock().time()
+
+class FixedStep(object):
+    """ Fixed timestep accumulator: turns the real time between two frames
+    into a number of physics steps of `interval`, the remainder is kept for
+    the next frame. alpha is the part of a step left over, to interpolate
+    the display between the last two physics states.
+    At most max_steps per frame: when the machine cannot keep up, the late
+    time is dropped and the game slows down, instead of stepping more at
+    each frame and falling further behind (spiral of death).
+    """
+    def __init__(self, interval=PYMUNK_INTERVAL, max_steps=MAX_SUBSTEPS):
+        self._interval = interval
+        self._max_steps = max_steps
+        self._acc = 0.0
+        self.dropped = 0.0      # seconds of real time not simulated
+
+    @property
+    def alpha(self):
+        return self._acc / self._interval
+
+    def reset(self):
+        self._acc = 0.0
+
+    def add(self, dt):
+        """ Adds dt seconds, returns the number of steps to do
+        """
+        self._acc += dt
+        n = int( self._acc / self._interval )
+        if( n > self._max_steps ):
+            self.dropped += (n - self._max_steps) * self._interval
+            n = self._max_steps
+            self._acc %= self._interval
+        else:
+            self._acc -= n * self._interval
+        return n
+
 
 DEFAULT_BUFSIZE = 200
 SPEEDMETER_UPDATE_RATE = 0.2   #  seconds
 
+# range and relative precision of the LatencyHistogram buckets
+LATENCY_LOWEST = 1e-6          # seconds
+LATENCY_HIGHEST = 10.0         # seconds
+LATENCY_PRECISION = 0.01       # a bucket spans 1% of its value
+
+class LatencyHistogram(object):
+    """ Streaming histogram of durations, in buckets of logarithmic width
+    (same relative precision from microseconds to seconds, like HdrHistogram):
+    record() is O(1) and the memory fixed, percentiles are read from the
+    bucket counts. Also keeps the max, the jitter (RFC 3550 estimator: mean
+    deviation between consecutive durations, smoothed over ~16 of them)
+    and the number of durations above the deadline.
+    """
+    def __init__(self, deadline=None, lowest=LATENCY_LOWEST, highest=LATENCY_HIGHEST,
+                 precision=LATENCY_PRECISION):
+        self.deadline = deadline
+        self._lowest = lowest
+        self._log_base = math.log1p(precision)
+        self._nb_buckets = int( math.log(highest / lowest) / self._log_base ) + 1
+        self.reset()
+
+    def reset(self):
+        self._counts = [0] * self._nb_buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.jitter = 0.0
+        self.missed = 0
+        self._last = None
+
+    def record(self, d):
+        if( d > self._lowest ):
+            i = min( int( math.log(d / self._lowest) / self._log_base ), self._nb_buckets - 1 )
+        else:
+            i = 0
+        self._counts[i] += 1
+        self.count += 1
+        self.total += d
+        if( d > self.max ):
+            self.max = d
+        if( self._last is not None ):
+            self.jitter += ( abs(d - self._last) - self.jitter ) / 16
+        self._last = d
+        if( self.deadline is not None and d > self.deadline ):
+            self.missed += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """ duration below which q percent of the durations are, within the
+        precision of the buckets (never above max)
+        """
+        return self.percentiles( (q,) )[0]
+
+    def percentiles(self, qs):
+        """ percentile() of each of the increasing qs, in one pass over the buckets
+        """
+        if( not self.count ):
+            return [0.0] * len(qs)
+        ranks = [ max( 1, math.ceil( q / 100 * self.count ) ) for q in qs ]
+        values = []
+        seen = 0
+        for i, c in enumerate(self._counts):
+            seen += c
+            while( len(values) < len(ranks) and seen >= ranks[len(values)] ):
+                # geometric middle of the bucket, the last one has no upper bound
+                if( i == self._nb_buckets - 1 ):
+                    values.append( self.max )
+                else:
+                    values.append( min( self._lowest * math.exp( (i + 0.5) * self._log_base ), self.max ) )
+            if( len(values) == len(ranks) ):
+                break
+        return values
+
+    def snapshot(self):
+        """ JSON serializable summary, durations in milliseconds
+        """
+        (p50, p90, p99, p999) = self.percentiles( (50, 90, 99, 99.9) )
+        return {
+            'count': self.count,
+            'mean_ms': 1000 * self.mean,
+            'p50_ms': 1000 * p50,
+            'p90_ms': 1000 * p90,
+            'p99_ms': 1000 * p99,
+            'p999_ms': 1000 * p999,
+            'max_ms': 1000 * self.max,
+            'jitter_ms': 1000 * self.jitter,
+            'deadline_ms': None if self.deadline is None else 1000 * self.deadline,
+            'missed': self.missed,
+        }
+
+
 class Speedmeter(object):
-    def __init__(self, bufsize=DEFAULT_BUFSIZE ):
+    """ Rate of the ticks (value, per second) over the last bufsize ones.
+    histogram: optional LatencyHistogram, also fed with the durations
+    between ticks
+    """
+    def __init__(self, bufsize=DEFAULT_BUFSIZE, histogram=None):
         self._deltas = collections.deque( maxlen=bufsize )
+        self._sum = 0.0            # of the deltas, updated on each tick
         self._value = 0.0
         self._last_tick = None
-        self._last_refresh = 0
+        self._last_refresh = 0     # wall time: measures the real rates
+        self.histogram = histogram
 
     def tick_rel(self, dt):
+        if( len(self._deltas) == self._deltas.maxlen ):
+            self._sum -= self._deltas[0]
         self._deltas.append(dt)
+        self._sum += dt
+        if( self.histogram ):
+            self.histogram.record(dt)
 
     def tick(self):
         current = time.perf_counter()
         if( self._last_tick ):
-            last = self._last_tick
-            self._deltas.append( current-last )
+            self.tick_rel( current - self._last_tick )
         self._last_tick = current
 
     @property
     def value(self):
         if( len(self._deltas) == 0 ):
             return 0
-        if( now() - self._last_refresh >= SPEEDMETER_UPDATE_RATE ):
-            s = sum(self._deltas)
-            if( s>0 ):
-                self._value = len(self._deltas) / s
-                self._last_refresh = now()
+        current = time.perf_counter()
+        if( current - self._last_refresh >= SPEEDMETER_UPDATE_RATE ):
+            if( self._sum > 0 ):
+                self._value = len(self._deltas) / self._sum
+                self._last_refresh = current
         return self._value
 
 
 class CountDown(object):
-    def __init__(self):
+    def __init__(self, clock=None):
+        self._clock = clock or get_clock()
         self._start_time = None
 
     def update(self, deborde):
         if( deborde and not self._start_time ):
             #print( "countdown start")
-            self._start_time = now()  # does not reset if already in progress
+            self._start_time = self._clock.time()  # does not reset if already in progress
         elif( not deborde ):
             #if( self._start_time ):
             #    print( "countdown stop")
@@ -61,12 +296,18 @@ class CountDown(object):
         if (not self._start_time):
             return (0, "")
 
-        t = self._start_time + GAMEOVER_DELAY - now()
+        t = self._start_time + GAMEOVER_DELAY - self._clock.time()
         text = ""
         if( t <  COUNTDOWN_DISPLAY_LIMIT ):
             text = f"Defeat in {t:.01f}s"
         return (t, text)
 
+    def snapshot(self):
+        return self._start_time
+
+    def restore(self, state):
+        self._start_time = state
+
 
 # class RessourceCounter(object):
 #     """To check that all resources are released